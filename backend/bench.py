@@ -0,0 +1,401 @@
+"""
+Offline benchmark for the whole fact-check pipeline.
+
+Starts the stub LLM and stub MediaWiki servers in this process, points the backend
+at them and at a scratch cache directory, and drives the FastAPI app in-process
+(through httpx's ASGI transport, so request parsing and serialization are included):
+
+    sentence_pre     is_claim / extract_subject / triplets / fused preprocessing, per call
+    check_fact       a cold pass over the claim corpus, a pass with the Wikipedia
+                     cache warm, a pass answered by the verdict cache, then throughput
+                     at each concurrency level with the verdict cache off and every
+                     request a distinct claim, so none are coalesced
+    check_fact_with_pdf  the first upload of the PDF (parsed, chunked and embedded)
+                     and a repeat upload (reused from the document store)
+
+Every phase reports per-stage latency percentiles from the responses' timings,
+the change in the caches' counters, and the process's peak RSS. Results are JSON,
+so runs on different commits can be compared:
+
+    python bench.py run --out before.json
+    python bench.py run --out after.json --llm-latency 0.3 --wiki-latency 0.15
+    python bench.py compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from stub_llm import start_stub_llm
+from stub_wiki import start_stub_wiki
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dasgupta-Papadimitriou-Vazirani (1).pdf")
+
+# Claims about the stub's canned pages, claims that get generated pages, and non-claims
+DEFAULT_CLAIMS = [
+    "The Atlanta Falcons are a team in the NFL.",
+    "The Atlanta Falcons were founded in 1965.",
+    "The Falcons play their home games at Mercedes-Benz Stadium.",
+    "The Atlanta Falcons compete in the NFC South division.",
+    "Georgia Tech is a public research university in Atlanta.",
+    "The Georgia Institute of Technology was established in 1885.",
+    "Georgia Tech's campus occupies part of Midtown Atlanta.",
+    "Mount Everest is the highest mountain above sea level.",
+    "The Eiffel Tower is located in Paris.",
+    "Marie Curie won two Nobel Prizes.",
+    "Python was created by Guido van Rossum.",
+    "The Amazon River flows through Brazil.",
+    "What time does the game start?",
+    "I think we should meet tomorrow.",
+]
+
+# Claims about the bundled algorithms textbook
+DEFAULT_PDF_CLAIMS = [
+    "Dijkstra's algorithm finds shortest paths in graphs with nonnegative edge lengths.",
+    "Mergesort runs in O(n log n) time.",
+    "The Fast Fourier Transform multiplies polynomials in O(n log n) time.",
+]
+
+COMPARED_SUFFIXES = ("_ms", "requests_per_second", "_mib")
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summarize(values: List[float]) -> Dict:
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean_ms": round(float(np.mean(values)), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def _stage_summary(responses: List[Dict]) -> Dict:
+    """
+    Latency percentiles per pipeline stage, from the timings each response carries.
+    """
+    stages = {}
+    for response in responses:
+        for stage, ms in response.get("timings", {}).items():
+            stages.setdefault(stage, []).append(ms)
+    return {stage: _summarize(values) for stage, values in sorted(stages.items())}
+
+
+def _counter_delta(before, after):
+    """
+    after - before for every number in two /stats snapshots; other values as in after.
+    """
+    if isinstance(after, dict):
+        before = before if isinstance(before, dict) else {}
+        return {key: _counter_delta(before.get(key), value) for key, value in after.items()}
+    if isinstance(after, (int, float)) and not isinstance(after, bool) and isinstance(before, (int, float)):
+        return round(after - before, 3)
+    return after
+
+
+class Harness:
+    """
+    The app under test, driven through an in-process HTTP client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def stats(self) -> Dict:
+        return (await self.client.get("/stats")).json()
+
+    async def check_fact(self, sentence: str) -> Dict:
+        start = time.perf_counter()
+        response = await self.client.post("/check_fact", json={"sentence": sentence})
+        response.raise_for_status()
+        result = response.json()
+        result["client_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    async def check_fact_with_pdf(self, sentence: str, pdf_path: str) -> Dict:
+        start = time.perf_counter()
+        with open(pdf_path, "rb") as f:
+            response = await self.client.post(
+                "/check_fact_with_pdf",
+                data={"sentence": sentence},
+                files={"file": (os.path.basename(pdf_path), f, "application/pdf")},
+            )
+        response.raise_for_status()
+        result = response.json()
+        result["client_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    async def phase(self, name: str, calls, concurrency: int = 1) -> Dict:
+        """
+        Runs the coroutine factories in calls with at most concurrency in flight and
+        reports latency, throughput, stage timings and cache counter changes.
+        """
+        limit = asyncio.Semaphore(concurrency)
+
+        async def bounded(call):
+            async with limit:
+                return await call()
+
+        stats_before = await self.stats()
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(bounded(call) for call in calls))
+        elapsed = time.perf_counter() - start
+        stats_after = await self.stats()
+        print(f"{name}: {len(responses)} requests in {elapsed:.2f}s", file=sys.stderr)
+        return {
+            "phase": name,
+            "concurrency": concurrency,
+            "requests": len(responses),
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(responses) / elapsed, 2) if elapsed else None,
+            "latency": _summarize([r["client_ms"] for r in responses]),
+            "stages": _stage_summary(responses),
+            "tiers": _count(r.get("tier", "none") for r in responses),
+            "answers": _count(str(r.get("answer")) for r in responses),
+            "cache_hits": sum(bool(r.get("cached")) for r in responses),
+            # Answered by another request's run of the same claim, which inflates requests_per_second
+            "coalesced": sum(bool(r.get("coalesced")) for r in responses),
+            "stats_delta": _counter_delta(stats_before, stats_after),
+            "peak_rss_mib": _peak_rss_mib(),
+        }
+
+
+def _count(values) -> Dict[str, int]:
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+async def bench_sentence_pre(claims: List[str], k: int) -> Dict:
+    """
+    Times each preprocessing call on its own, one claim at a time.
+    """
+    from sentence_pre import (
+        extract_k_text_triplets_async,
+        extract_subject_async,
+        get_async_openai_client,
+        is_claim_async,
+        preprocess_fused_async,
+    )
+
+    client = get_async_openai_client()
+    calls = {
+        "is_claim": lambda s: is_claim_async(s, client),
+        "extract_subject": lambda s: extract_subject_async(s, client),
+        "extract_triplets": lambda s: extract_k_text_triplets_async(s, k, client),
+        "preprocess_fused": lambda s: preprocess_fused_async(s, k, client),
+    }
+    results = {}
+    for name, call in calls.items():
+        latencies = []
+        for sentence in claims:
+            start = time.perf_counter()
+            await call(sentence)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[name] = _summarize(latencies)
+    return results
+
+
+async def run_benchmark(args) -> Dict:
+    # Imported only now: the backend reads its configuration from the environment on import
+    import httpx
+    import fact_checker
+
+    claims = args.claims
+    harness_results = {}
+    transport = httpx.ASGITransport(app=fact_checker.app)
+    async with fact_checker.lifespan(fact_checker.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            harness = Harness(client)
+            harness_results["startup"] = {"peak_rss_mib": _peak_rss_mib(), "stats": await harness.stats()}
+
+            harness_results["sentence_pre"] = await bench_sentence_pre(claims, args.k)
+
+            # Caches start empty, so the first pass fetches, chunks and embeds every page
+            check_fact = [await harness.phase("cold", [lambda s=s: harness.check_fact(s) for s in claims])]
+            # Same claims with the verdict cache off: pages and embeddings come from the wiki cache
+            os.environ["VERDICT_CACHE"] = "0"
+            check_fact.append(await harness.phase("warm_pages", [lambda s=s: harness.check_fact(s) for s in claims]))
+            os.environ["VERDICT_CACHE"] = "1"
+            check_fact.append(await harness.phase("verdict_cache", [lambda s=s: harness.check_fact(s) for s in claims]))
+
+            # Throughput of the pipeline itself, so the verdict cache stays off
+            os.environ["VERDICT_CACHE"] = "0"
+            for concurrency in args.concurrency:
+                # Each request is a distinct claim, so single-flight can't answer several with one run
+                requests = [f"{claims[i % len(claims)].rstrip('.')} (request {i})."
+                            for i in range(max(args.requests, concurrency))]
+                check_fact.append(await harness.phase(
+                    f"throughput_{concurrency}", [lambda s=s: harness.check_fact(s) for s in requests], concurrency
+                ))
+            os.environ["VERDICT_CACHE"] = "1"
+            harness_results["check_fact"] = check_fact
+
+            if args.pdf:
+                pdf_claims = args.pdf_claims
+                harness_results["check_fact_with_pdf"] = [
+                    # The first upload parses and embeds the document; later ones reuse it
+                    await harness.phase("cold", [lambda: harness.check_fact_with_pdf(pdf_claims[0], args.pdf)]),
+                    await harness.phase("stored", [lambda s=s: harness.check_fact_with_pdf(s, args.pdf)
+                                                   for s in pdf_claims]),
+                ]
+
+            harness_results["final_stats"] = await harness.stats()
+    return harness_results
+
+
+def run(args) -> Dict:
+    llm = start_stub_llm(latency=args.llm_latency, jitter=args.jitter)
+    wiki = start_stub_wiki(latency=args.wiki_latency, jitter=args.jitter)
+    scratch = tempfile.mkdtemp(prefix="factcheck-bench-")
+    os.environ.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm.server_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "WIKIPEDIA_API_URL": f"http://127.0.0.1:{wiki.server_port}/w/api.php",
+        "WIKI_CACHE_DIR": os.path.join(scratch, "wikipedia"),
+        "DOC_STORE_DIR": os.path.join(scratch, "documents"),
+        "VERDICT_CACHE_PATH": os.path.join(scratch, "verdicts.sqlite"),
+        "PROPERTY_CACHE_PATH": os.path.join(scratch, "properties.sqlite"),
+        "VERDICT_CACHE": "1",
+        # Property lookups that miss the local table would otherwise go to wikidata.org
+        "WIKIDATA_PROPERTY_FALLBACK": "0",
+    })
+    if args.preprocess_mode:
+        os.environ["PREPROCESS_MODE"] = args.preprocess_mode
+
+    start = time.perf_counter()
+    results = asyncio.run(run_benchmark(args))
+    llm.shutdown()
+    wiki.shutdown()
+    return {
+        "commit": _git_commit(),
+        "created_at": time.time(),
+        "seconds": round(time.perf_counter() - start, 2),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {
+            "llm_latency": args.llm_latency,
+            "wiki_latency": args.wiki_latency,
+            "jitter": args.jitter,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "claims": len(args.claims),
+            "pdf": os.path.basename(args.pdf) if args.pdf else None,
+            "preprocess_mode": os.getenv("PREPROCESS_MODE", "separate"),
+            "scratch_dir": scratch,
+        },
+        **results,
+        "peak_rss_mib": _peak_rss_mib(),
+    }
+
+
+def _flatten(value, prefix="") -> Dict[str, float]:
+    """
+    Numeric leaves of a results file, keyed by path. Phases in lists are keyed by
+    their name, so reordering phases doesn't break comparisons.
+    """
+    flat = {}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            flat.update(_flatten(child, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, list):
+        for i, child in enumerate(value):
+            name = child.get("phase", i) if isinstance(child, dict) else i
+            flat.update(_flatten(child, f"{prefix}[{name}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = value
+    return flat
+
+
+def compare(before: Dict, after: Dict, threshold: float = 0.1) -> List[Dict]:
+    """
+    Latency, throughput and memory figures that moved by more than threshold
+    (a fraction) between two results files. Stats counters are left out.
+    """
+    old, new = _flatten(before), _flatten(after)
+    changes = []
+    for key in sorted(old.keys() & new.keys()):
+        if "stats" in key or not key.endswith(COMPARED_SUFFIXES):
+            continue
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        if abs(change) >= threshold:
+            # Higher throughput is better; for everything else lower is
+            better = change > 0 if key.endswith("requests_per_second") else change < 0
+            changes.append({"metric": key, "before": old[key], "after": new[key],
+                            "change": round(change, 3), "better": better})
+    return changes
+
+
+def _load_json_list(path: Optional[str], default: List[str]) -> List[str]:
+    if not path:
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark for the fact-check pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark against stub servers")
+    run_parser.add_argument("--out", help="write results JSON here instead of stdout")
+    run_parser.add_argument("--llm-latency", type=float, default=0.3, help="stub LLM seconds per completion")
+    run_parser.add_argument("--wiki-latency", type=float, default=0.15, help="stub Wikipedia seconds per request")
+    run_parser.add_argument("--jitter", type=float, default=0.0, help="extra random stub latency, in seconds")
+    run_parser.add_argument("--concurrency", default="1,4,16", help="comma-separated throughput levels")
+    run_parser.add_argument("--requests", type=int, default=64, help="requests per throughput level")
+    run_parser.add_argument("--k", type=int, default=5)
+    run_parser.add_argument("--claims", help="JSON file with a list of sentences to check")
+    run_parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF for check_fact_with_pdf; empty to skip")
+    run_parser.add_argument("--pdf-claims", help="JSON file with a list of sentences to check against the PDF")
+    run_parser.add_argument("--preprocess-mode", choices=["separate", "fused"])
+
+    compare_parser = commands.add_parser("compare", help="show metrics that changed between two results files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="smallest relative change to show")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.before, "r", encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.after, "r", encoding="utf-8") as f:
+            after = json.load(f)
+        print(json.dumps(compare(before, after, args.threshold), indent=2))
+    else:
+        args.concurrency = [int(c) for c in args.concurrency.split(",")]
+        args.claims = _load_json_list(args.claims, DEFAULT_CLAIMS)
+        args.pdf_claims = _load_json_list(args.pdf_claims, DEFAULT_PDF_CLAIMS)
+        results = run(args)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"Wrote {args.out}", file=sys.stderr)
+        else:
+            print(json.dumps(results, indent=2))
@@ -0,0 +1,257 @@
+"""
+Sentence-aware chunking that works in character offsets.
+
+iter_chunk_spans() walks a text once and yields (start, end) spans of whole
+sentences, packed up to a word budget, with a few trailing sentences repeated at the
+start of the next chunk. Only one sentence at a time is copied out of the text while
+chunking; a chunk's string is sliced out when it's needed (to embed it, or as LLM
+context), and the offsets locate snippets in the original article or document.
+
+Chunks and TextSpans hold spans into shared text buffers, so an index over an
+article keeps the article text once instead of once per overlapping chunk.
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Tuple, Union
+
+# Sentence ends (optionally closed by a quote or bracket) and blank lines
+SENTENCE_BOUNDARY = re.compile(r"([.!?][\"')\]]?)\s+|\n\s*\n\s*")
+WORD = re.compile(r"\S+")
+
+Span = Tuple[int, int]
+
+
+def _sentence_spans(text: str, max_words: int) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields (start, end, words) per sentence. Sentences longer than max_words are
+    cut at word boundaries.
+    """
+    start = 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        # The punctuation belongs to the sentence; the whitespace after it to neither
+        end = boundary.end(1) if boundary.group(1) else boundary.start()
+        yield from _word_windows(text, start, end, max_words)
+        start = boundary.end()
+    yield from _word_windows(text, start, len(text), max_words)
+
+
+def _word_windows(text: str, start: int, end: int, max_words: int) -> Iterator[Tuple[int, int, int]]:
+    sentence = text[start:end]
+    words = len(sentence.split())
+    if not words:
+        return
+    if words <= max_words:
+        stripped = sentence.lstrip()
+        first = start + len(sentence) - len(stripped)
+        yield first, first + len(stripped.rstrip()), words
+        return
+    matches = list(WORD.finditer(text, start, end))
+    for i in range(0, len(matches), max_words):
+        window = matches[i:i + max_words]
+        yield window[0].start(), window[-1].end(), len(window)
+
+
+def iter_chunk_spans(text: str, max_words: int = 300, overlap_words: int = 50) -> Iterator[Span]:
+    """
+    Yields (start, end) character spans of chunks of at most max_words words. Chunks
+    end on sentence boundaries, and each one starts with the last sentences of the
+    previous chunk, up to overlap_words words. Memory use is bounded by one chunk.
+    """
+    window = deque()  # (start, end, words) of the sentences in the current chunk
+    words = 0
+    for sentence in _sentence_spans(text, max_words):
+        if window and words + sentence[2] > max_words:
+            yield window[0][0], window[-1][1]
+            # Carry the tail of this chunk over as overlap, as long as the new sentence still fits
+            carried, carried_words = deque(), 0
+            for previous in reversed(window):
+                if carried_words + previous[2] > overlap_words:
+                    break
+                carried.appendleft(previous)
+                carried_words += previous[2]
+            window, words = carried, carried_words
+            while window and words + sentence[2] > max_words:
+                words -= window.popleft()[2]
+        window.append(sentence)
+        words += sentence[2]
+    if window:
+        yield window[0][0], window[-1][1]
+
+
+class StreamingChunker:
+    """
+    iter_chunk_spans() for text that arrives in pieces, such as PDF pages. Spans are
+    offsets into the concatenation of everything fed, and come out the same as
+    chunking the whole text at once. Only the last two chunks are re-chunked when a
+    piece arrives; the pieces are kept so chunks can be sliced out and the
+    whole text joined once at the end.
+    """
+
+    def __init__(self, max_words: int = 300, overlap_words: int = 50):
+        self.max_words = max_words
+        self.overlap_words = overlap_words
+        self._pieces: List[str] = []
+        self._piece_starts: List[int] = []
+        self._length = 0
+        self._pending = ""  # text from self._offset on, starting at the last finished chunk
+        self._offset = 0
+        self._skip = 0  # chunks at the start of self._pending that were already returned
+
+    def feed(self, piece: str) -> List[Span]:
+        """
+        Adds the next piece of text and returns the chunks it completed.
+        """
+        if not piece:
+            return []
+        self._pieces.append(piece)
+        self._piece_starts.append(self._length)
+        self._length += len(piece)
+
+        self._pending += piece
+        spans = list(iter_chunk_spans(self._pending, self.max_words, self.overlap_words))
+        finished = [(self._offset + start, self._offset + end) for start, end in spans[self._skip:-1]]
+        if not finished:
+            return []
+        # The last chunk may still grow, and how much overlap it starts with depends on
+        # its last sentence, which may be cut off. The chunk before it is settled, so
+        # chunking restarts there and skips it the next time.
+        cut = spans[-2][0]
+        self._pending = self._pending[cut:]
+        self._offset += cut
+        self._skip = 1
+        return finished
+
+    def close(self) -> List[Span]:
+        """
+        Returns the remaining chunks once all text has been fed.
+        """
+        spans = list(iter_chunk_spans(self._pending, self.max_words, self.overlap_words))
+        spans = [(self._offset + start, self._offset + end) for start, end in spans[self._skip:]]
+        self._offset += len(self._pending)
+        self._pending = ""
+        self._skip = 0
+        return spans
+
+    def slice(self, start: int, end: int) -> str:
+        """
+        text()[start:end], without joining the whole text.
+        """
+        first = bisect_right(self._piece_starts, start) - 1
+        parts = []
+        for i in range(max(first, 0), len(self._pieces)):
+            piece_start = self._piece_starts[i]
+            if piece_start >= end:
+                break
+            parts.append(self._pieces[i][max(start - piece_start, 0):end - piece_start])
+        return "".join(parts)
+
+    def text(self) -> str:
+        """
+        Everything fed so far, as one string.
+        """
+        if len(self._pieces) > 1:
+            self._pieces = ["".join(self._pieces)]
+            self._piece_starts = [0]
+        return self._pieces[0] if self._pieces else ""
+
+
+def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> List[str]:
+    """
+    The chunks of iter_chunk_spans() as strings, for callers that want plain text.
+    """
+    return [text[start:end] for start, end in iter_chunk_spans(text, chunk_size, overlap)]
+
+
+class TextSpans(Sequence):
+    """
+    The chunks of one text, as a sequence of strings sliced on access.
+    """
+
+    def __init__(self, text: str, spans: List[Span]):
+        self.text = text
+        self.spans = spans
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, row: int) -> str:
+        start, end = self.spans[row]
+        return self.text[start:end]
+
+
+class Chunks(Sequence):
+    """
+    The chunks of an index, as (text id, start, end) spans into one shared buffer per
+    article or document. Items are {"title", "text", "start", "end"} dicts, with start
+    and end offsets into the chunk's source text.
+    """
+
+    def __init__(self):
+        self.titles: List[str] = []
+        self.texts: List[str] = []
+        self._spans = array("q")  # text id, start, end; flattened
+
+    def add(self, title: str, chunks: TextSpans):
+        text_id = len(self.texts)
+        self.titles.append(title)
+        self.texts.append(chunks.text)
+        for start, end in chunks.spans:
+            self._spans.extend((text_id, start, end))
+
+    def __len__(self) -> int:
+        return len(self._spans) // 3
+
+    def _span(self, row: int) -> Tuple[int, int, int]:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self._spans[3 * row], self._spans[3 * row + 1], self._spans[3 * row + 2]
+
+    def __getitem__(self, row: int) -> Dict:
+        text_id, start, end = self._span(row)
+        return {"title": self.titles[text_id], "text": self.texts[text_id][start:end], "start": start, "end": end}
+
+    def text(self, row: int) -> str:
+        text_id, start, end = self._span(row)
+        return self.texts[text_id][start:end]
+
+    def chunk_texts(self) -> "ChunkTexts":
+        return ChunkTexts(self)
+
+    def to_json(self) -> Dict:
+        return {"titles": self.titles, "texts": self.texts, "spans": self._spans.tolist()}
+
+    @classmethod
+    def from_json(cls, data: Union[Dict, List[Dict]]) -> "Chunks":
+        """
+        Reads to_json() output, or the older list of {"title", "text"} chunk dicts.
+        """
+        chunks = cls()
+        if isinstance(data, list):
+            for document in data:
+                chunks.add(document["title"], TextSpans(document["text"], [(0, len(document["text"]))]))
+            return chunks
+        chunks.titles = data["titles"]
+        chunks.texts = data["texts"]
+        chunks._spans = array("q", data["spans"])
+        return chunks
+
+
+class ChunkTexts(Sequence):
+    """
+    The chunk strings of a Chunks, without the dicts around them.
+    """
+
+    def __init__(self, chunks: Chunks):
+        self.chunks = chunks
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def __getitem__(self, row: int) -> str:
+        return self.chunks.text(row)
@@ -0,0 +1,135 @@
+"""
+Shared fixtures: the check pipeline wired to the stub LLM and stub MediaWiki servers,
+as bench.py sets it up, with its caches in a scratch directory. Embeddings come from
+a hashing stand-in for the sentence-transformers model, so no model is downloaded.
+"""
+
+import asyncio
+import re
+import zlib
+
+import httpx
+import numpy as np
+import pytest
+
+import doc_sessions
+import doc_store
+import embedder
+import entity_index
+import fact_checker
+import kg_verifier
+import property_index
+import sentence_pre
+import stub_llm
+import stub_wiki
+import triple_store
+import verdict_cache
+import wiki_cache
+import wiki_fetch
+
+# Process-wide instances that read their configuration from the environment on first use
+SINGLETONS = (
+    (sentence_pre, "_async_client"), (wiki_fetch, "_wikipedia_client"), (wiki_cache, "_wiki_cache"),
+    (doc_store, "_doc_store"), (doc_sessions, "_doc_sessions"), (verdict_cache, "_verdict_cache"),
+    (entity_index, "_entity_index"), (triple_store, "_triple_store"),
+    (property_index, "_property_resolver"), (kg_verifier, "_kg_verifier"),
+)
+
+
+class HashingModel:
+    """
+    Stands in for the SentenceTransformer: hashed bag-of-words vectors, so retrieval
+    prefers chunks that share words with the query.
+    """
+
+    dimension = 256
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode("utf-8")) % self.dimension] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@pytest.fixture(scope="module")
+def pipeline(tmp_path_factory):
+    """
+    Points the backend at freshly started stub servers. The Wikidata tier is
+    unavailable (there is no entity index) and the verdict cache is off.
+    """
+    llm = stub_llm.start_stub_llm()
+    wiki = stub_wiki.start_stub_wiki()
+    scratch = tmp_path_factory.mktemp("pipeline")
+    patch = pytest.MonkeyPatch()
+    for name, value in {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm.server_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "WIKIPEDIA_API_URL": f"http://127.0.0.1:{wiki.server_port}/w/api.php",
+        "WIKI_CACHE_DIR": str(scratch / "wikipedia"),
+        "DOC_STORE_DIR": str(scratch / "documents"),
+        "DOC_SESSIONS_PATH": str(scratch / "sessions.sqlite"),
+        "VERDICT_CACHE_PATH": str(scratch / "verdicts.sqlite"),
+        "PROPERTY_CACHE_PATH": str(scratch / "properties.sqlite"),
+        "ENTITY_INDEX_DIR": str(scratch / "entity_index"),
+        "TRIPLE_STORE_DIR": str(scratch / "triple_store"),
+        "WIKIDATA_PROPERTY_FALLBACK": "0",
+        "VERDICT_CACHE": "0",
+    }.items():
+        patch.setenv(name, value)
+    # A failed call should fail the test's request, not be retried with backoff
+    patch.setattr(sentence_pre, "LLM_MAX_RETRIES", 0)
+    for module, name in SINGLETONS:
+        patch.setattr(module, name, None)
+    service = embedder.EmbeddingService(model_name="hashing-test", max_wait_ms=0)
+    service._model = HashingModel()
+    patch.setattr(embedder, "_embedder", service)
+    yield
+    patch.undo()
+    llm.shutdown()
+    wiki.shutdown()
+
+
+@pytest.fixture
+def post(pipeline):
+    """
+    post(path, json) sends one request to the app on a fresh event loop and returns
+    the httpx response, with a streamed body read in full.
+    """
+    def post(path, payload):
+        async def main():
+            transport = httpx.ASGITransport(app=fact_checker.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                try:
+                    return await client.post(path, json=payload)
+                finally:
+                    # The OpenAI client's connections belong to this event loop
+                    if sentence_pre._async_client is not None:
+                        await sentence_pre._async_client.close()
+                        sentence_pre._async_client = None
+
+        return asyncio.run(main())
+
+    return post
+
+
+@pytest.fixture
+def fail_llm(monkeypatch):
+    """
+    fail_llm(predicate) makes the stub LLM answer 500 to every call whose prompt
+    (all message contents joined) predicate accepts.
+    """
+    def install(predicate):
+        respond = stub_llm.respond
+
+        def patched(messages):
+            if predicate(" ".join(m["content"] for m in messages)):
+                raise stub_llm.StubFailure(500)
+            return respond(messages)
+
+        monkeypatch.setattr(stub_llm, "respond", patched)
+
+    return install
@@ -0,0 +1,258 @@
+"""
+Document sessions: the server remembers the sentences of a document the client is
+editing, with the verdict (sources and snippet included) each one got, so an update
+only re-checks the sentences that are new or were edited.
+
+Sentences are matched by the SHA-256 of their normalized text rather than by
+position, so inserting a paragraph at the top doesn't count everything below it as
+changed. Sessions live in SQLite, like the verdict cache, so every worker process
+sees the same state; each update bumps the session's version, and an update whose
+diff was computed against an older version is rejected rather than merged.
+
+Usage:
+    sessions = get_doc_sessions()
+    session_id = sessions.create()
+    diff = sessions.diff(session_id, sentences)
+    version = sessions.commit(session_id, diff, sentences, checked_results)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from verdict_cache import PER_REQUEST_FIELDS, normalize_sentence
+
+# --- Configuration ---
+load_dotenv()
+
+
+class SessionConflict(Exception):
+    """
+    The session was updated by another request after the diff was computed.
+    """
+
+
+def sentence_hash(sentence: str) -> str:
+    return hashlib.sha256(normalize_sentence(sentence).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SessionDiff:
+    version: int
+    # (previous position, new position) of sentences whose text is unchanged
+    unchanged: List[Tuple[int, int]] = field(default_factory=list)
+    # Previous positions with no counterpart in the new text
+    removed: List[int] = field(default_factory=list)
+    # New positions that need a verdict
+    changed: List[int] = field(default_factory=list)
+    # Stored verdicts of unchanged sentences, by new position
+    kept: Dict[int, Dict] = field(default_factory=dict)
+
+
+class DocumentSessions:
+    def __init__(self, path: str, ttl_seconds: float = 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.counters = {"created": 0, "updates": 0, "checked": 0, "reused": 0, "removed": 0,
+                         "conflicts": 0, "expired": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS session_sentences (
+                session_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                sentence TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (session_id, position)
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    @classmethod
+    def from_env(cls) -> "DocumentSessions":
+        return cls(
+            path=os.getenv("DOC_SESSIONS_PATH", "cache/sessions.sqlite"),
+            ttl_seconds=float(os.getenv("DOC_SESSIONS_TTL", 24 * 3600)),
+        )
+
+    # The connection is shared by worker threads, so every query runs under self._lock
+
+    def _expire(self):
+        stale = [session_id for (session_id,) in self._db.execute(
+            "SELECT id FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))]
+        for session_id in stale:
+            self._delete(session_id)
+        self.counters["expired"] += len(stale)
+
+    def _delete(self, session_id: str) -> bool:
+        self._db.execute("DELETE FROM session_sentences WHERE session_id = ?", (session_id,))
+        return self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def _version(self, session_id: str) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT version, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_seconds:
+            self._delete(session_id)
+            self.counters["expired"] += 1
+            return None
+        return row[0]
+
+    def create(self) -> str:
+        """
+        Starts an empty session (version 0) and returns its id. Sessions untouched for
+        longer than the TTL are dropped here.
+        """
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._expire()
+            self._db.execute("INSERT INTO sessions (id, version, created_at, updated_at) VALUES (?, 0, ?, ?)",
+                             (session_id, now, now))
+            self.counters["created"] += 1
+        return session_id
+
+    def diff(self, session_id: str, sentences: List[str]) -> Optional[SessionDiff]:
+        """
+        Compares sentences with the session's current text. Returns None for an unknown
+        or expired session. A sentence that appears several times is paired with its
+        previous occurrences in order; sentences whose last check failed count as changed.
+        """
+        with self._lock:
+            version = self._version(session_id)
+            if version is None:
+                return None
+            previous = self._db.execute(
+                "SELECT position, hash, result FROM session_sentences WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+
+        by_hash: Dict[str, List[Tuple[int, str]]] = {}
+        for position, digest, result in previous:
+            by_hash.setdefault(digest, []).append((position, result))
+        for occurrences in by_hash.values():
+            occurrences.reverse()
+
+        diff = SessionDiff(version=version)
+        for i, sentence in enumerate(sentences):
+            occurrences = by_hash.get(sentence_hash(sentence))
+            kept = json.loads(occurrences[-1][1]) if occurrences else None
+            # A check that failed (an LLM outage) is retried, and its old entry reported as removed
+            if kept is not None and not kept.get("failed"):
+                position, _ = occurrences.pop()
+                diff.unchanged.append((position, i))
+                diff.kept[i] = kept
+            else:
+                diff.changed.append(i)
+        diff.removed = sorted(position for occurrences in by_hash.values() for position, _ in occurrences)
+        return diff
+
+    def commit(self, session_id: str, diff: SessionDiff, sentences: List[str], results: List[Dict]) -> int:
+        """
+        Stores the new text, with results holding the verdicts for diff.changed in the
+        same order, and returns the session's new version. Raises SessionConflict if
+        the session moved past diff.version (or was deleted) in the meantime.
+        """
+        checked = dict(zip(diff.changed, results))
+        rows = []
+        for i, sentence in enumerate(sentences):
+            result = checked[i] if i in checked else diff.kept[i]
+            verdict = {k: v for k, v in result.items() if k not in PER_REQUEST_FIELDS}
+            rows.append((session_id, i, sentence_hash(sentence), sentence, json.dumps(verdict)))
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have committed since the diff was read
+                updated = self._db.execute(
+                    "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+                    (time.time(), session_id, diff.version),
+                ).rowcount
+                if not updated:
+                    self.counters["conflicts"] += 1
+                    raise SessionConflict(session_id)
+                self._db.execute("DELETE FROM session_sentences WHERE session_id = ?", (session_id,))
+                self._db.executemany(
+                    "INSERT INTO session_sentences (session_id, position, hash, sentence, result) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.counters["updates"] += 1
+            self.counters["checked"] += len(diff.changed)
+            self.counters["reused"] += len(diff.unchanged)
+            self.counters["removed"] += len(diff.removed)
+        return diff.version + 1
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        The session's current sentences and verdicts, or None if it is unknown.
+        """
+        with self._lock:
+            version = self._version(session_id)
+            if version is None:
+                return None
+            rows = self._db.execute(
+                "SELECT sentence, result FROM session_sentences WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        return {
+            "session_id": session_id,
+            "version": version,
+            "results": [{"index": i, "sentence": sentence, "result": json.loads(result)}
+                        for i, (sentence, result) in enumerate(rows)],
+        }
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._delete(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (sessions,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (sentences,) = self._db.execute("SELECT COUNT(*) FROM session_sentences").fetchone()
+            reused, checked = self.counters["reused"], self.counters["checked"]
+            return {
+                **self.counters,
+                "sessions": sessions,
+                "sentences": sentences,
+                "reuse_ratio": round(reused / (reused + checked), 3) if reused + checked else None,
+            }
+
+
+_doc_sessions = None
+_doc_sessions_lock = threading.Lock()
+
+
+def get_doc_sessions() -> DocumentSessions:
+    """
+    Returns the process-wide DocumentSessions.
+    """
+    global _doc_sessions
+    if _doc_sessions is None:
+        with _doc_sessions_lock:
+            if _doc_sessions is None:
+                _doc_sessions = DocumentSessions.from_env()
+    return _doc_sessions
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from embedder import EmbeddingService, get_embedder
+from index_factory import IndexSpec
+from pdf_extract import PdfExtractor, count_pages, get_pdf_extractor
+from retrieval import RetrievalSpec
+from singleflight import SingleFlight
+from wiki_llm import FaissIndex
+
+# --- Configuration ---
+load_dotenv()
+
+DOCUMENT_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+# progress(stage, done, total), e.g. ("pages", 12, 300) or ("chunks", 256, 1400)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class DocumentStore:
+    """
+    Uploaded documents keyed by the SHA-256 of their bytes. Each document is parsed,
+    chunked and embedded exactly once; its FAISS index and chunks are persisted under
+    <store_dir>/<document id>/ and later checks only need to embed the query.
+    Large documents can use an approximate index type via index_spec (FAISS_INDEX_TYPE),
+    or skip embedding at ingest with lexical retrieval (DOCUMENT_RETRIEVAL=lexical).
+    Pages are extracted by a process pool and chunked and embedded as they arrive.
+    A document stored under another embedding model or backend is re-embedded when
+    it is next loaded, since its vectors aren't comparable with this model's queries.
+    """
+
+    def __init__(self, store_dir: str, embedder: EmbeddingService, max_loaded: int = 8,
+                 index_spec: Optional[IndexSpec] = None, retrieval: Optional[RetrievalSpec] = None,
+                 pdf_extractor: Optional[PdfExtractor] = None):
+        self.store_dir = store_dir
+        self.embedder = embedder
+        self.pdf_extractor = pdf_extractor or PdfExtractor(max_workers=0)
+        self.index_spec = index_spec or IndexSpec()
+        self.retrieval = retrieval or RetrievalSpec()
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        self._loaded: "OrderedDict[str, FaissIndex]" = OrderedDict()
+        self.counters = {"ingested": 0, "reused": 0, "loads": 0, "reembedded": 0}
+        # Concurrent uploads of the same bytes wait for one parse instead of racing to the rename
+        self._ingests = SingleFlight("document_ingest")
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, embedder: EmbeddingService) -> "DocumentStore":
+        return cls(
+            store_dir=os.getenv("DOC_STORE_DIR", "cache/documents"),
+            embedder=embedder,
+            max_loaded=int(os.getenv("DOC_STORE_MAX_LOADED", 8)),
+            index_spec=IndexSpec.from_env(),
+            retrieval=RetrievalSpec.from_env("document"),
+            pdf_extractor=get_pdf_extractor(),
+        )
+
+    def _doc_dir(self, document_id: str) -> str:
+        return os.path.join(self.store_dir, document_id)
+
+    def exists(self, document_id: str) -> bool:
+        return bool(DOCUMENT_ID_RE.match(document_id)) and os.path.exists(
+            os.path.join(self._doc_dir(document_id), "meta.json")
+        )
+
+    def metadata(self, document_id: str) -> Optional[Dict]:
+        if not self.exists(document_id):
+            return None
+        with open(os.path.join(self._doc_dir(document_id), "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def spool(self, fileobj: BinaryIO) -> Tuple[str, str]:
+        """
+        Copies an upload to a temp file in the store while hashing it, so large uploads
+        never sit in memory as one bytes object. Returns (spool path, document id); the
+        caller owns the spool file.
+        """
+        sha = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.store_dir, suffix=".pdf", delete=False) as tmp:
+            for block in iter(lambda: fileobj.read(COPY_BUFFER_SIZE), b""):
+                sha.update(block)
+                tmp.write(block)
+        return tmp.name, sha.hexdigest()
+
+    def ingest(self, fileobj: BinaryIO, filename: str = "", progress: Optional[ProgressCallback] = None) -> Tuple[Dict, bool]:
+        """
+        Stores an uploaded PDF and returns (metadata, created). Identical bytes map to the
+        same document id, in which case nothing is parsed or embedded and created is False.
+        Raises ValueError when no text can be extracted; pages that fail on their own are
+        listed in the metadata's failed_pages (1-based) instead.
+        """
+        spool_path, document_id = self.spool(fileobj)
+        try:
+            return self.ingest_spooled(spool_path, document_id, filename, progress)
+        finally:
+            os.remove(spool_path)
+
+    def ingest_spooled(self, spool_path: str, document_id: str, filename: str = "",
+                       progress: Optional[ProgressCallback] = None) -> Tuple[Dict, bool]:
+        """
+        Same as ingest() for a file already written by spool(). A caller that arrives
+        while the same document is being ingested waits for that ingest (and gets no
+        progress events).
+        """
+        existing = self.metadata(document_id)
+        if existing is not None:
+            self._count("reused")
+            if not self._model_matches(existing):
+                self.get_index(document_id)
+                existing = self.metadata(document_id)
+            return existing, False
+
+        (meta, created), shared = self._ingests.do(
+            document_id, lambda: self._ingest(spool_path, document_id, filename, progress)
+        )
+        if shared:
+            self._count("reused")
+            return meta, False
+        return meta, created
+
+    def _ingest(self, spool_path: str, document_id: str, filename: str,
+                progress: Optional[ProgressCallback]) -> Tuple[Dict, bool]:
+        num_pages = count_pages(spool_path)
+        failed_pages = []
+
+        def page_texts():
+            for done, page in enumerate(self.pdf_extractor.iter_pages(spool_path, num_pages), 1):
+                if page.error is not None:
+                    failed_pages.append(page.number + 1)
+                    if progress:
+                        progress("failed_pages", len(failed_pages), num_pages)
+                if progress:
+                    progress("pages", done, num_pages)
+                if page.text:
+                    # Keeps the last word of a page from running into the first of the next
+                    yield page.text + "\n"
+
+        faiss_index = FaissIndex(embedder=self.embedder, index_spec=self.index_spec, retrieval=self.retrieval)
+        text = faiss_index.build_index_from_pages(page_texts(), title=filename, progress=progress)
+        if not text.strip():
+            raise ValueError("could not read PDF")
+        meta = {
+            "document_id": document_id,
+            "filename": filename,
+            "num_chunks": len(faiss_index.documents),
+            "num_chars": len(text),
+            "num_pages": num_pages,
+            "failed_pages": failed_pages,
+            "index": faiss_index.describe(),
+            "model": self.embedder.model_id,
+            "created_at": time.time(),
+        }
+
+        # Build in a scratch directory and rename it into place so readers never see half a document
+        work_dir = tempfile.mkdtemp(dir=self.store_dir, prefix=f"{document_id[:12]}-")
+        faiss_index.save(work_dir)
+        with open(os.path.join(work_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(work_dir, self._doc_dir(document_id))
+        except OSError:
+            # Someone else finished the same document first
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return self.metadata(document_id), False
+
+        faiss_index.relocate(self._doc_dir(document_id))
+        with self._lock:
+            self.counters["ingested"] += 1
+            self._remember(document_id, faiss_index)
+        return meta, True
+
+    def get_index(self, document_id: str) -> Optional[FaissIndex]:
+        """
+        Returns the FAISS index for a stored document, or None if the id is unknown.
+        """
+        with self._lock:
+            faiss_index = self._loaded.get(document_id)
+            if faiss_index is not None:
+                self._loaded.move_to_end(document_id)
+                return faiss_index
+        meta = self.metadata(document_id)
+        if meta is None:
+            return None
+        faiss_index = FaissIndex.load(self._doc_dir(document_id), embedder=self.embedder,
+                                      index_spec=self.index_spec, retrieval=self.retrieval)
+        if not self._model_matches(meta):
+            # Vectors from another model or backend can't be searched with this one's queries
+            faiss_index, _ = self._ingests.do(("reembed", document_id),
+                                              lambda: self._reembed(document_id, meta, faiss_index))
+        with self._lock:
+            self.counters["loads"] += 1
+            self._remember(document_id, faiss_index)
+        return faiss_index
+
+    def _model_matches(self, meta: Dict) -> bool:
+        # Documents stored before the model was recorded were embedded by the fp32 backend
+        return meta.get("model", self.embedder.model_name) == self.embedder.model_id
+
+    def _reembed(self, document_id: str, meta: Dict, faiss_index: FaissIndex) -> FaissIndex:
+        """
+        Re-embeds a stored document's chunks with the current model and writes the new
+        vectors over the old ones, file by file, with meta.json last.
+        """
+        print(f"Re-embedding document {document_id[:12]} with {self.embedder.model_id} "
+              f"(stored with {meta.get('model', self.embedder.model_name)})")
+        faiss_index.reembed()
+        doc_dir = self._doc_dir(document_id)
+        work_dir = tempfile.mkdtemp(dir=self.store_dir, prefix=f"{document_id[:12]}-")
+        try:
+            faiss_index.save(work_dir)
+            with open(os.path.join(work_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({**meta, "index": faiss_index.describe(), "model": self.embedder.model_id}, f)
+            for name in sorted(os.listdir(work_dir), key=lambda name: name == "meta.json"):
+                os.replace(os.path.join(work_dir, name), os.path.join(doc_dir, name))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        faiss_index.relocate(doc_dir)
+        self._count("reembedded")
+        return faiss_index
+
+    def _count(self, name: str):
+        # Request threads and ingest workers update the counters concurrently
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, document_id: str, faiss_index: FaissIndex):
+        self._loaded[document_id] = faiss_index
+        self._loaded.move_to_end(document_id)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {**self.counters, "loaded": len(self._loaded)}
+        return {**stats, "pdf": self.pdf_extractor.stats()}
+
+
+_doc_store = None
+_doc_store_lock = threading.Lock()
+
+
+def get_doc_store() -> DocumentStore:
+    """
+    Returns the process-wide DocumentStore, configured from the environment on first use.
+    """
+    global _doc_store
+    if _doc_store is None:
+        with _doc_store_lock:
+            if _doc_store is None:
+                _doc_store = DocumentStore.from_env(embedder=get_embedder())
+    return _doc_store
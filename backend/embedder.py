@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import queue
+import resource
+import threading
+import subprocess
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# --- Configuration ---
+load_dotenv()
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+# "fp32" runs the model as published; "int8" quantizes its Linear layers dynamically for CPU
+BACKENDS = ("fp32", "int8")
+
+
+def _rss_bytes() -> int:
+    """
+    Current resident set size of this process, in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is kilobytes on Linux and bytes on macOS; peak is close enough here.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class EmbeddingService:
+    """
+    Owns the single SentenceTransformer used by the whole process.
+    The model is loaded lazily (or eagerly via warm()) and every encode call
+    is serialized behind a lock so concurrent handlers don't fight over torch threads.
+
+    Short query encodes from concurrent requests go through encode_queries(), which
+    micro-batches them: a scheduler thread collects whatever arrives within
+    max_wait_ms (or until max_batch texts) and runs one forward pass for all of them.
+
+    torch and sentence-transformers are imported when the model is loaded, not when
+    this module is. backend="int8" (CPU only) swaps the model's Linear layers for
+    dynamically quantized int8 ones after loading.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = None, num_threads: Optional[int] = None,
+                 max_wait_ms: float = 2.0, max_batch: int = 64, backend: str = "fp32"):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+        self.model_name = model_name
+        self.device = device or "cpu"
+        if backend == "int8" and self.device != "cpu":
+            raise ValueError("the int8 embedding backend only runs on CPU")
+        self.backend = backend
+        self.num_threads = num_threads
+        self.max_wait_ms = max_wait_ms
+        self.max_batch = max_batch
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._scheduler = None
+        self._in_flight = 0  # callers currently blocked in encode_queries()
+        self._in_flight_lock = threading.Lock()
+        self.load_seconds = None
+        self.load_rss_bytes = None
+        self.encode_calls = 0
+        self.encoded_texts = 0
+        self.batched_requests = 0
+        self.batches = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingService":
+        threads = os.getenv("EMBEDDING_THREADS")
+        return cls(
+            model_name=os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL),
+            device=os.getenv("EMBEDDING_DEVICE", "cpu"),
+            num_threads=int(threads) if threads else None,
+            max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 2)),
+            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", 64)),
+            backend=os.getenv("EMBEDDING_BACKEND", "fp32"),
+        )
+
+    @property
+    def model_id(self) -> str:
+        """
+        Names the embedding space: vectors from different model ids shouldn't be mixed.
+        """
+        return self.model_name if self.backend == "fp32" else f"{self.model_name}+{self.backend}"
+
+    @property
+    def model(self) -> "SentenceTransformer":
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self):
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        model = SentenceTransformer(self.model_name, device=self.device)
+        if self.backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.load_seconds = time.perf_counter() - start
+        self.load_rss_bytes = _rss_bytes() - rss_before
+        self._model = model
+        print(f"  -> Loaded {self.model_id} on {self.device} in {self.load_seconds:.2f}s "
+              f"(+{self.load_rss_bytes / 2**20:.1f} MiB RSS)")
+
+    def after_fork(self):
+        """
+        Call in a process forked from one that loaded the model (see serve.py). The
+        weights are shared copy-on-write; the thread setting and the batching thread
+        are per process.
+        """
+        if self.num_threads:
+            import torch
+            torch.set_num_threads(self.num_threads)
+        self._queue = queue.Queue()
+        self._scheduler = None
+        self._in_flight = 0
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def warm(self):
+        """
+        Loads the model and runs one throwaway encode so the first request doesn't pay for it.
+        """
+        self.encode(["warmup"])
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Returns L2-normalized float32 embeddings, one row per text.
+        """
+        model = self.model
+        with self._encode_lock:
+            embeddings = model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            self.encode_calls += 1
+            self.encoded_texts += len(texts)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    # --- Micro-batching ---
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Same as encode(), but shares a forward pass with other threads' concurrent
+        calls. Meant for the handful of texts a request embeds (claims, queries);
+        large corpora should call encode() directly. max_wait_ms <= 0 disables batching.
+        """
+        if self.max_wait_ms <= 0 or len(texts) >= self.max_batch:
+            return self.encode(texts)
+        if self._scheduler is None:
+            with self._load_lock:
+                if self._scheduler is None:
+                    self._scheduler = threading.Thread(target=self._run_batches, name="embedding-batcher", daemon=True)
+                    self._scheduler.start()
+        future = Future()
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            self._queue.put((texts, future))
+            return future.result()
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    def _run_batches(self):
+        max_wait = self.max_wait_ms / 1000
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            # Requests that queued up during the previous forward pass are taken right away;
+            # there's no point waiting once every blocked caller is in the batch
+            deadline = time.perf_counter() + max_wait
+            while size < self.max_batch and len(batch) < self._in_flight:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = self.encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_requests += len(batch)
+            row = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[row:row + len(item_texts)])
+                row += len(item_texts)
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "device": self.device,
+            "num_threads": self.num_threads or (sys.modules["torch"].get_num_threads() if "torch" in sys.modules else None),
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+            "load_rss_mib": None if self.load_rss_bytes is None else round(self.load_rss_bytes / 2**20, 1),
+            "process_rss_mib": round(_rss_bytes() / 2**20, 1),
+            "encode_calls": self.encode_calls,
+            "encoded_texts": self.encoded_texts,
+            "batches": self.batches,
+            "avg_batch_requests": round(self.batched_requests / self.batches, 2) if self.batches else None,
+        }
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> EmbeddingService:
+    """
+    Returns the process-wide EmbeddingService, creating it from the environment on first use.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = EmbeddingService.from_env()
+    return _embedder
+
+
+# --- Benchmark ---
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def benchmark(embedder: EmbeddingService, concurrency_levels: List[int], requests_per_level: int = 512) -> List[Dict]:
+    """
+    Fires single-claim encodes from N concurrent threads, once straight through
+    encode() and once through encode_queries(), and reports throughput and latency.
+    """
+    claims = [f"Claim number {i} says the team was founded in {1900 + i % 120}." for i in range(requests_per_level)]
+    embedder.warm()
+    results = []
+    for concurrency in concurrency_levels:
+        for mode, encode in (("direct", embedder.encode), ("batched", embedder.encode_queries)):
+            latencies = []
+
+            def one(claim):
+                start = time.perf_counter()
+                encode([claim])
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            batches_before = embedder.batches
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(one, claims))
+            elapsed = time.perf_counter() - start
+            results.append({
+                "concurrency": concurrency,
+                "mode": mode,
+                "requests_per_second": round(len(claims) / elapsed, 1),
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p99_ms": round(_percentile(latencies, 99), 2),
+                "forward_passes": len(claims) if mode == "direct" else embedder.batches - batches_before,
+            })
+    return results
+
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from embedder import EmbeddingService, _rss_bytes
+imported = time.perf_counter() - start
+service = EmbeddingService(sys.argv[1], backend=sys.argv[2])
+service.warm()
+print(json.dumps({"import_seconds": imported, "load_seconds": service.load_seconds,
+                  "ready_seconds": time.perf_counter() - start, "rss_mib": _rss_bytes() / 2**20}))
+"""
+
+
+def measure_startup(model_name: str, backend: str) -> Dict:
+    """
+    Cold start in a fresh interpreter: importing this module, loading the model and
+    the first encode, plus the process RSS once ready.
+    """
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", _STARTUP_SCRIPT, model_name, backend],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)), text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return {key: round(value, 3) if key.endswith("seconds") else round(value, 1) for key, value in result.items()}
+
+
+def compare_backends(chunks: List[str], claims: List[str], model_name: str = DEFAULT_MODEL,
+                     backends: Tuple[str, ...] = BACKENDS, k: int = 5) -> List[Dict]:
+    """
+    Startup time, encode throughput and retrieval agreement of each backend. The
+    first backend is the reference: agreement is the share of each claim's top-k
+    chunks (by the reference model) that the backend also ranks in its top-k, and
+    cosine is the mean similarity between the two models' embeddings of a chunk.
+    """
+    results = []
+    reference = None
+    for backend in backends:
+        startup = measure_startup(model_name, backend)
+        service = EmbeddingService(model_name, backend=backend)
+        service.warm()
+
+        start = time.perf_counter()
+        chunk_vectors = service.encode(chunks)
+        chunk_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        claim_vectors = np.vstack([service.encode([claim]) for claim in claims])
+        claim_seconds = time.perf_counter() - start
+
+        top_k = np.argsort(-(claim_vectors @ chunk_vectors.T), axis=1)[:, :k]
+        result = {
+            "backend": backend,
+            "startup": startup,
+            "chunks_per_second": round(len(chunks) / chunk_seconds, 1),
+            "claim_ms": round(claim_seconds / len(claims) * 1000, 2),
+        }
+        if reference is None:
+            reference = (chunk_vectors, top_k)
+        else:
+            reference_vectors, reference_top_k = reference
+            overlap = [len(set(a) & set(b)) / k for a, b in zip(top_k, reference_top_k)]
+            result.update({
+                f"agreement@{k}": round(float(np.mean(overlap)), 4),
+                "top1_agreement": round(float(np.mean(top_k[:, 0] == reference_top_k[:, 0])), 4),
+                "mean_cosine": round(float(np.mean(np.sum(chunk_vectors * reference_vectors, axis=1))), 4),
+            })
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure query-encode throughput, or compare the fp32 and int8 backends.")
+    parser.add_argument("command", choices=["bench", "compare-backends"])
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--pages", help="compare-backends: JSON file mapping article titles to their plain text "
+                                        "(the stub_wiki.py format); defaults to the stub's pages")
+    parser.add_argument("--num-claims", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        results = benchmark(get_embedder(), [int(c) for c in args.concurrency.split(",")], args.requests)
+    else:
+        from chunking import chunk_text
+        from retrieval import _sample_claims
+
+        if args.pages:
+            with open(args.pages, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+        else:
+            from stub_wiki import DEFAULT_PAGES
+            pages = DEFAULT_PAGES
+        chunks = [chunk for text in pages.values() for chunk in chunk_text(text)]
+        results = compare_backends(chunks, _sample_claims(pages, args.num_claims),
+                                   os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL), k=min(args.k, len(chunks)))
+    print(json.dumps(results, indent=2))
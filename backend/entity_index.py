@@ -0,0 +1,249 @@
+"""
+Compact, memory-mapped alias -> Wikidata entity index for Wikidata5M.
+
+The alias file (data/wikidata5m_entity.txt, one "Q<id>\talias\talias..." line per
+entity) is turned once into two sorted NumPy arrays:
+
+    keys.npy    uint64  64-bit hash of each lowercased alias, sorted
+    values.npy  uint32  numeric part of the entity id for the matching key, with the
+                        top bit set when the alias names more than one entity
+
+Both are opened with mmap_mode="r", so opening the index is instant and every
+process on the machine shares the same page-cache pages instead of holding its own
+multi-GB dict. A lookup is one hash and one binary search.
+
+    python entity_index.py build data/wikidata5m_entity.txt data/entity_index
+    python entity_index.py bench data/wikidata5m_entity.txt data/entity_index
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+
+DEFAULT_INDEX_DIR = "data/entity_index"
+# Set on values whose alias is shared by several entities; Wikidata5M ids stay far below 2**31
+AMBIGUOUS_FLAG = np.uint32(1 << 31)
+
+
+def alias_hash(alias: str) -> int:
+    """
+    Stable 64-bit hash of a lowercased alias. Python's hash() is salted per process,
+    so it can't be used for an on-disk index. With ~15M aliases the chance of any
+    collision is around 1e-5.
+    """
+    return int.from_bytes(hashlib.blake2b(alias.lower().encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _iter_aliases(entity_file: str) -> Iterator[Tuple[str, str]]:
+    with open(entity_file, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) >= 2:
+                for alias in parts[1:]:
+                    yield alias, parts[0]
+
+
+def build_entity_index(entity_file: str, out_dir: str) -> Dict:
+    """
+    Builds the index from the Wikidata5M alias file. When an alias maps to several
+    entities the last one in the file wins, matching load_entity_map(), and the
+    entry is flagged ambiguous so callers can avoid drawing conclusions from it.
+    """
+    start = time.perf_counter()
+    keys = array("Q")
+    values = array("I")
+    skipped = 0
+    for alias, item_id in _iter_aliases(entity_file):
+        if not item_id.startswith("Q") or not item_id[1:].isdigit():
+            skipped += 1
+            continue
+        keys.append(alias_hash(alias))
+        values.append(int(item_id[1:]))
+
+    keys_np = np.frombuffer(keys, dtype=np.uint64)
+    values_np = np.frombuffer(values, dtype=np.uint32)
+    order = np.argsort(keys_np, kind="stable")
+    keys_np = keys_np[order]
+    values_np = values_np[order]
+    # Keep the last entry of each run of equal keys (stable sort preserves file order)
+    last = np.ones(len(keys_np), dtype=bool)
+    last[:-1] = keys_np[1:] != keys_np[:-1]
+    ambiguous = np.zeros(int(last.sum()), dtype=bool)
+    if len(keys_np):
+        # A run is ambiguous when its entries disagree on the entity, not when an alias is repeated
+        starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+        ambiguous = np.minimum.reduceat(values_np, starts) != np.maximum.reduceat(values_np, starts)
+    keys_np = keys_np[last]
+    values_np = values_np[last] | np.where(ambiguous, AMBIGUOUS_FLAG, np.uint32(0))
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "keys.npy"), keys_np)
+    np.save(os.path.join(out_dir, "values.npy"), values_np)
+    meta = {
+        "source": os.path.abspath(entity_file),
+        "aliases": int(len(keys_np)),
+        "ambiguous": int(ambiguous.sum()),
+        "skipped": skipped,
+        "build_seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class EntityIndex:
+    """
+    Read-only alias -> "Q<id>" mapping over a built index. Exposes the dict methods
+    convert_triplet_to_ids relies on, so it can stand in for load_entity_map().
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.keys = np.load(os.path.join(index_dir, "keys.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(index_dir, "values.npy"), mmap_mode="r")
+
+    def _value(self, alias: str) -> Optional[int]:
+        key = np.uint64(alias_hash(alias))
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.values[i])
+        return None
+
+    def get(self, alias: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._value(alias)
+        if value is None:
+            return default
+        return f"Q{value & ~int(AMBIGUOUS_FLAG)}"
+
+    def is_ambiguous(self, alias: str) -> bool:
+        """
+        True if alias names several entities, so get() may have picked the wrong one.
+        """
+        value = self._value(alias)
+        return value is not None and bool(value & int(AMBIGUOUS_FLAG))
+
+    def __contains__(self, alias: str) -> bool:
+        return self.get(alias) is not None
+
+    def __getitem__(self, alias: str) -> str:
+        item_id = self.get(alias)
+        if item_id is None:
+            raise KeyError(alias)
+        return item_id
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+_entity_index = None
+_entity_index_lock = threading.Lock()
+
+
+def get_entity_index() -> Optional[EntityIndex]:
+    """
+    Returns the process-wide EntityIndex from ENTITY_INDEX_DIR, or None if it hasn't
+    been built yet.
+    """
+    global _entity_index
+    if _entity_index is None:
+        with _entity_index_lock:
+            if _entity_index is None:
+                index_dir = os.getenv("ENTITY_INDEX_DIR", DEFAULT_INDEX_DIR)
+                if not os.path.exists(os.path.join(index_dir, "keys.npy")):
+                    print(f"Error: entity index not found at {index_dir}; "
+                          f"run `python entity_index.py build data/wikidata5m_entity.txt {index_dir}`")
+                    return None
+                _entity_index = EntityIndex(index_dir)
+                meta_path = os.path.join(index_dir, "meta.json")
+                if os.path.exists(meta_path):
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        if "ambiguous" not in json.load(f):
+                            print(f"Warning: entity index at {index_dir} predates ambiguous-alias flags; "
+                                  f"rebuild it so the Wikidata tier can tell which aliases to distrust")
+    return _entity_index
+
+
+# --- Benchmark ---
+
+def _rss_mib() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _lookup_latency_us(mapping, aliases) -> float:
+    start = time.perf_counter()
+    for alias in aliases:
+        mapping.get(alias.lower())
+    return (time.perf_counter() - start) / len(aliases) * 1e6
+
+
+def benchmark(entity_file: str, index_dir: str, samples: int = 100000) -> Dict:
+    """
+    Compares the mmap index with the dict from load_entity_map() on build time, load
+    time, lookup latency and memory. The index is measured first, because the dict's
+    allocations are never returned to the OS.
+    """
+    from sentence_pre import load_entity_map
+
+    results = {}
+    start = time.perf_counter()
+    meta = build_entity_index(entity_file, index_dir)
+    results["index_build_seconds"] = round(time.perf_counter() - start, 2)
+
+    all_aliases = [alias for alias, _ in _iter_aliases(entity_file)]
+    rng = random.Random(0)
+    sample = [rng.choice(all_aliases) for _ in range(samples)]
+    del all_aliases
+    sample += [f"{alias} (missing)" for alias in sample[: samples // 10]]
+
+    rss_before = _rss_mib()
+    start = time.perf_counter()
+    index = EntityIndex(index_dir)
+    results["index_load_seconds"] = round(time.perf_counter() - start, 4)
+
+    results["index_lookup_us"] = round(_lookup_latency_us(index, sample), 2)
+    # Resident growth after touching the arrays; these pages are shared between processes
+    results["index_rss_mib"] = round(_rss_mib() - rss_before, 1)
+    results["index_disk_mib"] = round(
+        sum(os.path.getsize(os.path.join(index_dir, name)) for name in ("keys.npy", "values.npy")) / 2**20, 1
+    )
+
+    rss_before = _rss_mib()
+    start = time.perf_counter()
+    entity_map = load_entity_map(entity_file)
+    results["dict_load_seconds"] = round(time.perf_counter() - start, 2)
+    results["dict_rss_mib"] = round(_rss_mib() - rss_before, 1)
+    results["dict_lookup_us"] = round(_lookup_latency_us(entity_map, sample), 2)
+
+    mismatches = sum(index.get(alias.lower()) != entity_map.get(alias.lower()) for alias in sample)
+    results["aliases"] = meta["aliases"]
+    results["mismatches"] = mismatches
+    results["peak_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark the Wikidata5M entity alias index.")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("entity_file", nargs="?", default="data/wikidata5m_entity.txt")
+    parser.add_argument("index_dir", nargs="?", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--samples", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(json.dumps(build_entity_index(args.entity_file, args.index_dir), indent=2))
+    else:
+        print(json.dumps(benchmark(args.entity_file, args.index_dir, args.samples), indent=2))
@@ -1,18 +1,67 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from pydantic import BaseModel
-import joblib
-from joblib_gen import generate_joblib
 from wiki_llm import FaissIndex
+from retrieval import RetrievalSpec
+from embedder import get_embedder
+from wiki_cache import get_wiki_cache
+from wiki_fetch import WikipediaError
+from doc_store import get_doc_store
+from doc_sessions import SessionConflict, get_doc_sessions
+from pdf_extract import get_pdf_extractor
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, llm_call, render as render_metrics, span
+from kg_verifier import TierStats, get_kg_verifier
+from property_index import get_property_resolver
+from verdict_cache import get_verdict_cache, normalize_sentence
+from singleflight import AsyncSingleFlight, SingleFlight, stats as singleflight_stats
 import os
-from openai import OpenAI
-from sentence_pre import compute_triplets, get_openai_client, extract_k_text_triplets, is_claim, extract_subject
+import asyncio
+import time
+import openai
+from sentence_pre import (
+    LLM_MODEL,
+    PREPROCESS_MODE,
+    compute_triplets,
+    extract_k_text_triplets,
+    extract_k_text_triplets_async,
+    extract_subject_async,
+    get_async_openai_client,
+    is_claim_async,
+    preprocess_fused_async,
+)
 import json
-import PyPDF2
-import io
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+from typing import List
+
+# Dense or BM25-prefiltered retrieval over Wikipedia chunks (WIKIPEDIA_RETRIEVAL)
+WIKIPEDIA_RETRIEVAL = RetrievalSpec.from_env("wikipedia")
+
+# Upper bound on simultaneous LLM calls made on behalf of one batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 8))
+
+# Which tier ("wikidata" or "wikipedia") answered each claim
+tier_stats = TierStats()
+
+# Concurrent requests for the same claim, or retrieval for the same subject, share one run
+check_fact_flight = AsyncSingleFlight("check_fact")
+wikipedia_index_flight = SingleFlight("wikipedia_index")
 
-app = FastAPI(title="Fact Checker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model once, before the first request arrives
+    get_embedder().warm()
+    # Opens the memory-mapped entity index and triple store; pages are shared with other workers
+    get_kg_verifier()
+    get_property_resolver()
+    get_verdict_cache()
+    yield
+    # PDF worker processes are started on the first upload
+    get_pdf_extractor().close()
+
+app = FastAPI(title="Fact Checker API", lifespan=lifespan)
 
 # Allow Notion (or all origins during dev)
 app.add_middleware(
@@ -26,14 +75,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser extension read per-request traces (sent with "X-Trace: 1")
+    expose_headers=["Server-Timing", "X-Trace-Id"],
 )
+# Outermost, so request timings include CORS handling
+app.add_middleware(MetricsMiddleware)
 
 class CheckFactRequest(BaseModel):
     sentence: str
     k: int = 5
 
-def fact_check_with_context(claim: str, context: str):
-    client = OpenAI()
+class CheckFactsRequest(BaseModel):
+    sentences: List[str]
+    k: int = 5
+
+class CheckDocumentRequest(BaseModel):
+    sentence: str
+    document_id: str
+
+def empty_response(answer: str):
+    return {
+        "answer": answer,
+        "confidence": 0,
+        "is_false": False,
+        "sources": [],
+        "snippet": ""
+    }
+
+def failed_response(answer: str):
+    """
+    A response standing in for a verdict the pipeline couldn't reach (an LLM outage,
+    an unreadable reply). Marked "failed", so it is returned but never cached.
+    """
+    return {**empty_response(answer), "failed": True}
+
+def not_a_claim(claim):
+    """
+    Response for a sentence is_claim_async didn't accept; None means the check itself failed.
+    """
+    if claim is None:
+        return failed_response("could not check claim")
+    return empty_response("not a checkable statement")
+
+async def timed(timings: dict, stage: str, awaitable):
+    """
+    Awaits awaitable and records its wall time in milliseconds under timings[stage].
+    Runs inside metrics.span, so the stage also shows in the latency histogram and the
+    in-flight gauge.
+    """
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+async def fact_check_with_context(claim: str, context: str):
+    client = get_async_openai_client()
 
     prompt = f"""
     Claim: "{claim}"
@@ -46,11 +144,13 @@ def fact_check_with_context(claim: str, context: str):
     Respond with a JSON object with four keys: "answer" (true, false, or not supported), "confidence" (a score from 0 to 5, where 5 is very confident), "is_false" (boolean), and "snippet" (the exact text snippet from the Context that was used to make the determination. If the answer is "not supported", the snippet should be an empty string).
     """
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        response_format={"type": "json_object"},
-        messages=[{"role": "user", "content": prompt}]
-    )
+    with llm_call("verify") as record:
+        resp = await client.chat.completions.create(
+            model=LLM_MODEL,
+            response_format={"type": "json_object"},
+            messages=[{"role": "user", "content": prompt}]
+        )
+        record(resp)
     
     response_data = resp.choices[0].message.content
     try:
@@ -61,87 +161,679 @@ def fact_check_with_context(claim: str, context: str):
             "answer": "not supported",
             "confidence": 0,
             "is_false": False,
-            "snippet": ""
+            "snippet": "",
+            "failed": True,
         }
 
-def fact_check_with_wikipedia(claim, subject):
-    faiss_index = FaissIndex()
-    faiss_index.build_index_from_wikipedia(subject, top_k=2)
-    results = faiss_index.query(claim, k=1)
+def build_wikipedia_index(subject, top_k=2):
+    def build():
+        faiss_index = FaissIndex(retrieval=WIKIPEDIA_RETRIEVAL)
+        faiss_index.build_index_from_wikipedia(subject, top_k=top_k)
+        return faiss_index
+
+    # The index is only searched after it is built, so concurrent claims can share it
+    faiss_index, _ = wikipedia_index_flight.do((" ".join(str(subject).lower().split()), top_k), build)
+    return faiss_index
+
+def build_context(results, wikipedia_sources=False):
     context = ""
     sources = []
     for r in results:
         context += r['text']
-        sources.append({
-            "name": r['title'],
-            "link": f"https://en.wikipedia.org/wiki/{r['title'].replace(' ', '_')}"
-        })
+        if wikipedia_sources:
+            sources.append({
+                "name": r['title'],
+                "link": f"https://en.wikipedia.org/wiki/{r['title'].replace(' ', '_')}"
+            })
+    return context, sources
+
+def locate_snippet(response, results):
+    """
+    Adds "snippet_span" (title, start, end), the snippet's character offsets in its
+    source article or document, when the snippet is quoted verbatim from a chunk.
+    """
+    snippet = (response.get("snippet") or "").strip()
+    if not snippet:
+        return
+    for r in results:
+        offset = r["text"].find(snippet)
+        if offset >= 0:
+            start = r["start"] + offset
+            response["snippet_span"] = {"title": r["title"], "start": start, "end": start + len(snippet)}
+            return
 
-    response = fact_check_with_context(claim, context)
+async def fetch_wikipedia_index(subject, timings):
+    """
+    The subject's Wikipedia index, or None if its pages couldn't be retrieved (a
+    timeout, or an empty subject because extraction failed).
+    """
+    try:
+        return await timed(timings, "wikipedia", asyncio.to_thread(build_wikipedia_index, subject, 2))
+    except WikipediaError as e:
+        print(f"Could not retrieve Wikipedia pages for {subject!r}: {e}")
+        return None
+
+async def fact_check_with_index(claim, faiss_index, timings, wikipedia_sources=False):
+    results = await timed(timings, "retrieve", asyncio.to_thread(faiss_index.query, claim, 1))
+    context, sources = build_context(results, wikipedia_sources)
+
+    try:
+        response = await timed(timings, "verify", fact_check_with_context(claim, context))
+    except openai.APIError as e:
+        print(f"Could not verify {claim!r}: {e}")
+        return failed_response("could not check claim")
     response["sources"] = sources
+    locate_snippet(response, results)
     return response
 
-def extract_text_from_pdf(file: UploadFile):
-    text = ""
+async def check_knowledge_graph(sentence, text_triplets, timings):
+    """
+    Runs the Wikidata tier. Returns a response tagged with its tier, or None if the
+    triples don't settle the claim.
+    """
+    verifier = get_kg_verifier()
+    if not verifier.available or not text_triplets:
+        return None
+    # Property lookups may still go over the network, so keep them off the event loop
+    response = await timed(timings, "wikidata", asyncio.to_thread(verifier.verify, sentence, text_triplets))
+    if response is not None:
+        response["tier"] = "wikidata"
+    return response
+
+def verdict_dependencies(response):
+    """
+    Versions of the sources a verdict came from, so the verdict cache can tell when
+    it has gone out of date.
+    """
+    if response.get("tier") == "wikipedia":
+        cache = get_wiki_cache()
+        return {
+            f"wikipedia:{source['name']}": str(cache.revision_of(source["name"]))
+            for source in response.get("sources", [])
+        }
+    if response.get("tier") == "wikidata":
+        return {"wikidata": get_kg_verifier().triple_store.version}
+    return {}
+
+async def remember_verdict(sentence, source, response):
+    response["cached"] = False
+    cache = get_verdict_cache()
+    # A failed check would otherwise be served as the claim's verdict until the TTL runs out
+    if cache is not None and not response.get("failed"):
+        await asyncio.to_thread(
+            lambda: cache.store(sentence, source, response, verdict_dependencies(response))
+        )
+
+async def check_fact_separate(sentence, k, client, timings):
+    claim_task = asyncio.create_task(timed(timings, "is_claim", is_claim_async(sentence, client)))
+    subject_task = asyncio.create_task(timed(timings, "extract_subject", extract_subject_async(sentence, client)))
+    triplet_task = None
+    if get_kg_verifier().available:
+        triplet_task = asyncio.create_task(
+            timed(timings, "extract_triplets", extract_k_text_triplets_async(sentence, k, client))
+        )
+    index_task = None
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.file.read()))
-        for page_num in range(len(pdf_reader.pages)):
-            text += pdf_reader.pages[page_num].extract_text()
-    except Exception as e:
-        print(f"Error reading PDF: {e}")
-    return text
+        # Bail out early if the claim check comes back negative before the subject does
+        await asyncio.wait({claim_task, subject_task}, return_when=asyncio.FIRST_COMPLETED)
+        if claim_task.done() and not claim_task.result():
+            return not_a_claim(claim_task.result())
+
+        subject = await subject_task
+        if triplet_task is not None:
+            # A local hit makes the Wikipedia fetch unnecessary, so settle it before starting one
+            response = await check_knowledge_graph(sentence, await triplet_task, timings)
+            if response is not None:
+                claim = await claim_task
+                return response if claim else not_a_claim(claim)
+
+        # Start fetching Wikipedia speculatively while is_claim may still be in flight
+        index_task = asyncio.create_task(fetch_wikipedia_index(subject, timings))
+        claim = await claim_task
+        if not claim:
+            # The worker thread still finishes and fills the page cache; only its result is dropped
+            return not_a_claim(claim)
+
+        faiss_index = await index_task
+        if faiss_index is None:
+            return failed_response("could not retrieve Wikipedia pages")
+        response = await fact_check_with_index(sentence, faiss_index, timings, wikipedia_sources=True)
+        response["tier"] = "wikipedia"
+        return response
+    finally:
+        for task in (claim_task, subject_task, triplet_task, index_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+async def check_fact_fused(sentence, k, client, timings):
+    """
+    One LLM call for claim detection, subject and triplets. Returns None if the fused
+    response was unusable, in which case the caller runs the separate path.
+    """
+    preprocessed = await timed(timings, "preprocess", preprocess_fused_async(sentence, k, client))
+    if preprocessed is None:
+        return None
+    if not preprocessed.is_claim:
+        return empty_response("not a checkable statement")
+
+    text_triplets = [triplet.model_dump() for triplet in preprocessed.triplets]
+    response = await check_knowledge_graph(sentence, text_triplets, timings)
+    if response is not None:
+        return response
+
+    faiss_index = await fetch_wikipedia_index(preprocessed.subject, timings)
+    if faiss_index is None:
+        return failed_response("could not retrieve Wikipedia pages")
+    response = await fact_check_with_index(sentence, faiss_index, timings, wikipedia_sources=True)
+    response["tier"] = "wikipedia"
+    return response
+
+async def run_check_fact(sentence, k):
+    """
+    Runs the pipeline for one claim and caches the verdict. The response's timings
+    cover the pipeline stages only.
+    """
+    timings = {}
+    client = get_async_openai_client()
+    response = None
+    if PREPROCESS_MODE == "fused":
+        response = await check_fact_fused(sentence, k, client, timings)
+    if response is None:
+        response = await check_fact_separate(sentence, k, client, timings)
+    await remember_verdict(sentence, "web", response)
+    response["timings"] = timings
+    return response
 
 @app.post("/check_fact")
-def check_fact(request: CheckFactRequest):
+async def check_fact(request: CheckFactRequest):
     sentence = request.sentence
-    k = request.k
-    client = get_openai_client()
-    if is_claim(sentence, client) == False:
-        return {
-            "answer": "not a checkable statement",
-            "confidence": 0,
-            "is_false": False,
-            "sources": [],
-            "snippet": ""
-        }
+    timings = {}
+    start = time.perf_counter()
+
+    # Repeat and near-duplicate claims skip the LLM calls and retrieval entirely
+    cache = get_verdict_cache()
+    if cache is not None:
+        cached = await timed(timings, "cache", asyncio.to_thread(cache.lookup, sentence, "web"))
+        if cached is not None:
+            timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+            tier_stats.record("cache", timings["total"])
+            return {**cached, "timings": timings}
+
+    # An identical claim already being checked is awaited rather than checked again
+    response, shared = await check_fact_flight.do(
+        (normalize_sentence(sentence), request.k), lambda: run_check_fact(sentence, request.k)
+    )
+    timings.update(response["timings"])
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    if "tier" in response:
+        # A follower only waited on the leader's run, so it isn't counted under the leader's tier
+        tier_stats.record("coalesced" if shared else response["tier"], timings["total"])
+    if shared:
+        return {**response, "coalesced": True, "timings": timings}
+    return {**response, "timings": timings}
 
-    subject = extract_subject(sentence, client)
-    return fact_check_with_wikipedia(claim=sentence, subject=subject)
+async def preprocess(sentence, k, client):
+    """
+    Returns (is_claim, subject, text triplets) using the configured preprocessing mode.
+    Triplets are only extracted in separate mode when the Wikidata tier can use them.
+    """
+    if PREPROCESS_MODE == "fused":
+        preprocessed = await preprocess_fused_async(sentence, k, client)
+        if preprocessed is not None:
+            return preprocessed.is_claim, preprocessed.subject, [t.model_dump() for t in preprocessed.triplets]
+    if not get_kg_verifier().available:
+        claim, subject = await asyncio.gather(is_claim_async(sentence, client), extract_subject_async(sentence, client))
+        return claim, subject, []
+    return await asyncio.gather(
+        is_claim_async(sentence, client),
+        extract_subject_async(sentence, client),
+        extract_k_text_triplets_async(sentence, k, client),
+    )
+
+async def iter_check_facts(sentences, k, timings):
+    """
+    Checks many sentences at once: cached verdicts are returned first, each other
+    distinct sentence is preprocessed once, claims the Wikidata tier settles are
+    answered right away, each remaining subject's Wikipedia index is built once, and
+    those claims are embedded in one call.
+    Yields (input positions, response) as soon as each distinct sentence is resolved.
+    """
+    client = get_async_openai_client()
+    limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def bounded(awaitable):
+        async with limit:
+            return await awaitable
+
+    positions = {}
+    for i, s in enumerate(sentences):
+        positions.setdefault(s.strip(), []).append(i)
+
+    async def preprocess_one(sentence):
+        return sentence, await bounded(preprocess(sentence, k, client))
+
+    async def subject_index(subject):
+        # One subject's search failing (a timeout, an empty subject) only fails its own claims
+        try:
+            return await asyncio.to_thread(build_wikipedia_index, subject, 2)
+        except WikipediaError as e:
+            print(f"Could not retrieve Wikipedia pages for {subject!r}: {e}")
+            return None
+
+    async def verify_one(sentence, chunks):
+        context, sources = build_context(chunks, wikipedia_sources=True)
+        # Likewise a verify call that fails (a timeout, a rate limit) only fails its own claim
+        try:
+            verdict = await bounded(fact_check_with_context(sentence, context))
+        except openai.APIError as e:
+            print(f"Could not verify {sentence!r}: {e}")
+            return sentence, failed_response("could not check claim")
+        verdict["sources"] = sources
+        locate_snippet(verdict, chunks)
+        verdict["tier"] = "wikipedia"
+        return sentence, verdict
+
+    cache = get_verdict_cache()
+    if cache is not None:
+        hits = await timed(timings, "cache", asyncio.gather(
+            *(asyncio.to_thread(cache.lookup, s, "web") for s in positions)
+        ))
+        for sentence, hit in zip(list(positions), hits):
+            if hit is not None:
+                yield positions.pop(sentence), hit
+
+    pending = [asyncio.create_task(preprocess_one(s)) for s in positions]
+    try:
+        # Non-claims are answered as soon as their preprocessing returns
+        start = time.perf_counter()
+        claims_by_subject = {}
+        for next_done in asyncio.as_completed(pending):
+            sentence, (claim, subject, text_triplets) = await next_done
+            if not claim:
+                response = not_a_claim(claim)
+                await remember_verdict(sentence, "web", response)
+                yield positions[sentence], response
+                continue
+            response = await check_knowledge_graph(sentence, text_triplets, {})
+            if response is not None:
+                await remember_verdict(sentence, "web", response)
+                yield positions[sentence], response
+            else:
+                claims_by_subject.setdefault(subject.strip().lower(), []).append((sentence, subject))
+        timings["preprocess"] = round((time.perf_counter() - start) * 1000, 1)
+
+        claims = [sentence for group in claims_by_subject.values() for sentence, _ in group]
+        if not claims:
+            return
+
+        subjects = list(claims_by_subject)
+        indexes, claim_embeddings = await asyncio.gather(
+            timed(timings, "wikipedia", asyncio.gather(*(
+                subject_index(claims_by_subject[key][0][1]) for key in subjects
+            ))),
+            timed(timings, "embed_claims", asyncio.to_thread(get_embedder().encode, claims)),
+        )
+        index_by_subject = dict(zip(subjects, indexes))
+
+        pending = []
+        row = 0
+        for key in subjects:
+            if index_by_subject[key] is None:
+                row += len(claims_by_subject[key])
+                for sentence, _ in claims_by_subject[key]:
+                    yield positions[sentence], failed_response("could not retrieve Wikipedia pages")
+                continue
+            for sentence, _ in claims_by_subject[key]:
+                # Lexical retrieval may embed candidate chunks, so keep it off the event loop
+                chunks = await asyncio.to_thread(
+                    index_by_subject[key].query_embedding, claim_embeddings[row], 1, sentence
+                )
+                pending.append(asyncio.create_task(verify_one(sentence, chunks)))
+                row += 1
+
+        start = time.perf_counter()
+        for next_done in asyncio.as_completed(pending):
+            sentence, verdict = await next_done
+            await remember_verdict(sentence, "web", verdict)
+            yield positions[sentence], verdict
+        timings["verify"] = round((time.perf_counter() - start) * 1000, 1)
+    finally:
+        # The client may have gone away mid-stream
+        for task in pending:
+            task.cancel()
+
+async def check_facts_batch(sentences, k, timings):
+    """
+    Returns one response per input sentence, in input order.
+    """
+    results = [None] * len(sentences)
+    async for indices, response in iter_check_facts(sentences, k, timings):
+        # Duplicated sentences share a verdict but each gets its own copy
+        for i in indices:
+            results[i] = dict(response)
+    return results
+
+@app.post("/check_facts")
+async def check_facts(request: CheckFactsRequest):
+    timings = {}
+    start = time.perf_counter()
+    results = await check_facts_batch(request.sentences, request.k, timings)
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    return {"results": results, "timings": timings}
+
+def encode_event(event, stream_format):
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+def stream_events(events, stream_format, background=None):
+    """
+    Wraps an async iterator of event dicts as an NDJSON (default) or Server-Sent Events response.
+    """
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+
+    async def body():
+        async for event in events:
+            yield encode_event(event, stream_format)
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"},
+                             background=background)
+
+def stream_spooled(events, spool_path, stream_format):
+    """
+    stream_events for a body that takes over an upload's spool file through
+    ingest_events. The upload is closed once the endpoint returns, so the file is
+    spooled beforehand; if the client goes away before the body starts, the body's
+    cleanup never runs and a background task deletes the file instead.
+    """
+    started = False
+
+    async def tracked():
+        nonlocal started
+        started = True
+        async for event in events:
+            yield event
+
+    def discard_unused_spool():
+        if not started:
+            os.remove(spool_path)
+
+    return stream_events(tracked(), stream_format, background=BackgroundTask(discard_unused_spool))
+
+async def ingest_events(store, spool_path, document_id, filename):
+    """
+    Runs a document ingest in a worker thread and yields its progress events, ending
+    with a "document" or "error" event. Removes the spool file when done.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def progress(stage, done, total):
+        loop.call_soon_threadsafe(queue.put_nowait, {"event": "progress", "stage": stage, "done": done, "total": total})
+
+    task = asyncio.create_task(asyncio.to_thread(store.ingest_spooled, spool_path, document_id, filename, progress))
+    getter = None
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            # Progress callbacks are queued on the loop before the thread's result, so this drains them all
+            getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            break
+
+        try:
+            meta, created = task.result()
+        except ValueError:
+            yield {"event": "error", "detail": "could not read PDF"}
+            return
+        yield {"event": "document", **meta, "created": created}
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if task.done():
+            os.remove(spool_path)
+        else:
+            # Client went away mid-ingest; the worker thread still finishes and stores the document
+            def cleanup(done):
+                # Nothing reads the result now; retrieving a failure keeps asyncio from logging it
+                if not done.cancelled():
+                    done.exception()
+                os.remove(spool_path)
+
+            task.add_done_callback(cleanup)
+
+@app.post("/check_facts/stream")
+async def check_facts_stream(request: CheckFactsRequest, format: str = "ndjson"):
+    """
+    Same as /check_facts, but emits a "result" event per sentence as soon as it is ready,
+    then a final "done" event with the batch timings, or an "error" event if the batch
+    failed part way. format is "ndjson" or "sse".
+    """
+    async def events():
+        timings = {}
+        start = time.perf_counter()
+        try:
+            async for indices, response in iter_check_facts(request.sentences, request.k, timings):
+                for i in indices:
+                    yield {"event": "result", "index": i, "sentence": request.sentences[i], "result": response}
+        except Exception as e:
+            # The status line has already been sent, so the failure has to be reported in the stream
+            print(f"Batch check failed: {e!r}")
+            yield {"event": "error", "detail": "batch check failed"}
+            return
+        timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+        yield {"event": "done", "timings": timings}
+
+    return stream_events(events(), format)
+
+async def update_session(session_id, sentences, k):
+    """
+    Diffs sentences against the session's text, checks only the new and edited ones,
+    and returns the delta: verdicts for those, (previous, new) index pairs for the
+    unchanged ones, and the previous indices that were removed.
+    """
+    sessions = get_doc_sessions()
+    timings = {}
+    start = time.perf_counter()
+    diff = await timed(timings, "diff", asyncio.to_thread(sessions.diff, session_id, sentences))
+    if diff is None:
+        raise HTTPException(status_code=404, detail="unknown session_id")
+
+    changed = [sentences[i] for i in diff.changed]
+    results = await check_facts_batch(changed, k, timings) if changed else []
+    try:
+        version = await asyncio.to_thread(sessions.commit, session_id, diff, sentences, results)
+    except SessionConflict:
+        raise HTTPException(status_code=409, detail="session was updated concurrently; resend the document")
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    return {
+        "session_id": session_id,
+        "version": version,
+        "results": [{"index": i, "sentence": sentences[i], "result": result} for i, result in zip(diff.changed, results)],
+        "unchanged": diff.unchanged,
+        "removed": diff.removed,
+        "timings": timings,
+    }
+
+@app.post("/sessions")
+async def create_session(request: CheckFactsRequest):
+    """
+    Starts a document session and checks its sentences. Send later versions of the
+    document to PUT /sessions/{session_id} to have only the changed sentences checked.
+    """
+    session_id = await asyncio.to_thread(get_doc_sessions().create)
+    return await update_session(session_id, request.sentences, request.k)
+
+@app.put("/sessions/{session_id}")
+async def put_session(session_id: str, request: CheckFactsRequest):
+    return await update_session(session_id, request.sentences, request.k)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = await asyncio.to_thread(get_doc_sessions().get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="unknown session_id")
+    return session
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not await asyncio.to_thread(get_doc_sessions().delete, session_id):
+        raise HTTPException(status_code=404, detail="unknown session_id")
+    return {"deleted": session_id}
+
+@app.post("/documents")
+async def upload_document(file: UploadFile = File(...)):
+    """
+    Stores a PDF once and returns its document id (the SHA-256 of the file).
+    Uploading the same bytes again returns the existing id without re-parsing.
+    """
+    try:
+        meta, created = await asyncio.to_thread(get_doc_store().ingest, file.file, file.filename)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="could not read PDF")
+    return {**meta, "created": created}
+
+@app.post("/documents/stream")
+async def upload_document_stream(file: UploadFile = File(...), format: str = "ndjson"):
+    """
+    Same as /documents, but streams "progress" events (pages parsed, chunks embedded)
+    while the PDF is ingested and ends with a "document" event carrying the metadata.
+    """
+    store = get_doc_store()
+    spool_path, document_id = await asyncio.to_thread(store.spool, file.file)
+    return stream_spooled(ingest_events(store, spool_path, document_id, file.filename), spool_path, format)
+
+@app.post("/check_fact_with_document")
+async def check_fact_with_document(request: CheckDocumentRequest):
+    timings = {}
+    faiss_index = await asyncio.to_thread(get_doc_store().get_index, request.document_id)
+    if faiss_index is None:
+        raise HTTPException(status_code=404, detail="unknown document_id")
+
+    # Documents are content-addressed, so their verdicts never go stale
+    source = f"document:{request.document_id}"
+    cache = get_verdict_cache()
+    if cache is not None:
+        cached = await timed(timings, "cache", asyncio.to_thread(cache.lookup, request.sentence, source))
+        if cached is not None:
+            return {**cached, "timings": timings}
+
+    client = get_async_openai_client()
+    claim = await timed(timings, "is_claim", is_claim_async(request.sentence, client))
+    if not claim:
+        response = not_a_claim(claim)
+    else:
+        response = await fact_check_with_index(request.sentence, faiss_index, timings)
+    await remember_verdict(request.sentence, source, response)
+    response["timings"] = timings
+    return response
 
 @app.post("/check_fact_with_pdf")
 async def check_fact_with_pdf(sentence: str = Form(...), file: UploadFile = File(...)):
-    client = get_openai_client()
-    if is_claim(sentence, client) == False:
-        return {
-            "answer": "not a checkable statement",
-            "confidence": 0,
-            "is_false": False,
-            "sources": [],
-            "snippet": ""
-        }
+    timings = {}
+    client = get_async_openai_client()
+    claim = await timed(timings, "is_claim", is_claim_async(sentence, client))
+    if not claim:
+        return {**not_a_claim(claim), "timings": timings}
 
-    pdf_text = extract_text_from_pdf(file)
-    if not pdf_text:
-        return {
-            "answer": "could not read PDF",
-            "confidence": 0,
-            "is_false": False,
-            "sources": [],
-            "snippet": ""
-        }
-
-    faiss_index = FaissIndex()
-    faiss_index.build_index_from_text(pdf_text, title=file.filename)
-    results = faiss_index.query(sentence, k=1)
-    context = ""
-    for r in results:
-        context += r['text']
+    # Goes through the document store, so a PDF that was uploaded before is not parsed again
+    store = get_doc_store()
+    try:
+        meta, _ = await timed(timings, "ingest", asyncio.to_thread(store.ingest, file.file, file.filename))
+    except ValueError:
+        return {**empty_response("could not read PDF"), "timings": timings}
 
-    response = fact_check_with_context(claim=sentence, context=context)
-    response["sources"] = []
+    faiss_index = await asyncio.to_thread(store.get_index, meta["document_id"])
+    response = await fact_check_with_index(sentence, faiss_index, timings)
+    response["document_id"] = meta["document_id"]
+    response["timings"] = timings
     return response
 
+@app.post("/check_fact_with_pdf/stream")
+async def check_fact_with_pdf_stream(sentence: str = Form(...), file: UploadFile = File(...), format: str = "ndjson"):
+    """
+    Streams ingest progress for the uploaded PDF, then a "result" event with the verdict.
+    """
+    store = get_doc_store()
+    spool_path, document_id = await asyncio.to_thread(store.spool, file.file)
+    filename = file.filename
+
+    async def events():
+        timings = {}
+        # Started with the body, so a client that never reads it costs no LLM call;
+        # the claim check runs while the PDF is being ingested
+        claim_task = asyncio.create_task(is_claim_async(sentence, get_async_openai_client()))
+        try:
+            async for event in ingest_events(store, spool_path, document_id, filename):
+                yield event
+                if event["event"] == "error":
+                    yield {"event": "result", "result": empty_response("could not read PDF")}
+                    return
+
+            claim = await claim_task
+            if not claim:
+                yield {"event": "result", "result": not_a_claim(claim)}
+                return
+            faiss_index = await asyncio.to_thread(store.get_index, document_id)
+            response = await fact_check_with_index(sentence, faiss_index, timings)
+            response["document_id"] = document_id
+            response["timings"] = timings
+            yield {"event": "result", "result": response}
+        finally:
+            claim_task.cancel()
+
+    return stream_spooled(events(), spool_path, format)
+
 @app.get("/")
 def root():
     return {"message": "Fact Checker API is running"}
 
+@app.get("/stats")
+def stats():
+    return {
+        "embedder": get_embedder().stats(),
+        "wiki_cache": get_wiki_cache().stats(),
+        "documents": get_doc_store().stats(),
+        "sessions": get_doc_sessions().stats(),
+        "wikidata": get_kg_verifier().stats(),
+        "properties": get_property_resolver().stats(),
+        "tiers": tier_stats.stats(),
+        "verdict_cache": get_verdict_cache().stats() if get_verdict_cache() else None,
+        "singleflight": singleflight_stats(),
+    }
+
+def cache_metrics():
+    """
+    Gauges read from the caches' own counters when /metrics is scraped.
+    """
+    verdict_cache = get_verdict_cache()
+    documents = get_doc_store().stats()
+    document_lookups = documents["ingested"] + documents["reused"]
+    yield ("factcheck_cache_hit_ratio", "gauge", "Share of lookups answered from each cache.", [
+        ({"cache": "wikipedia"}, get_wiki_cache().stats()["hit_ratio"]),
+        ({"cache": "verdict"}, verdict_cache.stats()["hit_ratio"] if verdict_cache else None),
+        ({"cache": "documents"}, round(documents["reused"] / document_lookups, 3) if document_lookups else None),
+    ])
+    embedder = get_embedder().stats()
+    yield ("factcheck_embedder_avg_batch_requests", "gauge", "Query encodes served per forward pass.", [
+        ({}, embedder["avg_batch_requests"]),
+    ])
+    yield ("factcheck_process_resident_memory_mib", "gauge", "Resident set size of this process.", [
+        ({}, embedder["process_rss_mib"]),
+    ])
+    yield ("factcheck_singleflight_calls_total", "counter", "Calls executed or coalesced by each single-flight group.", [
+        ({"group": name, "result": result}, flight[result])
+        for name, flight in singleflight_stats().items() for result in ("executions", "coalesced")
+    ])
+    yield ("factcheck_tier_answers_total", "counter", "/check_fact claims answered by each tier.", [
+        ({"tier": tier}, tier_stat["count"]) for tier, tier_stat in tier_stats.stats().items()
+    ])
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics([cache_metrics]), media_type=METRICS_CONTENT_TYPE)
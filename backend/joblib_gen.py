@@ -1,31 +1,34 @@
 import joblib
 import os
+from triple_store import DEFAULT_STORE_DIR, WIKIDATA5M_FILES, build_triple_store, iter_triple_files
+
+def convert_joblib(joblib_file="triples.joblib", store_dir=DEFAULT_STORE_DIR):
+    """
+    Converts a set of (h, r, t) tuples pickled by the old generate_joblib into the
+    memory-mapped triple store.
+    """
+    print(f"Converting {joblib_file} to {store_dir}...")
+    triples = joblib.load(joblib_file)
+    meta = build_triple_store(triples, store_dir)
+    print(f"Saved {meta['triples']:,} triples to {store_dir}")
+    return meta
 
 def generate_joblib():
     # Folder where your txt files are stored
     path = os.getcwd()
     folder = f"{path}/data"  # adjust this to your path
 
-    # Output file
+    # The triples now live in a memory-mapped store instead of a pickled set
+    store_dir = os.getenv("TRIPLE_STORE_DIR", DEFAULT_STORE_DIR)
     joblib_file = "triples.joblib"
 
     # Check if already exists
-    if os.path.exists(joblib_file):
-        print(f"{joblib_file} already exists, skipping build.")
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        print(f"{store_dir} already exists, skipping build.")
+    elif os.path.exists(joblib_file):
+        convert_joblib(joblib_file, store_dir)
     else:
-        print("Building triples set...")
-        files = [
-            os.path.join(folder, "wikidata5m_transductive_train.txt"),
-            os.path.join(folder, "wikidata5m_transductive_valid.txt"),
-            os.path.join(folder, "wikidata5m_transductive_test.txt")
-        ]
-        triples = set()
-        for file in files:
-            with open(file, "r", encoding="utf-8") as f:
-                for line in f:
-                    h, r, t = line.strip().split()
-                    triples.add((h, r, t))
-        
-        # Save to .joblib
-        joblib.dump(triples, joblib_file)
-        print(f"Saved {len(triples):,} triples to {joblib_file}")
+        print("Building triple store...")
+        files = [os.path.join(folder, name) for name in WIKIDATA5M_FILES]
+        meta = build_triple_store(iter_triple_files(files), store_dir)
+        print(f"Saved {meta['triples']:,} triples to {store_dir}")
@@ -0,0 +1,229 @@
+"""
+Knowledge-graph tier of the fact checker: answers a claim straight from the local
+Wikidata5M triples when its extracted (subject, relation, object) ids settle it.
+
+    contradicted  some triplet's r can only have one value (sex or gender,
+                  father, mother), the store has a value for (h, r) and
+                  it isn't t                                              -> "false"
+    supported     every extracted triplet resolves to ids and either its
+                  exact (h, r, t) triple is in the store, or r is a place
+                  or class relation and t contains a stored value along
+                  P131/P279 (born in Honolulu, so born in Hawaii)         -> "true"
+    unresolved    anything else; the claim goes on to the Wikipedia RAG tier
+
+A contradiction wins over support: the extraction prompt asks for several triplets,
+so a true but beside-the-point one like (Barack Obama, instance of, human) must not
+outvote the triplet the claim is actually about. Wikidata5M is incomplete, so a
+missing triple is never treated as evidence that a claim is false unless the
+relation can only have one value. Even then a contradiction needs the relation
+text to be an exact label or alias of the property (not a fuzzy or searched
+guess) and neither entity alias to be shared by several entities, since either
+lookup may have picked the wrong id. Places of birth and death and capitals are
+never contradicted: a birthplace stored at another granularity, a former capital
+or one of a country's several capitals isn't evidence against the claim.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from entity_index import get_entity_index
+from property_index import get_property_resolver
+from sentence_pre import convert_triplet_to_ids
+from triple_store import get_triple_store
+
+# Relations with a single value per subject, so a different stored value contradicts the claim
+FUNCTIONAL_RELATIONS = {
+    "P21": "sex or gender",
+    "P22": "father",
+    "P25": "mother",
+}
+
+# Relations whose object can be widened: (h, r, x) and x within t (P131 or P279, repeatedly) imply (h, r, t)
+WIDENING_RELATIONS = {
+    "P19": "place of birth",
+    "P20": "place of death",
+    "P31": "instance of",
+    "P131": "located in the administrative territorial entity",
+    "P159": "headquarters location",
+    "P276": "location",
+    "P279": "subclass of",
+}
+# Edges followed upwards when widening, and how far
+CONTAINMENT_RELATIONS = ("P131", "P279")
+MAX_CONTAINMENT_HOPS = 6
+
+
+def wikidata_link(item_id: str) -> str:
+    return f"https://www.wikidata.org/wiki/{item_id}"
+
+
+class KGVerifier:
+    """
+    Checks extracted text triplets against the entity index and triple store. Both
+    are memory-mapped and read-only, so one verifier is shared by all requests.
+    """
+
+    def __init__(self, entity_index, triple_store, property_resolver=None):
+        self.entity_index = entity_index
+        self.triple_store = triple_store
+        self.property_resolver = property_resolver or get_property_resolver()
+        self._lock = threading.Lock()
+        self.counters = {"checked": 0, "supported": 0, "contradicted": 0, "unresolved": 0, "ambiguous": 0,
+                         "inexact_relation": 0, "widened": 0}
+        self.total_ms = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.entity_index is not None and self.triple_store is not None
+
+    def _resolve(self, sentence: str, triplet: Dict[str, str]) -> Optional[tuple]:
+        ids = convert_triplet_to_ids(sentence, triplet, self.entity_index)
+        # convert_triplet_to_ids falls back to (subject text, sentence) when anything is unknown
+        if len(ids) != 3 or not ids[2].startswith("Q"):
+            return None
+        return ids
+
+    def _ambiguous(self, triplet: Dict[str, str]) -> bool:
+        return any(self.entity_index.is_ambiguous(triplet.get(part, "").lower()) for part in ("subject", "object"))
+
+    def _within(self, item: str, container: str) -> bool:
+        """
+        Whether container is reached from item by following P131/P279 edges upwards.
+        """
+        frontier, seen = [item], {item}
+        for _ in range(MAX_CONTAINMENT_HOPS):
+            frontier = [parent for node in frontier for r in CONTAINMENT_RELATIONS
+                        for parent in self.triple_store.tails_for(node, r) if parent not in seen]
+            if container in frontier:
+                return True
+            if not frontier:
+                return False
+            seen.update(frontier)
+        return False
+
+    def verify(self, sentence: str, text_triplets: List[Dict[str, str]]) -> Optional[Dict]:
+        """
+        Returns a fact-check response if the triples decide the claim, else None.
+        """
+        start = time.perf_counter()
+        supported, contradicted = [], None
+        undecided = not text_triplets
+        ambiguous = inexact = widened = False
+        for triplet in text_triplets:
+            ids = self._resolve(sentence, triplet)
+            if ids is None:
+                undecided = True
+                continue
+            h, r, t = ids
+            if self.triple_store.contains(h, r, t):
+                supported.append((triplet, ids, None))
+                continue
+            known = self.triple_store.tails_for(h, r)
+            if r in WIDENING_RELATIONS:
+                via = next((value for value in known if self._within(value, t)), None)
+                if via is not None:
+                    supported.append((triplet, ids, via))
+                    widened = True
+                    continue
+            undecided = True
+            if contradicted is None and r in FUNCTIONAL_RELATIONS and known:
+                if self.property_resolver.exact(triplet.get("relation_text", "")) != r:
+                    inexact = True
+                elif self._ambiguous(triplet):
+                    ambiguous = True
+                else:
+                    contradicted = (triplet, ids, known)
+
+        if contradicted is not None:
+            triplet, (h, r, t), known = contradicted
+            response = {
+                "answer": "false",
+                "confidence": 4,
+                "is_false": True,
+                "sources": [{"name": f"Wikidata: {triplet.get('subject', h)}", "link": wikidata_link(h)}],
+                "snippet": f"{triplet.get('subject')} ({h}) {FUNCTIONAL_RELATIONS[r]} ({r}) is {', '.join(known)}, not {t}",
+            }
+            outcome = "contradicted"
+        elif supported and not undecided:
+            triplet, (h, r, t), _ = supported[0]
+            response = {
+                "answer": "true",
+                "confidence": 5,
+                "is_false": False,
+                "sources": [{"name": f"Wikidata: {triplet.get('subject', h)}", "link": wikidata_link(h)}],
+                "snippet": "; ".join(
+                    f"{triplet.get('subject')} ({h}) {triplet.get('relation_text')} ({r}) "
+                    + (f"{triplet.get('object')} ({t})" if via is None else f"{via}, within {triplet.get('object')} ({t})")
+                    for triplet, (h, r, t), via in supported
+                ),
+            }
+            outcome = "supported"
+        else:
+            response = None
+            outcome = "unresolved"
+
+        with self._lock:
+            self.counters["checked"] += 1
+            self.counters[outcome] += 1
+            self.counters["ambiguous"] += ambiguous
+            self.counters["inexact_relation"] += inexact
+            self.counters["widened"] += widened
+            self.total_ms += (time.perf_counter() - start) * 1000
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            checked = self.counters["checked"]
+            return {
+                **self.counters,
+                "available": self.available,
+                "avg_ms": round(self.total_ms / checked, 2) if checked else 0.0,
+            }
+
+
+class TierStats:
+    """
+    Which tier answered each /check_fact claim and how long the whole request took,
+    so the share of claims that skipped Wikipedia and the verdict LLM call is visible.
+    Requests that waited on an identical in-flight check count as "coalesced".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.total_ms: Dict[str, float] = {}
+
+    def record(self, tier: str, elapsed_ms: float):
+        with self._lock:
+            self.counts[tier] = self.counts.get(tier, 0) + 1
+            self.total_ms[tier] = self.total_ms.get(tier, 0.0) + elapsed_ms
+
+    def stats(self) -> Dict:
+        with self._lock:
+            answered = sum(self.counts.values())
+            return {
+                tier: {
+                    "count": count,
+                    "share": round(count / answered, 3),
+                    "avg_ms": round(self.total_ms[tier] / count, 1),
+                }
+                for tier, count in self.counts.items()
+            }
+
+
+_kg_verifier = None
+_kg_verifier_lock = threading.Lock()
+
+
+def get_kg_verifier() -> KGVerifier:
+    """
+    Returns the process-wide KGVerifier. It is unavailable (and every claim goes to
+    Wikipedia) when either the entity index or the triple store hasn't been built.
+    """
+    global _kg_verifier
+    if _kg_verifier is None:
+        with _kg_verifier_lock:
+            if _kg_verifier is None:
+                _kg_verifier = KGVerifier(get_entity_index(), get_triple_store())
+    return _kg_verifier
@@ -0,0 +1,292 @@
+"""
+Per-stage latency metrics and request tracing, exported in the Prometheus text format.
+
+Pipeline code wraps each stage in span("stage"), which feeds the
+factcheck_stage_seconds histogram and the factcheck_stage_in_flight gauge. LLM calls
+go through llm_call(), which also counts tokens. MetricsMiddleware times whole
+requests and tracks how many are in flight.
+
+A request sent with "X-Trace: 1" gets a Server-Timing header listing the stages that
+finished before the response started, and one JSON line per request is printed with
+every stage, including those that ran while a streamed response was being sent.
+Untraced requests only pay for the histogram update, so tracing can stay available
+under load.
+
+No prometheus_client dependency: the few metric types needed are kept here, each
+behind one lock, and rendered on scrape.
+"""
+
+import contextvars
+import itertools
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; from a FAISS search on a small index to a cold textbook ingest
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TRACE_HEADER = b"x-trace"
+
+# (name, type, help, [(labels, value)]) from collectors registered by the app
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+_metrics: List["_Metric"] = []
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                for labels, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (not cumulative) + overflow, sum]
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        lines = []
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("factcheck_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+stage_in_flight = Gauge("factcheck_stage_in_flight", "Pipeline stages currently running.", ("stage",))
+request_seconds = Histogram("factcheck_request_seconds", "Time to answer an HTTP request, until the response is fully sent.",
+                            ("endpoint",))
+requests_total = Counter("factcheck_requests_total", "HTTP requests answered.", ("endpoint", "status"))
+requests_in_flight = Gauge("factcheck_requests_in_flight", "HTTP requests currently being handled.")
+llm_seconds = Histogram("factcheck_llm_seconds", "Latency of LLM chat completion calls.", ("call",))
+llm_calls = Counter("factcheck_llm_calls_total", "LLM chat completion calls.", ("call", "outcome"))
+llm_tokens = Counter("factcheck_llm_tokens_total", "Tokens used by LLM calls.", ("call", "kind"))
+
+
+# --- Tracing ---
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        # (stage, start ms, duration ms); appended from worker threads too, which is safe for a list
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, stage: str, start: float, seconds: float):
+        self.spans.append((stage, round((start - self.start) * 1000, 2), round(seconds * 1000, 2)))
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, _, ms in self.spans)
+
+    def to_json(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "spans": [{"stage": stage, "start_ms": start, "duration_ms": ms} for stage, start, ms in self.spans],
+        }
+
+
+# asyncio tasks and asyncio.to_thread copy the context, so spans in both land on the request's trace
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_trace_ids = itertools.count(1)
+
+
+def observe_stage(stage: str, start: float, seconds: float):
+    """
+    Records a stage that ran for seconds from perf_counter() time start.
+    """
+    stage_seconds.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, start, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times the block as one run of stage. Exceptions still count, so slow failures show up.
+    """
+    stage_in_flight.inc(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, start, time.perf_counter() - start)
+        stage_in_flight.dec(stage)
+
+
+@contextmanager
+def llm_call(call: str):
+    """
+    Times an LLM call and counts it. The block calls the yielded function with the
+    completion so its token usage is counted.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+
+    def record(response):
+        nonlocal outcome
+        outcome = "ok"
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            llm_tokens.inc(call, "prompt", amount=usage.prompt_tokens or 0)
+            llm_tokens.inc(call, "completion", amount=usage.completion_tokens or 0)
+
+    with span(f"llm_{call}"):
+        try:
+            yield record
+        finally:
+            llm_seconds.observe(time.perf_counter() - start, call)
+            llm_calls.inc(call, outcome)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, and tracing those that ask for it.
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses pass straight
+    through and the per-request cost stays a couple of dict lookups.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = None
+        if dict(scope["headers"]).get(TRACE_HEADER, b"").lower() in (b"1", b"true", b"yes"):
+            trace = Trace(f"{next(_trace_ids):x}")
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec()
+            # The router fills in the endpoint; labelling by it keeps unknown paths from adding series
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            request_seconds.observe(elapsed, endpoint)
+            requests_total.inc(endpoint, str(status))
+            _current_trace.reset(token)
+            if trace is not None:
+                print(json.dumps({"trace": {**trace.to_json(), "path": scope["path"], "status": status,
+                                            "duration_ms": round(elapsed * 1000, 2)}}))
+
+
+# --- Exposition ---
+
+def render(collectors: Iterable[Callable[[], Iterable[Family]]] = ()) -> str:
+    """
+    All metrics in the Prometheus text format. collectors add gauges computed at
+    scrape time, such as cache hit ratios.
+    """
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,207 @@
+"""
+PDF text extraction fanned out over a process pool.
+
+PyPDF2 is pure Python, so extracting a textbook is CPU-bound and a thread pool would
+just take turns on the GIL. Each worker process opens the spooled file itself and
+extracts a range of pages, so only page texts cross the process boundary, never the
+PDF bytes. Pages come back in order as soon as their range is done, which lets the
+caller chunk and embed the start of a document while the rest is still being
+extracted. Only a bounded number of ranges are in flight at once.
+
+A page that fails to extract is reported (PdfPage.error) rather than silently left
+out; a file that can't be opened at all raises PdfError.
+
+    python pdf_extract.py bench "../Dasgupta-Papadimitriou-Vazirani (1).pdf" --workers 0,2,4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import PyPDF2
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+
+
+class PdfError(ValueError):
+    pass
+
+
+@dataclass
+class PdfPage:
+    number: int  # 0-based
+    text: str
+    error: Optional[str] = None
+
+
+def _extract_range(path: str, start: int, end: int) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    Worker: extracts pages [start, end) of the PDF at path.
+    """
+    try:
+        pages = PyPDF2.PdfReader(path).pages
+    except Exception as e:
+        return [(number, "", f"{type(e).__name__}: {e}") for number in range(start, end)]
+    results = []
+    for number in range(start, end):
+        try:
+            results.append((number, pages[number].extract_text() or "", None))
+        except Exception as e:
+            results.append((number, "", f"{type(e).__name__}: {e}"))
+    return results
+
+
+def count_pages(path: str) -> int:
+    """
+    Raises PdfError if the file can't be read as a PDF.
+    """
+    try:
+        return len(PyPDF2.PdfReader(path).pages)
+    except Exception as e:
+        raise PdfError(f"could not read PDF: {e}") from e
+
+
+class PdfExtractor:
+    def __init__(self, max_workers: int = 4, pages_per_task: int = 8):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # Ingests of different documents extract pages on their own threads
+        self._counters_lock = threading.Lock()
+        self.counters = {"documents": 0, "pages": 0, "failed_pages": 0}
+
+    @classmethod
+    def from_env(cls) -> "PdfExtractor":
+        return cls(
+            max_workers=int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1))),
+            pages_per_task=int(os.getenv("PDF_PAGES_PER_TASK", 8)),
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn, not fork: the server process has model, HTTP and event-loop threads
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def iter_pages(self, path: str, num_pages: Optional[int] = None) -> Iterator[PdfPage]:
+        """
+        Yields every page of the PDF at path in order. Raises PdfError if the file
+        can't be opened. Pass num_pages if the caller already called count_pages().
+        """
+        if num_pages is None:
+            num_pages = count_pages(path)
+        self._count("documents")
+        ranges = [(start, min(start + self.pages_per_task, num_pages))
+                  for start in range(0, num_pages, self.pages_per_task)]
+
+        if self.max_workers <= 0 or len(ranges) <= 1:
+            results = (_extract_range(path, start, end) for start, end in ranges)
+            yield from self._pages(results)
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        next_range = iter(ranges)
+
+        def fill():
+            # A couple of ranges per worker keeps them busy without buffering the whole document
+            while len(pending) < 2 * self.max_workers:
+                page_range = next(next_range, None)
+                if page_range is None:
+                    return
+                pending.append(pool.submit(_extract_range, path, *page_range))
+
+        def results():
+            fill()
+            while pending:
+                result = pending.popleft().result()
+                fill()
+                yield result
+
+        try:
+            yield from self._pages(results())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _pages(self, results) -> Iterator[PdfPage]:
+        for result in results:
+            for number, text, error in result:
+                self._count("pages")
+                if error is not None:
+                    self._count("failed_pages")
+                    print(f"Could not extract page {number + 1}: {error}")
+                yield PdfPage(number, text, error)
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            return {**self.counters, "workers": self.max_workers}
+
+
+_pdf_extractor = None
+_pdf_extractor_lock = threading.Lock()
+
+
+def get_pdf_extractor() -> PdfExtractor:
+    """
+    Returns the process-wide PdfExtractor; its worker processes start on first use.
+    """
+    global _pdf_extractor
+    if _pdf_extractor is None:
+        with _pdf_extractor_lock:
+            if _pdf_extractor is None:
+                _pdf_extractor = PdfExtractor.from_env()
+    return _pdf_extractor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time PDF extraction with different worker counts.")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", default="0,2,4", help="comma-separated; 0 extracts in this process")
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    args = parser.parse_args()
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        extractor = PdfExtractor(max_workers=workers, pages_per_task=args.pages_per_task)
+        if workers:
+            # Start the worker processes before timing
+            list(extractor._get_pool().map(int, range(workers)))
+        start = time.perf_counter()
+        first_page = None
+        chars = 0
+        for page in extractor.iter_pages(args.pdf):
+            if first_page is None:
+                first_page = time.perf_counter() - start
+            chars += len(page.text)
+        results.append({
+            "workers": workers,
+            "seconds": round(time.perf_counter() - start, 2),
+            "first_page_seconds": round(first_page or 0, 3),
+            "chars": chars,
+            **extractor.stats(),
+        })
+        extractor.close()
+    print(json.dumps(results, indent=2))
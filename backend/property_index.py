@@ -0,0 +1,269 @@
+"""
+Resolves a relation phrase from an extracted triplet ("place of birth", "was born in")
+to a Wikidata property id without a network round trip per triplet.
+
+Lookups go, in order, through:
+
+    exact    normalized label/alias from the Wikidata5M relation file
+             (data/wikidata5m_relation.txt, one "P<id>\tlabel\talias..." line each)
+    fuzzy    closest alias by difflib ratio, above PROPERTY_FUZZY_CUTOFF
+    cache    earlier answers from wbsearchentities, persisted in SQLite so every
+             worker process shares them, with the least recently used evicted
+    network  wbsearchentities itself, only if WIKIDATA_PROPERTY_FALLBACK is on
+
+    python property_index.py "was born in" "capital city"
+"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+
+DEFAULT_RELATION_FILE = "data/wikidata5m_relation.txt"
+WIKIDATA_API_URL = os.getenv("WIKIDATA_API_URL", "https://www.wikidata.org/w/api.php")
+USER_AGENT = "GeminiFactChecker/1.0 (https://example.com; user@example.com)"
+
+# Memo marker for phrases not looked up yet; None memoizes "no fuzzy match"
+_NOT_MEMOIZED = object()
+
+# Auxiliaries LLMs like to put in front of a relation ("was born in", "has capital")
+LEADING_AUXILIARIES = ("is ", "are ", "was ", "were ", "has ", "have ", "had ")
+
+
+def normalize_relation(text: str) -> str:
+    text = re.sub(r"[_\-]+", " ", text.lower())
+    text = re.sub(r"[^\w\s]", "", text)
+    return " ".join(text.split())
+
+
+def _strip_auxiliary(text: str) -> str:
+    for prefix in LEADING_AUXILIARIES:
+        if text.startswith(prefix):
+            return text[len(prefix):]
+    return text
+
+
+def load_property_aliases(relation_file: str) -> Dict[str, str]:
+    """
+    Maps every normalized label and alias in the relation file to its property id.
+    The first property listing an alias keeps it.
+    """
+    aliases = {}
+    with open(relation_file, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split("\t")
+            if len(parts) < 2 or not parts[0].startswith("P"):
+                continue
+            for alias in parts[1:]:
+                aliases.setdefault(normalize_relation(alias), parts[0])
+    return aliases
+
+
+class PropertyResolver:
+    """
+    In-process relation text -> "P<id>" lookup. The alias table is a few thousand
+    entries, so it is held as a plain dict; answers are memoized per phrase.
+    """
+
+    def __init__(self, relation_file: str, fuzzy_cutoff: float = 0.85, network_fallback: bool = True,
+                 cache_path: Optional[str] = None, cache_entries: int = 10000, timeout: float = 5.0):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.network_fallback = network_fallback
+        self.cache_path = cache_path
+        self.cache_entries = cache_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._db = None
+        self._db_pid = None
+        self.counters = {"exact": 0, "fuzzy": 0, "cache": 0, "network": 0, "miss": 0}
+
+        self.aliases: Dict[str, str] = {}
+        if os.path.exists(relation_file):
+            start = time.perf_counter()
+            self.aliases = load_property_aliases(relation_file)
+            print(f"Loaded {len(self.aliases):,} property aliases in {time.perf_counter() - start:.2f}s")
+        else:
+            print(f"Warning: {relation_file} not found; property lookups will use wbsearchentities")
+        self._alias_list = list(self.aliases)
+        self._memo: Dict[str, Optional[str]] = {}
+
+
+    @classmethod
+    def from_env(cls) -> "PropertyResolver":
+        return cls(
+            relation_file=os.getenv("PROPERTY_FILE", DEFAULT_RELATION_FILE),
+            fuzzy_cutoff=float(os.getenv("PROPERTY_FUZZY_CUTOFF", 0.85)),
+            network_fallback=os.getenv("WIKIDATA_PROPERTY_FALLBACK", "1") == "1",
+            cache_path=os.getenv("PROPERTY_CACHE_PATH", "cache/properties.sqlite"),
+            cache_entries=int(os.getenv("PROPERTY_CACHE_ENTRIES", 10000)),
+            timeout=float(os.getenv("WIKIDATA_TIMEOUT", 5)),
+        )
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.counters[outcome] += 1
+
+    def _remote(self) -> sqlite3.Connection:
+        """
+        The cache of network answers; None records a search that found nothing. Opened
+        per process, since the resolver is created before serve.py forks its workers.
+        Call with self._lock held.
+        """
+        if self._db is None or self._db_pid != os.getpid():
+            path = self.cache_path or ":memory:"
+            if self.cache_path:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS properties (
+                    key TEXT PRIMARY KEY,
+                    property_id TEXT,
+                    last_used REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS properties_last_used ON properties (last_used)")
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _exact(self, key: str) -> Optional[str]:
+        for candidate in (key, _strip_auxiliary(key)):
+            if candidate in self.aliases:
+                return self.aliases[candidate]
+        return None
+
+    def exact(self, relation_text: str) -> Optional[str]:
+        """
+        The property whose label or alias is exactly relation_text (after normalizing),
+        or None; unlike resolve(), never a fuzzy or wbsearchentities guess.
+        """
+        return self._exact(normalize_relation(relation_text))
+
+    def _local(self, key: str) -> Optional[str]:
+        property_id = self._exact(key)
+        if property_id:
+            self._count("exact")
+            return property_id
+
+        property_id = self._memo.get(key, _NOT_MEMOIZED)
+        if property_id is _NOT_MEMOIZED:
+            matches = difflib.get_close_matches(_strip_auxiliary(key), self._alias_list, n=1, cutoff=self.fuzzy_cutoff)
+            property_id = self.aliases[matches[0]] if matches else None
+            with self._lock:
+                if len(self._memo) >= self.cache_entries:
+                    self._memo.clear()
+                self._memo[key] = property_id
+        # A memoized fuzzy match is still a fuzzy answer, so it is counted as one
+        if property_id:
+            self._count("fuzzy")
+        return property_id
+
+    def resolve(self, relation_text: str) -> Optional[str]:
+        key = normalize_relation(relation_text)
+        if not key:
+            return None
+        property_id = self._local(key)
+        if property_id:
+            return property_id
+
+        with self._lock:
+            db = self._remote()
+            row = db.execute("SELECT property_id FROM properties WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE properties SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.counters["cache"] += 1
+                return row[0]
+        if not self.network_fallback:
+            self._count("miss")
+            return None
+
+        property_id, ok = self._search(relation_text)
+        if not ok:
+            # Don't remember transient failures
+            self._count("miss")
+            return None
+        self._count("network" if property_id else "miss")
+        self._remember(key, property_id)
+        return property_id
+
+    def _search(self, relation_text: str):
+        """
+        Asks wbsearchentities for the single best property. Returns (property id, ok).
+        """
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.headers["User-Agent"] = USER_AGENT
+        params = {
+            "action": "wbsearchentities",
+            "format": "json",
+            "language": "en",
+            "type": "property",
+            "search": relation_text,
+            "limit": 1
+        }
+        try:
+            response = self._session.get(WIKIDATA_API_URL, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"API Error searching for property '{relation_text}': {e}")
+            return None, False
+        if data.get("search"):
+            return data["search"][0]["id"], True
+        return None, True
+
+    def _remember(self, key: str, property_id: Optional[str]):
+        # One row per answer, so workers adding entries at the same time don't overwrite each other's
+        with self._lock:
+            db = self._remote()
+            db.execute("INSERT OR REPLACE INTO properties (key, property_id, last_used) VALUES (?, ?, ?)",
+                       (key, property_id, time.time()))
+            (count,) = db.execute("SELECT COUNT(*) FROM properties").fetchone()
+            if count > self.cache_entries:
+                db.execute("DELETE FROM properties WHERE key IN (SELECT key FROM properties ORDER BY last_used LIMIT ?)",
+                           (count - self.cache_entries,))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (cached,) = self._remote().execute("SELECT COUNT(*) FROM properties").fetchone()
+            return {**self.counters, "aliases": len(self.aliases), "cached": cached}
+
+
+_property_resolver = None
+_property_resolver_lock = threading.Lock()
+
+
+def get_property_resolver() -> PropertyResolver:
+    """
+    Returns the process-wide PropertyResolver, configured from the environment on first use.
+    """
+    global _property_resolver
+    if _property_resolver is None:
+        with _property_resolver_lock:
+            if _property_resolver is None:
+                _property_resolver = PropertyResolver.from_env()
+    return _property_resolver
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve relation phrases to Wikidata property ids.")
+    parser.add_argument("relations", nargs="+")
+    args = parser.parse_args()
+
+    resolver = get_property_resolver()
+    for relation in args.relations:
+        start = time.perf_counter()
+        property_id = resolver.resolve(relation)
+        print(f"{relation!r} -> {property_id} ({(time.perf_counter() - start) * 1000:.2f} ms)")
+    print(json.dumps(resolver.stats(), indent=2))
@@ -0,0 +1,292 @@
+"""
+Two-stage retrieval for FaissIndex: a BM25 pass over the chunk texts picks a few
+candidates, and only those are embedded and scored against the claim.
+
+Dense retrieval embeds every chunk of an article before the first query, although
+only the best one or two are ever used. In lexical mode chunk embeddings are
+computed the first time BM25 proposes the chunk (LazyEmbeddings) and kept, so a
+cold article costs a handful of chunk encodes instead of all of them.
+
+The mode is chosen per source:
+
+    WIKIPEDIA_RETRIEVAL=dense|lexical   WIKIPEDIA_LEXICAL_CANDIDATES=8
+    DOCUMENT_RETRIEVAL=dense|lexical    DOCUMENT_LEXICAL_CANDIDATES=8
+
+    python retrieval.py bench --pages pages.json --claims claims.txt
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+from embedder import EmbeddingService
+
+# --- Configuration ---
+load_dotenv()
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "he", "in", "is", "it", "its", "of",
+    "on", "or", "that", "the", "to", "was", "were", "will", "with", "this", "which", "who", "his", "her", "their",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class RetrievalSpec:
+    kind: str = "dense"
+    candidates: int = 8
+
+    @classmethod
+    def from_env(cls, source: str) -> "RetrievalSpec":
+        """
+        Reads <SOURCE>_RETRIEVAL and <SOURCE>_LEXICAL_CANDIDATES, e.g. source="wikipedia".
+        """
+        prefix = source.upper()
+        kind = os.getenv(f"{prefix}_RETRIEVAL", "dense").lower()
+        if kind not in ("dense", "lexical"):
+            raise ValueError(f"{prefix}_RETRIEVAL must be 'dense' or 'lexical', not {kind!r}")
+        return cls(kind=kind, candidates=int(os.getenv(f"{prefix}_LEXICAL_CANDIDATES", 8)))
+
+    @property
+    def lexical(self) -> bool:
+        return self.kind == "lexical"
+
+
+class BM25:
+    """
+    Okapi BM25 over a fixed list of texts, kept as an inverted index so a query only
+    touches the chunks that share a term with it.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List] = defaultdict(list)  # term -> [(row, term frequency)]
+        lengths = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings[term].append((row, tf))
+        self._lengths = np.array(lengths, dtype=np.float32)
+        self._avg_length = float(self._lengths.mean()) if lengths else 0.0
+
+    def scores(self, query: str) -> Dict[int, float]:
+        n = len(self._lengths)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[row] / self._avg_length)
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def top_n(self, query: str, n: int) -> List[int]:
+        """
+        Rows of the n best-matching texts, best first. Texts sharing no term with the
+        query are never returned, so the list can be shorter than n.
+        """
+        scores = self.scores(query)
+        return sorted(scores, key=scores.get, reverse=True)[:n]
+
+
+class LazyEmbeddings:
+    """
+    Embeddings of a fixed list of chunks, each computed the first time it is asked
+    for. Rows not embedded yet are all zeros (real embeddings are unit vectors), so
+    one embeddings.npy holds the partial state. With a directory set, new rows are
+    written into that file in place through a writable memory map, so embedding a
+    few chunks costs a few rows of I/O rather than a rewrite of the whole file, and
+    processes sharing the file keep each other's rows.
+    """
+
+    def __init__(self, chunks: Sequence[str], embedder: EmbeddingService, vectors: Optional[np.ndarray] = None,
+                 directory: Optional[str] = None):
+        self.chunks = chunks
+        self.embedder = embedder
+        self.directory = directory
+        if vectors is None:
+            vectors = np.zeros((len(chunks), embedder.dimension), dtype=np.float32)
+        self.vectors = vectors
+        self.embedded = np.any(vectors, axis=1)
+        self._lock = threading.Lock()
+        self._stored = None  # writable memory map of directory's embeddings.npy
+        self._stored_directory = None
+
+    @classmethod
+    def load(cls, directory: str, chunks: Sequence[str], embedder: EmbeddingService) -> "LazyEmbeddings":
+        """
+        Reads what save() wrote; the vectors stay memory-mapped.
+        Raises OSError/ValueError if the file is missing or unreadable.
+        """
+        vectors = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        return cls(chunks, embedder, vectors, directory)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def num_embedded(self) -> int:
+        return int(self.embedded.sum())
+
+    def rows(self, rows: Sequence[int]) -> np.ndarray:
+        """
+        Returns the embeddings of the given rows, embedding the missing ones in one call.
+        """
+        rows = list(rows)
+        with self._lock:
+            missing = [row for row in rows if not self.embedded[row]]
+            if missing:
+                encoded = self.embedder.encode([self.chunks[row] for row in missing])
+                stored = self._persist(missing, encoded)
+                if not self.vectors.flags.writeable:
+                    # The writable map holds the same file, so it replaces the read-only one without a copy
+                    self.vectors = stored if stored is not None else np.array(self.vectors)
+                self.vectors[missing] = encoded
+                self.embedded[missing] = True
+            return np.ascontiguousarray(self.vectors[rows], dtype=np.float32)
+
+    def all(self) -> np.ndarray:
+        return self.rows(range(len(self.chunks)))
+
+    def save(self, directory: str):
+        """
+        Writes the vectors into directory and keeps writing new rows back there.
+        """
+        with self._lock:
+            self._write(directory)
+            self.directory = directory
+            self._stored = None
+
+    def _persist(self, rows: List[int], encoded: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Writes newly embedded rows into the directory's embeddings.npy and returns its
+        writable map, or None if there is no directory or the file can't be written.
+        """
+        if self.directory is None:
+            return None
+        try:
+            if self._stored is None or self._stored_directory != self.directory:
+                self._stored = None
+                stored = np.load(os.path.join(self.directory, "embeddings.npy"), mmap_mode="r+")
+                if stored.shape != self.vectors.shape:
+                    raise ValueError(f"embeddings.npy has shape {stored.shape}, expected {self.vectors.shape}")
+                self._stored, self._stored_directory = stored, self.directory
+            self._stored[rows] = encoded
+            self._stored.flush()
+            return self._stored
+        except (OSError, ValueError) as e:
+            # Evicted from the cache meanwhile; the vectors are still good for this process
+            print(f"Could not persist chunk embeddings to {self.directory}: {e}")
+            return None
+
+    def _write(self, directory: str):
+        path = os.path.join(directory, "embeddings.npy")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(tmp, path)
+
+
+# --- Benchmark ---
+
+def _sample_claims(pages: Dict[str, str], n: int, seed: int = 0) -> List[str]:
+    sentences = [s.strip() for text in pages.values() for s in re.split(r"(?<=[.!?])\s+", text)
+                 if 8 <= len(s.split()) <= 40]
+    rng = np.random.default_rng(seed)
+    return [sentences[i] for i in rng.choice(len(sentences), min(n, len(sentences)), replace=False)]
+
+
+def benchmark(pages: Dict[str, str], claims: List[str], embedder: EmbeddingService, chunker,
+              candidates: Sequence[int] = (4, 8, 16), k: int = 1) -> List[Dict]:
+    """
+    Retrieval over the chunks of pages, cold for every claim (as on a cache miss):
+    dense embeds every chunk, lexical only the BM25 candidates. Reports chunks
+    embedded and encode time per claim, recall@k against the dense top-k, and how
+    often the top-k includes a chunk containing the claim verbatim (claims sampled
+    from the pages always have one).
+    """
+    chunks = [chunk for text in pages.values() for chunk in chunker(text)]
+    claim_vectors = embedder.encode(claims)
+    sources = [{row for row, chunk in enumerate(chunks) if " ".join(claim.split()) in chunk} for claim in claims]
+    with_source = sum(1 for rows in sources if rows) or 1
+
+    start = time.perf_counter()
+    chunk_vectors = embedder.encode(chunks)
+    dense_seconds = time.perf_counter() - start
+    truth = [list(np.argsort(-(chunk_vectors @ q))[:k]) for q in claim_vectors]
+    results = [{
+        "mode": "dense", "chunks": len(chunks), "embedded_per_claim": len(chunks),
+        "encode_ms_per_claim": round(dense_seconds * 1000, 1), f"recall@{k}": 1.0,
+        f"source@{k}": round(sum(bool(src & set(best)) for src, best in zip(sources, truth)) / with_source, 3),
+    }]
+
+    bm25 = BM25(chunks)
+    for n in candidates:
+        embedded, seconds, hits, source_hits = 0, 0.0, 0, 0
+        for claim, q, expected, source in zip(claims, claim_vectors, truth, sources):
+            rows = bm25.top_n(claim, n) or list(range(min(n, len(chunks))))
+            start = time.perf_counter()
+            vectors = embedder.encode([chunks[row] for row in rows])
+            seconds += time.perf_counter() - start
+            embedded += len(rows)
+            best = {rows[i] for i in np.argsort(-(vectors @ q))[:k]}
+            hits += len(best & set(expected))
+            source_hits += bool(best & source)
+        results.append({
+            "mode": f"lexical/{n}", "chunks": len(chunks),
+            "embedded_per_claim": round(embedded / len(claims), 1),
+            "encode_ms_per_claim": round(seconds / len(claims) * 1000, 1),
+            f"recall@{k}": round(hits / (len(claims) * k), 3),
+            f"source@{k}": round(source_hits / with_source, 3),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense and BM25-prefiltered retrieval on cold pages.")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--pages", help="JSON file mapping article titles to their plain text "
+                                        "(the stub_wiki.py format); defaults to the stub's pages")
+    parser.add_argument("--claims", help="file with one claim per line; defaults to sentences sampled from the pages")
+    parser.add_argument("--num-claims", type=int, default=50)
+    parser.add_argument("--candidates", default="4,8,16")
+    parser.add_argument("--k", type=int, default=1)
+    args = parser.parse_args()
+
+    from chunking import chunk_text
+    from embedder import get_embedder
+
+    if args.pages:
+        with open(args.pages, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+    else:
+        from stub_wiki import DEFAULT_PAGES
+        pages = DEFAULT_PAGES
+    if args.claims:
+        with open(args.claims, "r", encoding="utf-8") as f:
+            claims = [line.strip() for line in f if line.strip()]
+    else:
+        claims = _sample_claims(pages, args.num_claims)
+
+    embedder = get_embedder()
+    embedder.warm()
+    results = benchmark(pages, claims, embedder, lambda text: chunk_text(text, chunk_size=300, overlap=50),
+                        [int(n) for n in args.candidates.split(",")], args.k)
+    print(json.dumps(results, indent=2))
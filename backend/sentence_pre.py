@@ -4,13 +4,24 @@ import openai
 import os
 import json
 import argparse
-import requests
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Union
 from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+from entity_index import EntityIndex, get_entity_index
+from property_index import get_property_resolver
+from metrics import llm_call
 
 # --- Configuration and Client Initialization ---
 load_dotenv()
 
+LLM_MODEL = "gpt-4o-mini"
+LLM_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 20))
+LLM_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+# "separate" sends is_claim / extract_subject / triplets as their own calls; "fused" asks once
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "separate")
+
+_async_client = None
+
 def get_openai_client() -> openai.OpenAI:
     """
     Initializes and returns the OpenAI client by loading the key from the environment.
@@ -18,12 +29,24 @@ def get_openai_client() -> openai.OpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable not found.")
-    return openai.OpenAI(api_key=api_key)
+    return openai.OpenAI(api_key=api_key, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
 
-# --- OpenAI API Functions ---
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """
+    Returns the process-wide AsyncOpenAI client. Its connection pool is reused by every
+    request; OPENAI_BASE_URL can point it at a local stub server.
+    """
+    global _async_client
+    if _async_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not found.")
+        _async_client = openai.AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES)
+    return _async_client
 
-def is_claim(sentence: str, client: openai.OpenAI) -> bool:
-    # This function remains the same
+# --- Prompts ---
+
+def _is_claim_messages(sentence: str) -> List[Dict[str, str]]:
     prompt_content = f'''
         You are a highly accurate claim detection system. Your task is to analyze a sentence and determine if it makes a factual assertion or claim that can be verified.
         Respond ONLY with a JSON object containing a single key "is_claim" with a boolean value.
@@ -36,24 +59,84 @@ def is_claim(sentence: str, client: openai.OpenAI) -> bool:
         TASK:
         Sentence: "{sentence}" ->
     '''
+    return [
+        {"role": "system", "content": "You are a claim detection system. Respond in JSON format."},
+        {"role": "user", "content": prompt_content}
+    ]
+
+def _extract_subject_messages(sentence: str) -> List[Dict[str, str]]:
+    prompt = f'''
+    What is the main subject of the following sentence?
+    Sentence: "{sentence}"
+    Respond with only the subject. You must respond with only the name of the subject, and nothing else.
+    '''
+    return [
+        {"role": "system", "content": "You are a subject extraction system."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _fused_messages(sentence: str, k: int) -> List[Dict[str, str]]:
+    system_prompt = (
+        "You are a fused preprocessing system for a fact checker. For the user's sentence, decide in one pass: "
+        "(1) 'is_claim': whether it makes a factual assertion that can be verified (opinions, questions and nonsense are not claims); "
+        "(2) 'subject': the name of its main subject, and nothing else; "
+        f"(3) 'triplets': up to {k} distinct factual triplets, each with 'subject' (a specific named entity), 'object' (string) "
+        "and 'relation_text' (the canonical English name of the Wikidata property, e.g., 'author', 'country of origin', 'instance of'). "
+        "Respond ONLY with a JSON object with the keys 'is_claim' (boolean), 'subject' (string) and 'triplets' (list). "
+        "If the sentence is not a claim, 'subject' may be empty and 'triplets' must be an empty list."
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Sentence: '{sentence}'\nk={k}"}
+    ]
+
+# --- Response Schemas ---
+
+class Triplet(BaseModel):
+    subject: str
+    relation_text: str
+    object: str
+
+class FusedPreprocess(BaseModel):
+    is_claim: bool
+    subject: str = ""
+    triplets: List[Triplet] = []
+
+# --- OpenAI API Functions ---
+
+def is_claim(sentence: str, client: openai.OpenAI) -> bool:
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a claim detection system. Respond in JSON format."},
-                {"role": "user", "content": prompt_content}
-            ]
-        )
+        with llm_call("is_claim") as record:
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=_is_claim_messages(sentence)
+            )
+            record(response)
         return json.loads(response.choices[0].message.content).get("is_claim", False)
     except (openai.APIError, json.JSONDecodeError) as e:
         print(f"Error checking claim: {e}")
         return False
 
-def extract_k_text_triplets(sentence: str, k: int, client: openai.OpenAI) -> List[Dict[str, str]]:
+async def is_claim_async(sentence: str, client: openai.AsyncOpenAI) -> Optional[bool]:
     """
-    Asks the AI to extract up to k distinct factual triplets.
+    None when the LLM call failed or its reply couldn't be read, so callers can tell
+    an outage from a sentence that isn't a claim and avoid caching it as a verdict.
     """
+    try:
+        with llm_call("is_claim") as record:
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=_is_claim_messages(sentence)
+            )
+            record(response)
+        return json.loads(response.choices[0].message.content).get("is_claim", False)
+    except (openai.APIError, json.JSONDecodeError) as e:
+        print(f"Error checking claim: {e}")
+        return None
+
+def _triplet_messages(sentence: str, k: int) -> List[Dict[str, str]]:
     system_prompt = (
         f"You are a knowledge graph expert. Your task is to extract up to {k} different, plausible triplets from the user's sentence. "
         "Each triplet must represent a distinct fact. "
@@ -62,18 +145,43 @@ def extract_k_text_triplets(sentence: str, k: int, client: openai.OpenAI) -> Lis
         "Respond ONLY with a JSON object with a key 'triplets'. "
         "Each object must have three keys: 'subject' (string), 'object' (string), and 'relation_text' (the canonical English name of the Wikidata property, e.g., 'author', 'country of origin', 'instance of')."
     )
+    return [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": f"Sentence: '{sentence}'\nk={k}"
+        }
+    ]
+
+def extract_k_text_triplets(sentence: str, k: int, client: openai.OpenAI) -> List[Dict[str, str]]:
+    """
+    Asks the AI to extract up to k distinct factual triplets.
+    """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": f"Sentence: '{sentence}'\nk={k}"
-                }
-            ]
-        )
+        with llm_call("extract_triplets") as record:
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=_triplet_messages(sentence, k)
+            )
+            record(response)
+        return json.loads(response.choices[0].message.content).get("triplets", [])
+    except (openai.APIError, json.JSONDecodeError) as e:
+        print(f"Error extracting triplets: {e}")
+        return []
+
+async def extract_k_text_triplets_async(sentence: str, k: int, client: openai.AsyncOpenAI) -> List[Dict[str, str]]:
+    """
+    Asks the AI to extract up to k distinct factual triplets without blocking the event loop.
+    """
+    try:
+        with llm_call("extract_triplets") as record:
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=_triplet_messages(sentence, k)
+            )
+            record(response)
         return json.loads(response.choices[0].message.content).get("triplets", [])
     except (openai.APIError, json.JSONDecodeError) as e:
         print(f"Error extracting triplets: {e}")
@@ -83,24 +191,59 @@ def extract_subject(sentence: str, client: openai.OpenAI) -> str:
     """
     Extracts the main subject from a sentence.
     """
-    prompt = f'''
-    What is the main subject of the following sentence?
-    Sentence: "{sentence}"
-    Respond with only the subject. You must respond with only the name of the subject, and nothing else.
-    '''
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a subject extraction system."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        with llm_call("extract_subject") as record:
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=_extract_subject_messages(sentence)
+            )
+            record(response)
         return response.choices[0].message.content
     except (openai.APIError) as e:
         print(f"Error extracting subject: {e}")
         return ""
 
+async def extract_subject_async(sentence: str, client: openai.AsyncOpenAI) -> str:
+    """
+    Extracts the main subject from a sentence without blocking the event loop.
+    """
+    try:
+        with llm_call("extract_subject") as record:
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=_extract_subject_messages(sentence)
+            )
+            record(response)
+        return response.choices[0].message.content
+    except (openai.APIError) as e:
+        print(f"Error extracting subject: {e}")
+        return ""
+
+async def preprocess_fused_async(sentence: str, k: int, client: openai.AsyncOpenAI) -> Optional[FusedPreprocess]:
+    """
+    Classifies the sentence, extracts its subject and up to k triplets in a single call.
+    Returns None when the call fails or the JSON does not match the schema, so callers
+    can fall back to the per-function path.
+    """
+    try:
+        with llm_call("preprocess_fused") as record:
+            response = await client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=_fused_messages(sentence, k)
+            )
+            record(response)
+        result = FusedPreprocess.model_validate_json(response.choices[0].message.content)
+    except (openai.APIError, ValidationError) as e:
+        print(f"Error in fused preprocessing, falling back: {e}")
+        return None
+    result.subject = result.subject.strip()
+    result.triplets = result.triplets[:k]
+    if result.is_claim and not result.subject:
+        # A claim without a subject gives Wikipedia nothing to search for
+        return None
+    return result
+
 
 # --- Mapping and API Functions ---
 
@@ -122,33 +265,13 @@ def load_entity_map(file_path: str) -> Dict[str, str]:
     return lookup_map
 
 def search_wikidata_property(relation_text: str) -> Optional[str]:
-    # This function now searches for only the single best property
-    url = "https://www.wikidata.org/w/api.php"
-    headers = {
-        'User-Agent': 'GeminiFactChecker/1.0 (https://example.com; user@example.com)'
-    }
-    params = {
-        "action": "wbsearchentities",
-        "format": "json",
-        "language": "en",
-        "type": "property",
-        "search": relation_text,
-        "limit": 1
-    }
-    try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("search"):
-            return data["search"][0]["id"]
-    except requests.RequestException as e:
-        print(f"API Error searching for property '{relation_text}': {e}")
-    return None
+    # Local alias table first; wbsearchentities only for phrases it can't match
+    return get_property_resolver().resolve(relation_text)
 
 def convert_triplet_to_ids(
     sentence: str,
     triplet: Dict[str, str],
-    entity_map: Dict[str, str]
+    entity_map: Union[EntityIndex, Dict[str, str]]
 ) -> Optional[Tuple[str, str, str]]:
     # This function now converts a single triplet
     subject_text = triplet.get('subject', '').lower()
@@ -156,13 +279,14 @@ def convert_triplet_to_ids(
     object_text = triplet.get('object', '').lower()
 
     subject_id = entity_map.get(subject_text)
+    if not subject_id:
+        # No point resolving the property for an entity we can't identify
+        return (subject_text, sentence)
+
     relation_id = search_wikidata_property(relation_text)
     object_id = entity_map.get(object_text)
     final_object = object_id if object_id is not None else triplet.get('object', '')
 
-    if not subject_id:
-        return (subject_text, sentence)
-    
     if subject_id and (not relation_id or not object_id):
         return (subject_text, sentence)
 
@@ -172,9 +296,8 @@ def convert_triplet_to_ids(
 
 def compute_triplets(sentence, k):
 
-    entity_file = 'data/wikidata5m_entity.txt'
-    print(f"Loading entity map from {entity_file}...")
-    entity_map = load_entity_map(entity_file)
+    # Memory-mapped alias index built once by `python entity_index.py build`
+    entity_map = get_entity_index()
 
     if not entity_map:
         print("Could not load entity lookup file. Exiting.")
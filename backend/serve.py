@@ -0,0 +1,384 @@
+"""
+Multi-process serving with the model weights and indexes shared between workers.
+
+    python serve.py run --workers 4 --port 8000
+    python serve.py bench --workers 1,2,4 --mode fork,spawn --out serving.json
+
+`uvicorn --workers N` spawns fresh interpreters, so every worker loads MiniLM and
+opens every index itself. run loads the shared assets once in a parent process,
+binds the listening socket, and forks the workers from it:
+
+    MiniLM weights         loaded in the parent and never written, so the workers
+                           share their pages copy-on-write
+    entity index,          np.load(mmap_mode="r"); one copy in the page cache
+    triple store           for all workers
+    property aliases       loaded in the parent, shared copy-on-write
+    stored document        FAISS_MMAP=1 (set by run), so flat, SQ8 and HNSW indexes
+    indexes                are mapped read-only from their files instead of copied
+
+Everything with threads, sockets or file handles is created in each worker after
+the fork: the torch thread pool (the parent never runs a forward pass, since
+OpenMP isn't fork-safe once its threads exist), the embedding batcher, the
+Wikipedia and OpenAI clients, the verdict cache's SQLite connection and its
+in-memory FAISS index (which adds the other workers' new rows from SQLite before
+each lookup), and the PDF process pool. /metrics and /stats are per worker: a
+scrape sees the worker that answered it.
+
+EMBEDDING_THREADS defaults to cpus // workers, so the workers' torch pools don't
+oversubscribe the cores. A worker that dies is replaced by a fresh fork of the
+parent.
+
+bench starts the server at each worker count, in this mode ("fork") and as plain
+`uvicorn --workers` ("spawn"), against the stub LLM and stub Wikipedia servers. It
+reports requests/sec and latency for /check_fact with the verdict cache off and the
+page cache warm, and the RSS and PSS of every server process. PSS splits shared
+pages between the processes that map them, so summed PSS is the real footprint
+while summed RSS counts shared pages once per worker. Memory figures are read from
+/proc and are Linux-only.
+
+Measured with `bench --workers 1,2,4 --mode fork,spawn` on a 1-CPU, 6 GB VM, stub
+LLM and Wikipedia at 50 ms each, 400 requests at 4 in flight per worker. The model
+was a randomly initialized copy of all-MiniLM-L6-v2's architecture (22.7M
+parameters; the hub wasn't reachable), which costs the same memory and compute.
+Per-worker figures are for the serving processes, after load:
+
+    mode   workers  req/s  p50 ms  p99 ms  RSS/worker MiB  PSS/worker MiB  total PSS MiB
+    fork   1        19.1   212     271     597             405             980
+    fork   2        25.9   291     1329    566             267             998
+    fork   4        19.5   672     6118    576             221             1295
+    spawn  1        17.7   219     409     849             839             839
+    spawn  2        18.9   388     1437    847             650             1326
+    spawn  4        19.3   802     1723    840             550             2226
+
+The fork totals include the parent (771 MiB RSS, which never serves). On four
+workers fork takes 58% of spawn's footprint, and a forked worker's PSS drops as
+more workers share the parent's pages. Throughput is CPU-bound on one core, so it
+stops scaling past two workers here; the req/s column needs a multi-core host to
+mean anything beyond that.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def preload():
+    """
+    Loads everything the workers can share and returns the app. Must not start
+    threads or open connections: the workers are forked from this process.
+    """
+    import fact_checker
+    from embedder import get_embedder
+    from kg_verifier import get_kg_verifier
+    from property_index import get_property_resolver
+
+    # Weights only; the warm-up encode runs in each worker's lifespan
+    get_embedder().model
+    get_kg_verifier()
+    get_property_resolver()
+    return fact_checker.app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    import uvicorn
+    from embedder import get_embedder
+
+    # uvicorn installs its own handlers; the parent's would forward signals back to the workers
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    get_embedder().after_fork()
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info"):
+    os.environ.setdefault("EMBEDDING_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+    os.environ.setdefault("FAISS_MMAP", "1")
+    start = time.perf_counter()
+    app = preload()
+    sock = bind_socket(host, port)
+    print(f"Preloaded in {time.perf_counter() - start:.1f}s; starting {workers} workers on {host}:{port}")
+
+    children: Dict[int, float] = {}  # pid -> start time
+    stopping = False
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        fork_worker()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; starting a new one")
+        if time.monotonic() - started < 1:
+            # A worker that dies on startup would otherwise be re-forked in a tight loop
+            time.sleep(1)
+        fork_worker()
+    sock.close()
+
+
+# --- Benchmark ---
+
+def _read_smaps_rollup(pid: int) -> Dict[str, float]:
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                memory[parts[0].rstrip(":")] = int(parts[1])
+    return memory
+
+
+def process_tree_memory(root_pid: int) -> Dict:
+    """
+    RSS, PSS and shared/private MiB of root_pid and all its descendants.
+    """
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name is in parentheses and may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    tree, frontier = [root_pid], [root_pid]
+    while frontier:
+        children = [pid for pid, ppid in parents.items() if ppid in frontier]
+        tree.extend(children)
+        frontier = children
+
+    processes = []
+    for pid in tree:
+        try:
+            memory = _read_smaps_rollup(pid)
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        except OSError:
+            continue
+        processes.append({
+            "pid": pid,
+            "cmdline": cmdline[:120],
+            "rss_mib": round(memory.get("Rss", 0) / 1024, 1),
+            "pss_mib": round(memory.get("Pss", 0) / 1024, 1),
+            "shared_mib": round((memory.get("Shared_Clean", 0) + memory.get("Shared_Dirty", 0)) / 1024, 1),
+            "private_mib": round((memory.get("Private_Clean", 0) + memory.get("Private_Dirty", 0)) / 1024, 1),
+        })
+    return {
+        "processes": processes,
+        "total_rss_mib": round(sum(p["rss_mib"] for p in processes), 1),
+        "total_pss_mib": round(sum(p["pss_mib"] for p in processes), 1),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 600):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"server at {base_url} not ready after {timeout}s")
+
+
+async def drive_load(base_url: str, claims: List[str], requests: int, concurrency: int) -> Dict:
+    """
+    Sends requests /check_fact calls with at most concurrency in flight. Each claim
+    gets a request number appended, so identical in-flight checks aren't coalesced.
+    """
+    import httpx
+    from bench import _summarize
+
+    latencies = []
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one(i):
+            nonlocal errors
+            sentence = f"{claims[i % len(claims)].rstrip('.')} (request {i})."
+            async with limit:
+                start = time.perf_counter()
+                response = await client.post("/check_fact", json={"sentence": sentence})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(requests / elapsed, 2),
+        "latency": _summarize(latencies),
+    }
+
+
+def benchmark(workers_levels: List[int], modes: List[str], requests: int, concurrency_per_worker: int,
+              llm_latency: float, wiki_latency: float) -> List[Dict]:
+    from bench import DEFAULT_CLAIMS
+    from stub_llm import start_stub_llm
+    from stub_wiki import start_stub_wiki
+
+    llm = start_stub_llm(latency=llm_latency)
+    wiki = start_stub_wiki(latency=wiki_latency)
+    scratch = tempfile.mkdtemp(prefix="factcheck-serve-")
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm.server_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "WIKIPEDIA_API_URL": f"http://127.0.0.1:{wiki.server_port}/w/api.php",
+        "WIKI_CACHE_DIR": os.path.join(scratch, "wikipedia"),
+        "DOC_STORE_DIR": os.path.join(scratch, "documents"),
+        "PROPERTY_CACHE_PATH": os.path.join(scratch, "properties.sqlite"),
+        # Every request should run the pipeline, not come back from the verdict cache
+        "VERDICT_CACHE": "0",
+        "WIKIDATA_PROPERTY_FALLBACK": "0",
+    }
+
+    results = []
+    for mode in modes:
+        for workers in workers_levels:
+            port = _free_port()
+            run_env = {**env, "EMBEDDING_THREADS": str(max(1, (os.cpu_count() or 1) // workers))}
+            if mode == "fork":
+                cmd = [sys.executable, "serve.py", "run", "--workers", str(workers), "--port", str(port),
+                       "--log-level", "warning"]
+            else:
+                cmd = [sys.executable, "-m", "uvicorn", "fact_checker:app", "--workers", str(workers),
+                       "--port", str(port), "--log-level", "warning"]
+            base_url = f"http://127.0.0.1:{port}"
+            start = time.perf_counter()
+            proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=run_env)
+            try:
+                _wait_ready(base_url, proc)
+                startup_seconds = time.perf_counter() - start
+                # Fills the page cache and lets every worker take a few requests before measuring
+                asyncio.run(drive_load(base_url, DEFAULT_CLAIMS, len(DEFAULT_CLAIMS) * workers * 2, workers))
+                memory_idle = process_tree_memory(proc.pid)
+                load = asyncio.run(drive_load(base_url, DEFAULT_CLAIMS, requests, concurrency_per_worker * workers))
+                memory_loaded = process_tree_memory(proc.pid)
+            finally:
+                proc.send_signal(signal.SIGINT if mode == "spawn" else signal.SIGTERM)
+                try:
+                    proc.wait(timeout=60)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            result = {
+                "mode": mode,
+                "workers": workers,
+                "startup_seconds": round(startup_seconds, 1),
+                **load,
+                "memory_after_warmup": memory_idle,
+                "memory_after_load": memory_loaded,
+            }
+            print(f"{mode} x{workers}: {load['requests_per_second']} req/s, "
+                  f"PSS {memory_loaded['total_pss_mib']} MiB, RSS {memory_loaded['total_rss_mib']} MiB",
+                  file=sys.stderr)
+            results.append(result)
+
+    baseline = {mode: next((r["requests_per_second"] for r in results if r["mode"] == mode), None) for mode in modes}
+    for result in results:
+        if baseline[result["mode"]]:
+            result["speedup"] = round(result["requests_per_second"] / baseline[result["mode"]], 2)
+    llm.shutdown()
+    wiki.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the fact checker from preloaded, forked workers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="serve with N forked workers")
+    run_parser.add_argument("--host", default="127.0.0.1")
+    run_parser.add_argument("--port", type=int, default=8000)
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    run_parser.add_argument("--log-level", default="info")
+
+    bench_parser = commands.add_parser("bench", help="measure throughput and memory per worker count")
+    bench_parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    bench_parser.add_argument("--mode", default="fork,spawn", help="fork (this server) and/or spawn (uvicorn --workers)")
+    bench_parser.add_argument("--requests", type=int, default=400)
+    bench_parser.add_argument("--concurrency-per-worker", type=int, default=4)
+    bench_parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM seconds per completion")
+    bench_parser.add_argument("--wiki-latency", type=float, default=0.05, help="stub Wikipedia seconds per request")
+    bench_parser.add_argument("--out", help="write results JSON here instead of stdout")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        serve(args.host, args.port, args.workers, args.log_level)
+    else:
+        results = benchmark([int(w) for w in args.workers.split(",")], args.mode.split(","), args.requests,
+                            args.concurrency_per_worker, args.llm_latency, args.wiki_latency)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
@@ -0,0 +1,93 @@
+"""
+Coalescing of identical in-flight work: while one caller computes the result for a
+key, everyone else asking for the same key waits for that result instead of doing
+the work again. Nothing is remembered once the call finishes; that's what the
+caches are for.
+
+SingleFlight is for blocking code running in worker threads, AsyncSingleFlight for
+coroutines on the event loop. Both return (result, shared), where shared is True
+for callers that got someone else's result, and exceptions reach every caller.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+_registry: Dict[str, "_Counters"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Counters:
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        self.counters = {"executions": 0, "coalesced": 0, "in_flight": 0}
+        with _registry_lock:
+            _registry[name] = self
+
+    def _count(self, leader: bool):
+        with self._lock:
+            self.counters["executions" if leader else "coalesced"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+class SingleFlight(_Counters):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.counters["in_flight"] += 1
+        self._count(leader)
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.counters["in_flight"] -= 1
+        return result, False
+
+
+class AsyncSingleFlight(_Counters):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+            self.counters["in_flight"] += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        self._count(leader)
+        # Shielded, so a caller that goes away doesn't cancel the work the others wait on
+        return await asyncio.shield(task), not leader
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        self.counters["in_flight"] -= 1
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller has gone away
+            task.exception()
+
+
+def stats() -> Dict[str, Dict]:
+    with _registry_lock:
+        return {name: flight.stats() for name, flight in _registry.items()}
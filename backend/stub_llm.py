@@ -0,0 +1,168 @@
+"""
+Local stand-in for the OpenAI chat completions API, for measuring pipeline latency
+without network access or API spend. Point the backend at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uvicorn fact_checker:app
+
+Answers are derived from the prompt with simple heuristics, so every stage of the
+pipeline gets a well-formed response; each call sleeps for the configured latency.
+Tests can make respond() raise StubFailure to have a call answered with an HTTP error.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+SENTENCE_RE = re.compile(r'Sentence: ["\'](.*?)["\']\s*(?:->|\n|$)', re.S)
+CLAIM_RE = re.compile(r'Claim: "(.*?)"\s*Context:\s*(.*?)\n\s*Based \*solely\*', re.S)
+NAME_RE = re.compile(r"\b(?:[A-Z][\w\-']*)(?:\s+(?:of\s+|the\s+)?[A-Z][\w\-']*)*")
+
+
+class StubFailure(Exception):
+    """
+    Raised from respond() to answer the request with an HTTP error status instead.
+    """
+
+    def __init__(self, status: int = 500):
+        super().__init__(f"stub failure {status}")
+        self.status = status
+
+
+def _guess_subject(sentence: str) -> str:
+    for match in NAME_RE.finditer(sentence):
+        name = match.group(0)
+        if name.startswith("The "):
+            name = name[4:]
+        if name and name not in ("The", "A", "An", "I"):
+            return name
+    words = sentence.split()
+    return words[0] if words else ""
+
+
+def _looks_like_claim(sentence: str) -> bool:
+    lowered = sentence.strip().lower()
+    return bool(lowered) and not lowered.endswith("?") and not lowered.startswith(("i ", "hello", "hi ", "please"))
+
+
+def _triplets(sentence: str) -> List[Dict[str, str]]:
+    subject = _guess_subject(sentence)
+    rest = sentence.split(subject, 1)[-1].strip(" .")
+    obj = re.sub(r"^(is|are|was|were|has|have)\s+(a|an|the)?\s*", "", rest)
+    return [{"subject": subject, "relation_text": "instance of", "object": obj}]
+
+
+def _verdict(claim: str, context: str) -> Dict:
+    words = [w for w in re.findall(r"\w+", claim.lower()) if len(w) > 3]
+    context_lower = context.lower()
+    if not context or not words:
+        return {"answer": "not supported", "confidence": 0, "is_false": False, "snippet": ""}
+    overlap = sum(w in context_lower for w in words) / len(words)
+    if overlap < 0.5:
+        return {"answer": "not supported", "confidence": 1, "is_false": False, "snippet": ""}
+    snippet = next((s.strip() for s in re.split(r"(?<=[.!?])\s+", context) if any(w in s.lower() for w in words)), "")
+    return {"answer": "true", "confidence": 4, "is_false": False, "snippet": snippet[:300]}
+
+
+def respond(messages: List[Dict[str, str]]) -> str:
+    """
+    Returns the assistant message content the stub would send for these messages.
+    """
+    system = " ".join(m["content"] for m in messages if m["role"] == "system")
+    user = " ".join(m["content"] for m in messages if m["role"] == "user")
+    # Prompts quote few-shot examples first; the sentence under test is the last one
+    sentences = SENTENCE_RE.findall(user)
+    sentence = sentences[-1] if sentences else user.strip()
+
+    if "fused preprocessing" in system:
+        is_claim = _looks_like_claim(sentence)
+        subject = _guess_subject(sentence) if is_claim else ""
+        return json.dumps({"is_claim": is_claim, "subject": subject, "triplets": _triplets(sentence) if is_claim else []})
+    if "claim detection" in system:
+        return json.dumps({"is_claim": _looks_like_claim(sentence)})
+    if "subject extraction" in system:
+        return _guess_subject(sentence)
+    if "knowledge graph" in system:
+        return json.dumps({"triplets": _triplets(sentence)})
+
+    claim_match = CLAIM_RE.search(user)
+    if claim_match:
+        return json.dumps(_verdict(claim_match.group(1), claim_match.group(2)))
+    return json.dumps({})
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        messages = body.get("messages", [])
+        try:
+            content = respond(messages)
+        except StubFailure as e:
+            self.send_error(e.status)
+            return
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        completion_tokens = len(content.split())
+        payload = json.dumps({
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_llm(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Starts the stub in a daemon thread and returns the server; its base URL for the
+    OpenAI client is f"http://{host}:{server.server_port}/v1".
+    """
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {"latency": latency, "jitter": jitter})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to sleep per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, in seconds")
+    args = parser.parse_args()
+
+    server = start_stub_llm(args.host, args.port, args.latency, args.jitter)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_port}/v1 (latency {args.latency}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the MediaWiki action API (the subset wiki_fetch.py uses), for
+running the Wikipedia path offline and measuring fetch latency deterministically.
+
+    WIKIPEDIA_API_URL=http://127.0.0.1:8002/w/api.php uvicorn fact_checker:app
+
+Serves canned pages from --pages (a JSON object of title -> plain text). A search for
+anything else answers with a generated page named after the query, so every subject
+gets a usable article. Each request sleeps for the configured latency.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PAGES = {
+    "Atlanta Falcons": (
+        "The Atlanta Falcons are a professional American football team based in Atlanta. "
+        "The Falcons compete in the National Football League (NFL) as a member of the NFC South division. "
+        "The team was founded on June 30, 1965, and began play in 1966.\n\n"
+        "== History ==\nThe Falcons have played their home games at Mercedes-Benz Stadium since 2017."
+    ),
+    "Georgia Institute of Technology": (
+        "The Georgia Institute of Technology, commonly referred to as Georgia Tech, is a public research "
+        "university in Atlanta, Georgia. It was established in 1885.\n\n"
+        "== Campus ==\nThe campus occupies part of Midtown Atlanta."
+    ),
+}
+REDIRECTS = {"Georgia Tech": "Georgia Institute of Technology"}
+
+
+def _generated_page(title: str) -> str:
+    sentence = f"{title} is a subject described in this generated test article. "
+    return (sentence * 20) + f"\n\n== Details ==\n{title} has further details in this section. " * 5
+
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    pages: Dict[str, str] = DEFAULT_PAGES
+
+    def _page_text(self, title: str) -> Optional[str]:
+        if title in self.pages:
+            return self.pages[title]
+        if title.startswith("Missing"):
+            return None
+        return _generated_page(title)
+
+    def _search(self, query: str, limit: int) -> List[str]:
+        words = [w for w in query.lower().split() if len(w) > 2]
+        titles = [t for t in self.pages if any(w in t.lower() for w in words)]
+        if not titles:
+            titles = [query.strip().title()]
+        return titles[:limit]
+
+    def _query(self, params: Dict[str, str]) -> Dict:
+        if params.get("list") == "search":
+            if not params.get("srsearch", "").strip():
+                # What MediaWiki answers to an empty search, e.g. for a subject the LLM couldn't extract
+                return {"error": {"code": "nosrsearch", "info": 'The "srsearch" parameter must be set.'}}
+            titles = self._search(params.get("srsearch", ""), int(params.get("srlimit", 10)))
+            return {"query": {"search": [{"ns": 0, "title": t} for t in titles]}}
+
+        props = params.get("prop", "").split("|")
+        query = {"pages": []}
+        redirects = []
+        for title in params.get("titles", "").split("|"):
+            if params.get("redirects") and title in REDIRECTS:
+                redirects.append({"from": title, "to": REDIRECTS[title]})
+                title = REDIRECTS[title]
+            text = self._page_text(title)
+            if text is None:
+                query["pages"].append({"ns": 0, "title": title, "missing": True})
+                continue
+            page = {"pageid": zlib.crc32(title.encode("utf-8")), "ns": 0, "title": title}
+            if "extracts" in props:
+                page["extract"] = text.split("\n\n==")[0] if params.get("exintro") else text
+            if "revisions" in props:
+                page["revisions"] = [{"revid": zlib.crc32(text.encode("utf-8")), "parentid": 0}]
+            query["pages"].append(page)
+        if redirects:
+            query["redirects"] = redirects
+        return {"batchcomplete": True, "query": query}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if params.get("action") == "query":
+            body = self._query(params)
+        else:
+            body = {"error": {"code": "badvalue", "info": f"Unsupported action {params.get('action')!r}"}}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_wiki(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                    pages: Optional[Dict[str, str]] = None) -> ThreadingHTTPServer:
+    """
+    Starts the stub in a daemon thread and returns the server; its API URL is
+    f"http://{host}:{server.server_port}/w/api.php".
+    """
+    attrs = {"latency": latency, "jitter": jitter, "pages": pages if pages is not None else DEFAULT_PAGES}
+    handler = type("ConfiguredStubWikiHandler", (StubWikiHandler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub MediaWiki API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds to sleep per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, in seconds")
+    parser.add_argument("--pages", help="JSON file mapping page titles to their plain text")
+    args = parser.parse_args()
+
+    pages = None
+    if args.pages:
+        with open(args.pages, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+    server = start_stub_wiki(args.host, args.port, args.latency, args.jitter, pages)
+    print(f"Stub Wikipedia listening on http://{args.host}:{server.server_port}/w/api.php (latency {args.latency}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,85 @@
+"""
+/check_fact against the stub LLM and stub Wikipedia, including the ways a check can
+fail: the client gets a failed verdict, never a 500.
+"""
+
+import asyncio
+
+import pytest
+
+import fact_checker
+import kg_verifier
+import sentence_pre
+
+CLAIM = "The Atlanta Falcons were founded in 1965."
+
+
+@pytest.fixture(params=["separate", "fused"])
+def mode(request, monkeypatch):
+    monkeypatch.setattr(fact_checker, "PREPROCESS_MODE", request.param)
+    return request.param
+
+
+def check(post, sentence=CLAIM):
+    response = post("/check_fact", {"sentence": sentence})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_claim_is_checked_against_wikipedia(post, mode):
+    response = check(post)
+    assert response["answer"] == "true"
+    assert response["tier"] == "wikipedia"
+    assert response["sources"][0]["name"] == "Atlanta Falcons"
+    assert "failed" not in response
+
+
+def test_non_claim(post, mode):
+    assert check(post, "What time does the game start?")["answer"] == "not a checkable statement"
+
+
+def test_failed_verify(post, fail_llm, mode):
+    fail_llm(lambda prompt: f'Claim: "{CLAIM}"' in prompt)
+    response = check(post)
+    assert response["failed"] is True
+    assert response["answer"] == "could not check claim"
+
+
+def test_failed_claim_check(post, fail_llm):
+    fail_llm(lambda prompt: "claim detection" in prompt)
+    response = check(post)
+    assert response["failed"] is True
+    assert response["answer"] == "could not check claim"
+
+
+def test_failed_subject_extraction(post, fail_llm):
+    # An empty subject is rejected by the Wikipedia search
+    fail_llm(lambda prompt: "subject extraction" in prompt)
+    response = check(post)
+    assert response["failed"] is True
+    assert response["answer"] == "could not retrieve Wikipedia pages"
+
+
+def test_failed_fused_call_falls_back(post, fail_llm, monkeypatch):
+    monkeypatch.setattr(fact_checker, "PREPROCESS_MODE", "fused")
+    fail_llm(lambda prompt: "fused preprocessing" in prompt)
+    response = check(post)
+    assert response["answer"] == "true"
+    assert "is_claim" in response["timings"]
+
+
+def test_coalesced_requests_are_counted(pipeline, monkeypatch):
+    monkeypatch.setattr(fact_checker, "tier_stats", kg_verifier.TierStats())
+
+    async def main():
+        request = fact_checker.CheckFactRequest(sentence=CLAIM)
+        try:
+            return await asyncio.gather(fact_checker.check_fact(request), fact_checker.check_fact(request))
+        finally:
+            await sentence_pre._async_client.close()
+            sentence_pre._async_client = None
+
+    responses = asyncio.run(main())
+    assert [bool(r.get("coalesced")) for r in responses] == [False, True]
+    stats = fact_checker.tier_stats.stats()
+    assert {tier: s["count"] for tier, s in stats.items()} == {"wikipedia": 1, "coalesced": 1}
@@ -0,0 +1,54 @@
+"""
+/check_facts and /check_facts/stream against the stub LLM and stub Wikipedia: a claim
+whose checks fail is answered as failed, and the rest of the batch still gets verdicts.
+"""
+
+import json
+
+SENTENCES = [
+    "The Atlanta Falcons were founded in 1965.",
+    "Georgia Tech is a public research university in Atlanta.",
+    "What time does the game start?",
+]
+FAILING = SENTENCES[1]
+
+
+def verifying(sentence):
+    return lambda prompt: f'Claim: "{sentence}"' in prompt
+
+
+def test_batch_answers_every_sentence(post):
+    response = post("/check_facts", {"sentences": SENTENCES})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["answer"] for r in results] == ["true", "true", "not a checkable statement"]
+    assert not any(r.get("failed") for r in results)
+
+
+def test_failed_verify_only_fails_its_own_claim(post, fail_llm):
+    fail_llm(verifying(FAILING))
+    response = post("/check_facts", {"sentences": SENTENCES})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[1]["failed"] is True
+    assert results[0]["answer"] == "true" and results[0]["tier"] == "wikipedia"
+    assert results[2]["answer"] == "not a checkable statement"
+
+
+def test_failed_verify_does_not_end_the_stream(post, fail_llm):
+    fail_llm(verifying(FAILING))
+    response = post("/check_facts/stream", {"sentences": SENTENCES})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    results = {e["index"]: e["result"] for e in events if e["event"] == "result"}
+    assert sorted(results) == [0, 1, 2]
+    assert results[1]["failed"] is True
+    assert results[0]["answer"] == "true"
+    assert events[-1]["event"] == "done"
+
+
+def test_failed_wikipedia_lookup_only_fails_its_subject(post, fail_llm):
+    # No subject means nothing to search Wikipedia for
+    fail_llm(lambda prompt: "subject extraction" in prompt and "Georgia Tech" in prompt)
+    results = post("/check_facts", {"sentences": SENTENCES}).json()["results"]
+    assert results[1]["failed"] is True
+    assert results[0]["answer"] == "true"
@@ -0,0 +1,97 @@
+"""
+Chunking invariants: StreamingChunker agrees with chunk_text however the text is
+split, chunks respect the word budget and the overlap, and Chunks round-trips
+through JSON.
+"""
+
+import json
+import random
+
+import pytest
+
+from chunking import Chunks, StreamingChunker, TextSpans, chunk_text, iter_chunk_spans
+
+MAX_WORDS = 30
+OVERLAP_WORDS = 8
+
+
+def make_text(seed):
+    """
+    Paragraphs of sentences of 1 to 20 words, with quoted and bracketed endings,
+    blank lines, and now and then a sentence longer than MAX_WORDS.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(rng.randint(1, 6)):
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            length = rng.choice([rng.randint(1, 20)] * 9 + [rng.randint(MAX_WORDS + 1, 3 * MAX_WORDS)])
+            words = [rng.choice(["alpha", "beta", "gamma", "delta", "1965", "O(n)"]) for _ in range(length)]
+            sentences.append(" ".join(words) + rng.choice([".", "!", "?", '."', ".)", ""]))
+        paragraphs.append(rng.choice([" ", "  ", "\n"]).join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def feed_split(text, rng):
+    """
+    Cuts text at random offsets (inside words and whitespace alike), with some empty pieces.
+    """
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 40))))
+    bounds = [0, *cuts, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_streaming_chunker_matches_chunk_text(seed):
+    text = make_text(seed)
+    chunker = StreamingChunker(max_words=MAX_WORDS, overlap_words=OVERLAP_WORDS)
+    spans = []
+    for piece in feed_split(text, random.Random(seed)):
+        spans.extend(chunker.feed(piece))
+    spans.extend(chunker.close())
+    assert chunker.text() == text
+    assert spans == list(iter_chunk_spans(text, MAX_WORDS, OVERLAP_WORDS))
+    assert [chunker.slice(start, end) for start, end in spans] == chunk_text(text, MAX_WORDS, OVERLAP_WORDS)
+
+
+def test_streaming_chunker_with_one_piece_per_character():
+    text = make_text(0)
+    chunker = StreamingChunker(max_words=MAX_WORDS, overlap_words=OVERLAP_WORDS)
+    spans = [span for char in text for span in chunker.feed(char)] + chunker.close()
+    assert spans == list(iter_chunk_spans(text, MAX_WORDS, OVERLAP_WORDS))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_chunks_respect_word_budget_and_overlap(seed):
+    text = make_text(seed)
+    spans = list(iter_chunk_spans(text, MAX_WORDS, OVERLAP_WORDS))
+    assert spans
+    for start, end in spans:
+        assert 1 <= len(text[start:end].split()) <= MAX_WORDS
+        assert text[start:end] == text[start:end].strip()
+    for (previous_start, previous_end), (start, end) in zip(spans, spans[1:]):
+        # Chunks move forward, and repeat at most OVERLAP_WORDS words of the previous one
+        assert previous_start < start and previous_end < end
+        assert len(text[start:previous_end].split()) <= OVERLAP_WORDS
+    # Every word of the text is in some chunk
+    covered = set()
+    for start, end in spans:
+        covered.update(range(start, end))
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+
+def test_chunks_round_trip_through_json():
+    chunks = Chunks()
+    for seed, title in enumerate(["Atlanta Falcons", "Georgia Tech", ""]):
+        text = make_text(seed)
+        chunks.add(title, TextSpans(text, list(iter_chunk_spans(text, MAX_WORDS, OVERLAP_WORDS))))
+    restored = Chunks.from_json(json.loads(json.dumps(chunks.to_json())))
+    assert len(restored) == len(chunks)
+    assert list(restored) == list(chunks)
+    assert list(restored.chunk_texts()) == list(chunks.chunk_texts())
+    assert restored.to_json() == chunks.to_json()
+
+
+def test_chunks_read_the_older_list_format():
+    restored = Chunks.from_json([{"title": "Atlanta Falcons", "text": "Founded in 1965."}])
+    assert list(restored) == [{"title": "Atlanta Falcons", "text": "Founded in 1965.", "start": 0, "end": 16}]
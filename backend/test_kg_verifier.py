@@ -0,0 +1,132 @@
+"""
+The Wikidata tier against a handful of hand-written triples: when a claim is
+settled locally, and when it has to go on to Wikipedia.
+"""
+
+import pytest
+
+import entity_index
+import fact_checker
+import kg_verifier
+import property_index
+import triple_store
+
+ENTITIES = [
+    ("Q76", "Barack Obama", "Obama"),
+    ("Q5", "human"),
+    ("Q215627", "person"),
+    ("Q18094", "Honolulu"),
+    ("Q782", "Hawaii"),
+    ("Q30", "United States"),
+    ("Q60", "New York City"),
+    ("Q6581097", "male"),
+    ("Q6581072", "female"),
+    ("Q649593", "Barack Obama Sr."),
+    # Two people share the alias "john smith"
+    ("Q1000001", "John Smith"),
+    ("Q1000002", "John Smith"),
+]
+RELATIONS = [
+    ("P31", "instance of", "is a"),
+    ("P19", "place of birth", "born in"),
+    ("P21", "sex or gender", "gender"),
+    ("P22", "father"),
+    ("P131", "located in the administrative territorial entity"),
+    ("P279", "subclass of"),
+]
+TRIPLES = [
+    ("Q76", "P31", "Q5"),
+    ("Q5", "P279", "Q215627"),
+    ("Q76", "P19", "Q18094"),
+    ("Q18094", "P131", "Q782"),
+    ("Q782", "P131", "Q30"),
+    ("Q76", "P21", "Q6581097"),
+    ("Q76", "P22", "Q649593"),
+]
+
+
+@pytest.fixture(scope="module")
+def wikidata(tmp_path_factory):
+    data = tmp_path_factory.mktemp("wikidata")
+    (data / "entities.txt").write_text("".join("\t".join(e) + "\n" for e in ENTITIES), encoding="utf-8")
+    (data / "relations.txt").write_text("".join("\t".join(r) + "\n" for r in RELATIONS), encoding="utf-8")
+    entity_index.build_entity_index(str(data / "entities.txt"), str(data / "entity_index"))
+    triple_store.build_triple_store(TRIPLES, str(data / "triples"))
+    return data
+
+
+@pytest.fixture
+def verifier(wikidata, monkeypatch):
+    resolver = property_index.PropertyResolver(str(wikidata / "relations.txt"), network_fallback=False)
+    # convert_triplet_to_ids resolves relations through the process-wide resolver
+    monkeypatch.setattr(property_index, "_property_resolver", resolver)
+    verifier = kg_verifier.KGVerifier(
+        entity_index.EntityIndex(str(wikidata / "entity_index")),
+        triple_store.TripleStore(str(wikidata / "triples")),
+        resolver,
+    )
+    monkeypatch.setattr(kg_verifier, "_kg_verifier", verifier)
+    return verifier
+
+
+def triplet(subject, relation, obj):
+    return {"subject": subject, "relation_text": relation, "object": obj}
+
+
+def answer(verifier, *triplets):
+    response = verifier.verify("claim", list(triplets))
+    return None if response is None else response["answer"]
+
+
+def test_stored_triple_is_supported(verifier):
+    assert answer(verifier, triplet("Barack Obama", "instance of", "human")) == "true"
+
+
+def test_object_is_widened_along_containment(verifier):
+    response = verifier.verify("claim", [triplet("Barack Obama", "place of birth", "Hawaii")])
+    assert response["answer"] == "true"
+    assert "Q18094, within Hawaii (Q782)" in response["snippet"]
+    assert answer(verifier, triplet("Barack Obama", "born in", "United States")) == "true"
+    assert answer(verifier, triplet("Barack Obama", "instance of", "person")) == "true"
+
+
+def test_other_place_goes_to_wikipedia(verifier):
+    # Place of birth has one value, but a different stored place may be a granularity mismatch
+    assert answer(verifier, triplet("Barack Obama", "place of birth", "New York City")) is None
+
+
+def test_functional_relation_is_contradicted(verifier):
+    response = verifier.verify("claim", [triplet("Barack Obama", "sex or gender", "female")])
+    assert response["answer"] == "false"
+    assert "Q6581097" in response["snippet"]
+
+
+def test_contradiction_wins_over_support(verifier):
+    assert answer(
+        verifier, triplet("Barack Obama", "instance of", "human"), triplet("Barack Obama", "gender", "female")
+    ) == "false"
+
+
+def test_partly_supported_claim_goes_to_wikipedia(verifier):
+    assert answer(
+        verifier, triplet("Barack Obama", "instance of", "human"), triplet("Barack Obama", "place of birth", "New York City")
+    ) is None
+
+
+def test_fuzzy_relation_does_not_contradict(verifier):
+    # "sex of gender" only matches "sex or gender" fuzzily
+    assert answer(verifier, triplet("Barack Obama", "sex of gender", "female")) is None
+    assert verifier.stats()["inexact_relation"] == 1
+
+
+def test_ambiguous_alias_does_not_contradict(verifier):
+    assert answer(verifier, triplet("Barack Obama", "father", "John Smith")) is None
+    assert verifier.stats()["ambiguous"] == 1
+
+
+@pytest.mark.parametrize("mode", ["fused", "separate"])
+def test_check_fact_is_answered_by_wikidata(post, verifier, monkeypatch, mode):
+    monkeypatch.setattr(fact_checker, "PREPROCESS_MODE", mode)
+    response = post("/check_fact", {"sentence": "Barack Obama is a human."}).json()
+    assert response["tier"] == "wikidata"
+    assert response["answer"] == "true"
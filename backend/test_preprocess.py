@@ -0,0 +1,114 @@
+"""
+Fused vs separate preprocessing, run against the stub LLM (stub_llm.py):
+
+    python -m pytest -q test_preprocess.py
+"""
+
+import asyncio
+import json
+
+import openai
+import pytest
+
+import fact_checker
+import sentence_pre
+import stub_llm
+
+CLAIM = "Barack Obama is a human."
+NOT_A_CLAIM = "Is Barack Obama a human?"
+K = 3
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = stub_llm.start_stub_llm()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def run(stub_url, check):
+    """
+    Runs check(client) on a fresh event loop, with an AsyncOpenAI client opened on that
+    loop and installed as the process-wide one. A client shared between asyncio.run
+    calls would keep connections bound to a closed loop.
+    """
+    async def main():
+        async with openai.AsyncOpenAI(base_url=stub_url, api_key="stub", max_retries=0) as client:
+            previous, sentence_pre._async_client = sentence_pre._async_client, client
+            try:
+                return await check(client)
+            finally:
+                sentence_pre._async_client = previous
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def fused_reply(monkeypatch):
+    """
+    Replaces the stub's answer to the fused prompt with the given content.
+    """
+    def install(content):
+        respond = stub_llm.respond
+
+        def patched(messages):
+            if any("fused preprocessing" in m["content"] for m in messages if m["role"] == "system"):
+                return content
+            return respond(messages)
+
+        monkeypatch.setattr(stub_llm, "respond", patched)
+
+    return install
+
+
+@pytest.mark.parametrize("sentence", [CLAIM, NOT_A_CLAIM])
+def test_fused_preprocessing_matches_separate_calls(stub_url, sentence):
+    async def check(client):
+        fused = await sentence_pre.preprocess_fused_async(sentence, K, client)
+        claim, subject = await asyncio.gather(
+            sentence_pre.is_claim_async(sentence, client), sentence_pre.extract_subject_async(sentence, client)
+        )
+        return fused, claim, subject
+
+    fused, claim, subject = run(stub_url, check)
+    triplets = sentence_pre.extract_k_text_triplets(
+        sentence, K, openai.OpenAI(base_url=stub_url, api_key="stub", max_retries=0)
+    )
+    assert fused.is_claim == claim
+    if claim:
+        assert fused.subject == subject.strip()
+        assert [t.model_dump() for t in fused.triplets] == triplets[:K]
+    else:
+        assert fused.triplets == []
+
+
+def test_non_claim_gets_the_same_answer_in_both_modes(stub_url):
+    async def check(client):
+        fused = await fact_checker.check_fact_fused(NOT_A_CLAIM, K, client, {})
+        separate = await fact_checker.check_fact_separate(NOT_A_CLAIM, K, client, {})
+        return fused, separate
+
+    fused, separate = run(stub_url, check)
+    assert fused == separate == fact_checker.empty_response("not a checkable statement")
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    json.dumps({"subject": "Barack Obama", "triplets": []}),
+    json.dumps({"is_claim": True, "subject": "Barack Obama", "triplets": [{"subject": "Barack Obama"}]}),
+    json.dumps({"is_claim": True, "subject": "  ", "triplets": []}),
+], ids=["malformed-json", "missing-is-claim", "incomplete-triplet", "claim-without-subject"])
+def test_unusable_fused_reply_falls_back_to_separate(stub_url, fused_reply, content):
+    fused_reply(content)
+
+    async def check(client):
+        timings = {}
+        preprocessed = await sentence_pre.preprocess_fused_async(CLAIM, K, client)
+        response = await fact_checker.check_fact_fused(CLAIM, K, client, timings)
+        return preprocessed, response, timings
+
+    preprocessed, response, timings = run(stub_url, check)
+    assert preprocessed is None
+    # None sends /check_fact down the separate path
+    assert response is None
+    assert list(timings) == ["preprocess"]
@@ -0,0 +1,31 @@
+"""
+PropertyResolver's lookup order and the counters /stats reports for it.
+"""
+
+import pytest
+
+import property_index
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    relations = tmp_path / "relations.txt"
+    relations.write_text("P19\tplace of birth\tborn in\nP21\tsex or gender\tgender\n", encoding="utf-8")
+    return property_index.PropertyResolver(str(relations), network_fallback=False,
+                                           cache_path=str(tmp_path / "properties.sqlite"))
+
+
+def test_every_lookup_is_counted(resolver):
+    assert resolver.resolve("was born in") == "P19"
+    # Fuzzy matches are memoized; the repeat is still a fuzzy answer
+    assert resolver.resolve("sex of gender") == "P21"
+    assert resolver.resolve("sex of gender") == "P21"
+    assert resolver.resolve("favourite colour") is None
+    stats = resolver.stats()
+    assert (stats["exact"], stats["fuzzy"], stats["cache"], stats["network"], stats["miss"]) == (1, 2, 0, 0, 1)
+
+
+def test_exact_ignores_fuzzy_matches(resolver):
+    assert resolver.exact("Born in") == "P19"
+    assert resolver.exact("sex of gender") is None
+    assert resolver.resolve("sex of gender") == "P21"
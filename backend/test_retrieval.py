@@ -0,0 +1,80 @@
+"""
+LazyEmbeddings: chunks embedded on demand are written back into embeddings.npy in
+place, and processes sharing the file keep each other's rows.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import embedder
+from conftest import HashingModel
+from retrieval import LazyEmbeddings
+
+CHUNKS = [
+    "The Atlanta Falcons were founded in 1965.",
+    "Georgia Tech is a public research university in Atlanta.",
+    "Mergesort runs in O(n log n) time.",
+    "Honolulu is the capital of Hawaii.",
+]
+
+
+@pytest.fixture(scope="module")
+def service():
+    service = embedder.EmbeddingService(model_name="hashing-test", max_wait_ms=0)
+    service._model = HashingModel()
+    return service
+
+
+@pytest.fixture
+def directory(tmp_path, service):
+    LazyEmbeddings(CHUNKS, service).save(str(tmp_path))
+    return str(tmp_path)
+
+
+def stored(directory):
+    return np.load(os.path.join(directory, "embeddings.npy"))
+
+
+def test_new_rows_are_written_in_place(directory, service):
+    path = os.path.join(directory, "embeddings.npy")
+    inode = os.stat(path).st_ino
+    embeddings = LazyEmbeddings.load(directory, CHUNKS, service)
+    vectors = embeddings.rows([2, 0])
+    assert np.allclose(vectors, service.encode([CHUNKS[2], CHUNKS[0]]))
+    assert os.stat(path).st_ino == inode
+    assert stored(directory).any(axis=1).tolist() == [True, False, True, False]
+    # The loaded vectors are still the file's, not a copy in memory
+    assert isinstance(embeddings.vectors, np.memmap)
+
+
+def test_processes_sharing_the_file_keep_each_others_rows(directory, service):
+    first = LazyEmbeddings.load(directory, CHUNKS, service)
+    second = LazyEmbeddings.load(directory, CHUNKS, service)
+    first.rows([0])
+    second.rows([3])
+    first.rows([1])
+    assert stored(directory).any(axis=1).tolist() == [True, True, False, True]
+    assert LazyEmbeddings.load(directory, CHUNKS, service).num_embedded == 3
+
+
+def test_rows_of_an_evicted_entry_are_kept_in_memory(directory, service):
+    embeddings = LazyEmbeddings.load(directory, CHUNKS, service)
+    shutil.rmtree(directory)
+    assert np.allclose(embeddings.rows([1]), service.encode([CHUNKS[1]]))
+    assert embeddings.num_embedded == 1
+
+
+def test_saved_index_keeps_writing_to_its_new_directory(tmp_path, service):
+    embeddings = LazyEmbeddings(CHUNKS, service)
+    embeddings.rows([0])
+    (tmp_path / "first").mkdir()
+    embeddings.save(str(tmp_path / "first"))
+    embeddings.rows([1])
+    shutil.copytree(tmp_path / "first", tmp_path / "second")
+    embeddings.directory = str(tmp_path / "second")
+    embeddings.rows([2])
+    assert stored(str(tmp_path / "first")).any(axis=1).tolist() == [True, True, False, False]
+    assert stored(str(tmp_path / "second")).any(axis=1).tolist() == [True, True, True, False]
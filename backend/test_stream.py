@@ -0,0 +1,63 @@
+"""
+Streaming PDF endpoints: the upload's spool file is removed however the stream ends,
+including when the client goes away before the body starts.
+"""
+
+import asyncio
+import glob
+import io
+import json
+import os
+
+import pytest
+from fastapi import UploadFile
+
+import doc_store
+import fact_checker
+
+
+def spool_files():
+    return glob.glob(os.path.join(doc_store.get_doc_store().store_dir, "*.pdf"))
+
+
+def test_unreadable_pdf_ends_the_stream_and_removes_the_spool(pipeline):
+    async def main():
+        response = await fact_checker.check_fact_with_pdf_stream(
+            sentence="Mergesort runs in O(n log n) time.", file=UploadFile(io.BytesIO(b"not a pdf"), filename="x.pdf")
+        )
+        return [json.loads(chunk) async for chunk in response.body_iterator], response
+
+    events, response = asyncio.run(main())
+    asyncio.run(response.background())
+    assert [e["event"] for e in events] == ["error", "result"]
+    assert events[-1]["result"]["answer"] == "could not read PDF"
+    assert spool_files() == []
+
+
+@pytest.mark.parametrize("started", [False, True], ids=["before-body", "mid-ingest"])
+def test_client_gone(pipeline, fail_llm, started):
+    calls = []
+    fail_llm(lambda prompt: calls.append(prompt) and False)
+
+    async def main():
+        response = await fact_checker.check_fact_with_pdf_stream(
+            sentence="Mergesort runs in O(n log n) time.", file=UploadFile(io.BytesIO(b"%PDF-1.4"), filename="x.pdf")
+        )
+        assert len(spool_files()) == 1
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # A send that suspends lets the disconnect cancel the response before its body starts
+            if not started:
+                await asyncio.sleep(0)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.3"}}, receive, send)
+        # Lets an abandoned ingest finish and a claim check, had one started, reach the stub
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert spool_files() == []
+    if not started:
+        assert calls == []
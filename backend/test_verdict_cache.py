@@ -0,0 +1,88 @@
+"""
+The verdict cache's SQLite table and FAISS index, with the hashing stand-in for the
+embedding model.
+"""
+
+import sqlite3
+
+import pytest
+
+import embedder
+import verdict_cache
+from conftest import HashingModel
+
+CLAIM = "The Atlanta Falcons were founded in 1965."
+REPHRASED = "Atlanta Falcons were founded in 1965"
+VERDICT = {"answer": "true", "confidence": 5, "is_false": False, "sources": [], "snippet": ""}
+
+
+def service(model_name="hashing-test", dimension=256):
+    service = embedder.EmbeddingService(model_name=model_name, max_wait_ms=0)
+    service._model = HashingModel()
+    service._model.dimension = dimension
+    return service
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "verdicts.sqlite")
+
+
+def open_cache(path, embedding_service=None):
+    # The hashing vectors of CLAIM and REPHRASED have a cosine similarity of about 0.93
+    return verdict_cache.VerdictCache(path, embedding_service or service(), similarity_threshold=0.9)
+
+
+def test_similar_claim_is_a_hit(path):
+    cache = open_cache(path)
+    cache.store(CLAIM, "web", VERDICT)
+    assert cache.lookup(REPHRASED, "web")["cache_match"] == "similar"
+    assert cache.lookup("The Atlanta Falcons were founded in 1966.", "web") is None
+
+
+@pytest.mark.parametrize("model_name, dimension", [("hashing-test", 256), ("hashing-other", 128)])
+def test_entries_from_another_model_are_reembedded(path, model_name, dimension):
+    open_cache(path, service("hashing-old", 64)).store(CLAIM, "web", VERDICT)
+    cache = open_cache(path, service(model_name, dimension))
+    assert cache.stats()["reembedded"] == 1
+    assert cache.lookup(REPHRASED, "web")["cache_match"] == "similar"
+    # The new vectors were written back, so the next process doesn't embed them again
+    assert open_cache(path, service(model_name, dimension)).stats()["reembedded"] == 0
+
+
+def test_table_without_model_column_is_migrated(path):
+    open_cache(path, service(dimension=64)).store(CLAIM, "web", VERDICT)
+    db = sqlite3.connect(path)
+    db.execute("ALTER TABLE verdicts DROP COLUMN model")
+    db.commit()
+    db.close()
+    # Rows from before the column existed are taken to be from the fp32 model of the same name
+    cache = open_cache(path, service(dimension=64))
+    assert cache.stats()["reembedded"] == 0
+    assert cache.lookup(REPHRASED, "web")["cache_match"] == "similar"
+    # ...unless the vectors don't even have the model's dimension
+    assert open_cache(path, service()).stats()["reembedded"] == 1
+
+
+def test_verdicts_stored_by_another_worker_are_found_by_similarity(path):
+    first, second = open_cache(path), open_cache(path)
+    first.store(CLAIM, "web", VERDICT)
+    assert second.lookup(REPHRASED, "web")["cache_match"] == "similar"
+    second.store("Georgia Tech is a public research university in Atlanta.", "web", VERDICT)
+    assert first.lookup("Georgia Tech is public research university in Atlanta", "web")["cache_match"] == "similar"
+    assert first.stats()["entries"] == second.stats()["entries"] == 2
+
+
+def test_verdicts_another_worker_replaced_or_evicted_are_forgotten(path):
+    first, second = open_cache(path), open_cache(path)
+    first.store(CLAIM, "web", VERDICT)
+    assert second.lookup(REPHRASED, "web") is not None
+    # Storing the claim again gives it a new row id
+    first.store(CLAIM, "web", {**VERDICT, "answer": "false"})
+    assert second.lookup(REPHRASED, "web")["answer"] == "false"
+    db = sqlite3.connect(path)
+    db.execute("DELETE FROM verdicts")
+    db.commit()
+    db.close()
+    assert second.lookup(REPHRASED, "web") is None
+    assert second.stats()["entries"] == 0
@@ -0,0 +1,210 @@
+"""
+Columnar, memory-mapped store of Wikidata5M (head, relation, tail) triples.
+
+Entity and relation ids are dictionary-encoded: entities.npy and relations.npy hold
+the sorted numeric parts of every "Q..." / "P..." id, and a triple is stored as three
+int32 codes into those vocabularies. The heads/rels/tails columns are sorted by
+(head, relation, tail), so every query is a few binary searches over mmap'd arrays:
+
+    exact membership   contains("Q42", "P31", "Q5")
+    tails for (h, r)   tails_for("Q42", "P31")
+    edges of h         edges("Q42")
+
+    python triple_store.py build data/triple_store data/wikidata5m_transductive_*.txt
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+
+DEFAULT_STORE_DIR = "data/triple_store"
+WIKIDATA5M_FILES = [
+    "wikidata5m_transductive_train.txt",
+    "wikidata5m_transductive_valid.txt",
+    "wikidata5m_transductive_test.txt",
+]
+
+
+def _id_number(item_id: str, prefix: str) -> int:
+    if not item_id.startswith(prefix) or not item_id[1:].isdigit():
+        raise ValueError(f"Unexpected Wikidata id {item_id!r}, expected {prefix}<number>")
+    return int(item_id[1:])
+
+
+def build_triple_store(triples: Iterable[Tuple[str, str, str]], out_dir: str) -> Dict:
+    """
+    Encodes, sorts and de-duplicates (h, r, t) id triples and writes the store to out_dir.
+    """
+    start = time.perf_counter()
+    heads, rels, tails = array("I"), array("I"), array("I")
+    for h, r, t in triples:
+        heads.append(_id_number(h, "Q"))
+        rels.append(_id_number(r, "P"))
+        tails.append(_id_number(t, "Q"))
+
+    heads_np = np.frombuffer(heads, dtype=np.uint32)
+    rels_np = np.frombuffer(rels, dtype=np.uint32)
+    tails_np = np.frombuffer(tails, dtype=np.uint32)
+
+    entities = np.unique(np.concatenate([heads_np, tails_np]))
+    relations = np.unique(rels_np)
+    h_codes = np.searchsorted(entities, heads_np).astype(np.int32)
+    r_codes = np.searchsorted(relations, rels_np).astype(np.int32)
+    t_codes = np.searchsorted(entities, tails_np).astype(np.int32)
+    del heads, rels, tails, heads_np, rels_np, tails_np
+
+    order = np.lexsort((t_codes, r_codes, h_codes))
+    h_codes, r_codes, t_codes = h_codes[order], r_codes[order], t_codes[order]
+    # The source files overlap, so drop repeated triples (sorted, so repeats are adjacent)
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (h_codes[1:] != h_codes[:-1]) | (r_codes[1:] != r_codes[:-1]) | (t_codes[1:] != t_codes[:-1])
+    del order
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "entities.npy"), entities)
+    np.save(os.path.join(out_dir, "relations.npy"), relations)
+    np.save(os.path.join(out_dir, "heads.npy"), h_codes[keep])
+    np.save(os.path.join(out_dir, "rels.npy"), r_codes[keep])
+    np.save(os.path.join(out_dir, "tails.npy"), t_codes[keep])
+    meta = {
+        "triples": int(keep.sum()),
+        "entities": int(len(entities)),
+        "relations": int(len(relations)),
+        "build_seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def iter_triple_files(files: Iterable[str]) -> Iterable[Tuple[str, str, str]]:
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                h, r, t = line.strip().split()
+                yield h, r, t
+
+
+class TripleStore:
+    """
+    Read-only view over a store written by build_triple_store(). Ids in and out are
+    the usual "Q..." / "P..." strings; unknown ids simply match nothing.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        # Changes whenever the store is rebuilt; lets dependent caches notice new data
+        self.version = str(int(os.path.getmtime(os.path.join(store_dir, "meta.json"))))
+        # Plain ndarray views over the mapping; np.memmap slices are noticeably slower to search
+        load = lambda name: np.asarray(np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r"))
+        self.entities = load("entities")
+        self.relations = load("relations")
+        self.heads = load("heads")
+        self.rels = load("rels")
+        self.tails = load("tails")
+
+    def __len__(self) -> int:
+        return len(self.heads)
+
+    @staticmethod
+    def _code(vocab: np.ndarray, item_id: str, prefix: str) -> Optional[int]:
+        if not item_id or item_id[0] != prefix or not item_id[1:].isdigit():
+            return None
+        number = int(item_id[1:])
+        if number >= 2**32:
+            return None
+        # A scalar of the array's own dtype; a Python int makes searchsorted copy the array
+        i = int(vocab.searchsorted(np.uint32(number)))
+        if i < len(vocab) and vocab[i] == number:
+            return i
+        return None
+
+    def _range(self, column: np.ndarray, lo: int, hi: int, code: int) -> Tuple[int, int]:
+        # column[lo:hi] is sorted within the enclosing range, so two searches bound the run
+        # [code, code + 1) found with one vectorized search
+        start, end = column[lo:hi].searchsorted(np.array([code, code + 1], dtype=column.dtype))
+        return lo + int(start), lo + int(end)
+
+    def _head_range(self, h: str) -> Optional[Tuple[int, int]]:
+        h_code = self._code(self.entities, h, "Q")
+        if h_code is None:
+            return None
+        lo, hi = self._range(self.heads, 0, len(self.heads), h_code)
+        return (lo, hi) if lo < hi else None
+
+    def _head_relation_range(self, h: str, r: str) -> Optional[Tuple[int, int]]:
+        head_range = self._head_range(h)
+        r_code = self._code(self.relations, r, "P")
+        if head_range is None or r_code is None:
+            return None
+        lo, hi = self._range(self.rels, head_range[0], head_range[1], r_code)
+        return (lo, hi) if lo < hi else None
+
+    def contains(self, h: str, r: str, t: str) -> bool:
+        rng = self._head_relation_range(h, r)
+        t_code = self._code(self.entities, t, "Q")
+        if rng is None or t_code is None:
+            return False
+        lo, hi = self._range(self.tails, rng[0], rng[1], t_code)
+        return lo < hi
+
+    def tails_for(self, h: str, r: str) -> List[str]:
+        rng = self._head_relation_range(h, r)
+        if rng is None:
+            return []
+        return [f"Q{n}" for n in self.entities[np.asarray(self.tails[rng[0]:rng[1]])]]
+
+    def edges(self, h: str) -> List[Tuple[str, str]]:
+        """
+        Returns every (relation, tail) pair with h as the head.
+        """
+        rng = self._head_range(h)
+        if rng is None:
+            return []
+        rels = self.relations[np.asarray(self.rels[rng[0]:rng[1]])]
+        tails = self.entities[np.asarray(self.tails[rng[0]:rng[1]])]
+        return [(f"P{r}", f"Q{t}") for r, t in zip(rels.tolist(), tails.tolist())]
+
+    def __contains__(self, triple: Tuple[str, str, str]) -> bool:
+        return self.contains(*triple)
+
+
+_triple_store = None
+_triple_store_lock = threading.Lock()
+
+
+def get_triple_store() -> Optional[TripleStore]:
+    """
+    Returns the process-wide TripleStore from TRIPLE_STORE_DIR, or None if it hasn't
+    been built yet.
+    """
+    global _triple_store
+    if _triple_store is None:
+        with _triple_store_lock:
+            if _triple_store is None:
+                store_dir = os.getenv("TRIPLE_STORE_DIR", DEFAULT_STORE_DIR)
+                if not os.path.exists(os.path.join(store_dir, "meta.json")):
+                    print(f"Error: triple store not found at {store_dir}; run `python triple_store.py build`")
+                    return None
+                _triple_store = TripleStore(store_dir)
+    return _triple_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Wikidata5M triple store.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("store_dir", nargs="?", default=DEFAULT_STORE_DIR)
+    parser.add_argument("files", nargs="*", default=[os.path.join("data", name) for name in WIKIDATA5M_FILES])
+    args = parser.parse_args()
+
+    print(json.dumps(build_triple_store(iter_triple_files(args.files), args.store_dir), indent=2))
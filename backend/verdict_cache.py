@@ -0,0 +1,349 @@
+"""
+Cache of fact-check verdicts, so a claim that was checked before (or one phrased
+almost the same way) is answered without the LLM calls and retrieval.
+
+Entries live in a SQLite table, keyed by normalized sentence and source ("web" for
+/check_fact, "document:<id>" for document checks), so every worker process shares
+them. Near-duplicates are found with an inner-product FAISS index over the cached
+claim embeddings; a near match also has to agree on every number and negation
+word, since "founded in 1965" and "founded in 1966" embed almost identically.
+Each process keeps its own FAISS index and, before every lookup, adds the rows
+other workers inserted since it last looked (ids above the highest one it has
+seen), so their verdicts are found as near-duplicates too. Rows they deleted are
+dropped from the index when a search turns them up.
+
+Each entry also records the embedding model id it was embedded with; entries from
+another model or backend are re-embedded when they are indexed, since their
+vectors can't be compared with this model's (or may not even have its dimension).
+
+Each verdict records the versions of what it was derived from (Wikipedia revision
+ids, the triple store build); when one of them has changed the entry is dropped.
+Revisions are compared with what the local Wikipedia cache holds, which only moves
+when a cache miss or a stale page refetches the article, and a verdict-cache hit
+never gets that far; so an edit to an article is mostly caught by the TTL, and
+VERDICT_CACHE_TTL is the real bound on how stale a Wikipedia verdict can be.
+Responses marked "failed" (an LLM outage standing in for a verdict) are never stored.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from embedder import EmbeddingService, get_embedder
+
+# --- Configuration ---
+load_dotenv()
+
+NEGATIONS = {"not", "no", "never", "none", "nor", "neither", "without", "isn't", "wasn't", "aren't", "weren't",
+             "doesn't", "didn't", "don't", "cannot", "can't", "won't"}
+# Fields of a response that describe one particular request rather than the verdict
+PER_REQUEST_FIELDS = ("timings", "cached", "cache_match", "cache_similarity")
+
+
+def normalize_sentence(sentence: str) -> str:
+    return " ".join(sentence.lower().split()).rstrip(".!?;: ")
+
+
+def _guard_tokens(normalized: str) -> str:
+    """
+    Numbers and negations in a claim; near-duplicates must match on these exactly.
+    """
+    tokens = re.findall(r"[\w']+", normalized)
+    return " ".join(sorted(t for t in tokens if t in NEGATIONS or any(c.isdigit() for c in t)))
+
+
+def _entry_key(normalized: str, source: str) -> str:
+    return hashlib.sha1(f"{source}|{normalized}".encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    def __init__(self, path: str, embedder: EmbeddingService, similarity_threshold: float = 0.95,
+                 ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 50000,
+                 validate: Optional[Callable[[Dict[str, str]], bool]] = None):
+        self.path = path
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.validate = validate
+        self._lock = threading.RLock()
+        # Embeddings of recent misses, so storing the verdict doesn't embed the claim twice
+        self._recent_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stored": 0, "invalidated": 0,
+                         "expired": 0, "evicted": 0, "reembedded": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                source TEXT NOT NULL,
+                sentence TEXT NOT NULL,
+                guard TEXT NOT NULL,
+                response TEXT NOT NULL,
+                dependencies TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                model TEXT
+            )""")
+        columns = {name for _, name, *_ in self._db.execute("PRAGMA table_info(verdicts)")}
+        if "model" not in columns:
+            # Tables created before the model was recorded; those rows read as NULL
+            try:
+                self._db.execute("ALTER TABLE verdicts ADD COLUMN model TEXT")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+        self._db.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+
+        import faiss
+
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dimension))
+        self._rows: Dict[int, Tuple[str, str]] = {}  # id -> (source, guard)
+        self._load_index()
+
+    @classmethod
+    def from_env(cls, embedder: EmbeddingService, validate: Optional[Callable[[Dict[str, str]], bool]] = None) -> "VerdictCache":
+        return cls(
+            path=os.getenv("VERDICT_CACHE_PATH", "cache/verdicts.sqlite"),
+            embedder=embedder,
+            similarity_threshold=float(os.getenv("VERDICT_CACHE_THRESHOLD", 0.95)),
+            ttl_seconds=float(os.getenv("VERDICT_CACHE_TTL", 7 * 24 * 3600)),
+            max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", 50000)),
+            validate=validate,
+        )
+
+    def _load_index(self):
+        self._db.execute("DELETE FROM verdicts WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._last_seen = 0
+        self._sync()
+
+    def _sync(self):
+        """
+        Indexes the rows stored since the last call, by this process or another worker.
+        Rowids only grow while the newest row is kept, so a row stored elsewhere is
+        missed only if it reused the id of a newest row that was deleted; exact lookups
+        still find it.
+        """
+        rows = self._db.execute(
+            "SELECT id, source, sentence, guard, embedding, model FROM verdicts WHERE id > ? ORDER BY id",
+            (self._last_seen,),
+        ).fetchall()
+        if not rows:
+            return
+        self._last_seen = rows[-1][0]
+        ids, vectors, stale = [], [], []
+        for row_id, source, sentence, guard, embedding, model in rows:
+            if row_id in self._rows:
+                continue  # stored by this process
+            if self._model_matches(model) and len(embedding) == 4 * self.embedder.dimension:
+                vectors.append(np.frombuffer(embedding, dtype=np.float32))
+            else:
+                stale.append((len(ids), row_id, sentence))
+                vectors.append(None)
+            ids.append(row_id)
+            self._rows[row_id] = (source, guard)
+        if stale:
+            self._reembed(stale, vectors)
+        if ids:
+            self._index.add_with_ids(np.vstack(vectors), np.array(ids, dtype=np.int64))
+
+    def _model_matches(self, model: Optional[str]) -> bool:
+        # Rows stored before the model was recorded were embedded by the fp32 backend
+        return (model or self.embedder.model_name) == self.embedder.model_id
+
+    def _reembed(self, stale: List[Tuple[int, int, str]], vectors: List[Optional[np.ndarray]]):
+        """
+        Re-embeds the claims of rows stored with another model, filling in their slots
+        in vectors and writing the new embeddings back.
+        """
+        print(f"Re-embedding {len(stale)} cached verdicts with {self.embedder.model_id}")
+        embeddings = self.embedder.encode([normalize_sentence(sentence) for _, _, sentence in stale])
+        updates = []
+        for (position, row_id, _), embedding in zip(stale, embeddings):
+            vectors[position] = np.ascontiguousarray(embedding, dtype=np.float32)
+            updates.append((vectors[position].tobytes(), self.embedder.model_id, row_id))
+        self._db.executemany("UPDATE verdicts SET embedding = ?, model = ? WHERE id = ?", updates)
+        self.counters["reembedded"] += len(stale)
+
+    def _embed(self, normalized: str) -> np.ndarray:
+        with self._lock:
+            embedding = self._recent_embeddings.get(normalized)
+        if embedding is None:
+            embedding = self.embedder.encode_queries([normalized])[0]
+            with self._lock:
+                self._recent_embeddings[normalized] = embedding
+                while len(self._recent_embeddings) > 256:
+                    self._recent_embeddings.popitem(last=False)
+        return embedding
+
+    # The connection is shared by worker threads, so every query runs under self._lock
+
+    def _drop(self, row_ids: List[int], reason: str):
+        if not row_ids:
+            return
+        self._db.executemany("DELETE FROM verdicts WHERE id = ?", [(i,) for i in row_ids])
+        self._forget(row_ids)
+        self.counters[reason] += len(row_ids)
+
+    def _forget(self, row_ids: List[int]):
+        self._index.remove_ids(np.array(row_ids, dtype=np.int64))
+        for row_id in row_ids:
+            self._rows.pop(row_id, None)
+
+    def _fetch(self, where: str, value) -> Optional[Dict]:
+        row = self._db.execute(
+            f"SELECT id, response, dependencies, created_at FROM verdicts WHERE {where} = ?", (value,)
+        ).fetchone()
+        if row is None:
+            if where == "id":
+                # Evicted or replaced by another worker since it was indexed here
+                self._forget([value])
+            return None
+        return self._usable(row)
+
+    def _usable(self, row) -> Optional[Dict]:
+        row_id, response, dependencies, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            self._drop([row_id], "expired")
+            return None
+        if self.validate is not None and not self.validate(json.loads(dependencies)):
+            self._drop([row_id], "invalidated")
+            return None
+        self._db.execute("UPDATE verdicts SET last_used = ? WHERE id = ?", (time.time(), row_id))
+        return json.loads(response)
+
+    def lookup(self, sentence: str, source: str) -> Optional[Dict]:
+        """
+        Returns a copy of the cached verdict for sentence, or None. Hits carry
+        "cached": True and "cache_match" ("exact" or "similar").
+        """
+        normalized = normalize_sentence(sentence)
+        with self._lock:
+            response = self._fetch("key", _entry_key(normalized, source))
+            if response is not None:
+                self.counters["exact_hits"] += 1
+                return {**response, "cached": True, "cache_match": "exact"}
+            self._sync()
+            has_entries = self._index.ntotal > 0
+
+        if has_entries:
+            embedding = self._embed(normalized)
+            guard = _guard_tokens(normalized)
+            with self._lock:
+                scores, ids = self._index.search(embedding.reshape(1, -1), min(8, max(1, self._index.ntotal)))
+                for score, row_id in zip(scores[0], ids[0]):
+                    if row_id < 0 or score < self.similarity_threshold:
+                        break
+                    if self._rows.get(int(row_id)) != (source, guard):
+                        continue
+                    response = self._fetch("id", int(row_id))
+                    if response is not None:
+                        self.counters["similar_hits"] += 1
+                        return {**response, "cached": True, "cache_match": "similar",
+                                "cache_similarity": round(float(score), 3)}
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def store(self, sentence: str, source: str, response: Dict, dependencies: Optional[Dict[str, str]] = None):
+        """
+        Caches a verdict. dependencies maps what it was derived from to that thing's
+        version, e.g. {"wikipedia:Atlanta Falcons": "1234567"}. Failed responses are ignored.
+        """
+        if response.get("failed"):
+            return
+        normalized = normalize_sentence(sentence)
+        embedding = np.ascontiguousarray(self._embed(normalized), dtype=np.float32)
+        verdict = {k: v for k, v in response.items() if k not in PER_REQUEST_FIELDS}
+        now = time.time()
+        key = _entry_key(normalized, source)
+        guard = _guard_tokens(normalized)
+        with self._lock:
+            old = self._db.execute("SELECT id FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._forget([old[0]])
+            # REPLACE also covers another worker having stored the same claim meanwhile
+            cursor = self._db.execute(
+                "INSERT OR REPLACE INTO verdicts (key, source, sentence, guard, response, dependencies, embedding, created_at,"
+                " last_used, model) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, sentence, guard, json.dumps(verdict), json.dumps(dependencies or {}),
+                 embedding.tobytes(), now, now, self.embedder.model_id),
+            )
+            self._index.add_with_ids(embedding.reshape(1, -1), np.array([cursor.lastrowid], dtype=np.int64))
+            self._rows[cursor.lastrowid] = (source, guard)
+            self.counters["stored"] += 1
+            self._evict()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        if count <= self.max_entries:
+            return
+        # Drop the least recently used tenth in one go rather than one row per insert
+        excess = count - self.max_entries + max(1, self.max_entries // 10)
+        stale = [row_id for (row_id,) in self._db.execute(
+            "SELECT id FROM verdicts ORDER BY last_used LIMIT ?", (excess,))]
+        self._drop(stale, "evicted")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["similar_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": round(hits / lookups, 3) if lookups else None,
+                "entries": int(self._index.ntotal),
+            }
+
+
+def dependencies_current(dependencies: Dict[str, str]) -> bool:
+    """
+    True if every source a verdict was derived from is still at the recorded version.
+    Sources the process can't currently see (an evicted article) are assumed unchanged.
+    Wikipedia versions come from the local page cache without any network access, so
+    this only notices edits that some other request has already fetched.
+    """
+    from triple_store import get_triple_store
+    from wiki_cache import get_wiki_cache
+
+    for name, version in dependencies.items():
+        if name.startswith("wikipedia:"):
+            current = get_wiki_cache().revision_of(name[len("wikipedia:"):])
+        elif name == "wikidata":
+            store = get_triple_store()
+            current = store.version if store is not None else None
+        else:
+            continue
+        if current is not None and str(current) != version:
+            return False
+    return True
+
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """
+    Returns the process-wide VerdictCache, or None if VERDICT_CACHE=0.
+    """
+    global _verdict_cache
+    if os.getenv("VERDICT_CACHE", "1") != "1":
+        return None
+    if _verdict_cache is None:
+        with _verdict_cache_lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache.from_env(get_embedder(), validate=dependencies_current)
+    return _verdict_cache
@@ -0,0 +1,429 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+from dotenv import load_dotenv
+
+from chunking import Span, TextSpans, iter_chunk_spans
+from embedder import EmbeddingService, get_embedder
+from retrieval import LazyEmbeddings, RetrievalSpec
+from wiki_fetch import WikiPage, WikipediaClient, WikipediaError, get_wikipedia_client
+
+# --- Configuration ---
+load_dotenv()
+
+
+@dataclass
+class CachedArticle:
+    title: str
+    revision_id: Optional[int]
+    text: str
+    chunks: TextSpans  # spans into text
+    embeddings: LazyEmbeddings  # memory-mapped when loaded from disk; may be partial in lexical mode
+    fetched_at: float
+
+
+def _title_key(title: str) -> str:
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()[:20]
+
+
+def _write_atomic(path: str, write: Callable):
+    """
+    Writes through a temp file and renames it over path, so readers never see a partial file.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _json_bytes(obj) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+class WikiCache:
+    """
+    On-disk cache of Wikipedia articles: page text, chunks and the float32 embedding
+    matrix for each article revision, plus cached search results per subject.
+
+    Layout: <cache_dir>/pages/<title key>/{meta.json,text.txt,chunks.json,embeddings.npy}
+    chunks.json holds [start, end] character spans into text.txt. meta.json is written last, so a directory without it is an incomplete write.
+    Without embed_on_fetch (lexical retrieval) each chunk is embedded the first time it
+    is retrieved, and embeddings.npy fills in over time.
+    Entries older than the TTL are revalidated against the live revision id; when the
+    revision is unchanged the stored chunks and embeddings are reused as-is. Misses and
+    revalidations for several titles are batched into concurrent requests.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        chunker: Callable[[str], List[Span]],
+        embedder: EmbeddingService,
+        fetcher: WikipediaClient,
+        ttl_seconds: float = 24 * 3600,
+        max_bytes: int = 1024 * 2**20,
+        max_memory_entries: int = 64,
+        embed_on_fetch: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.pages_dir = os.path.join(cache_dir, "pages")
+        self.searches_path = os.path.join(cache_dir, "searches.json")
+        self.chunker = chunker
+        self.embedder = embedder
+        self.fetcher = fetcher
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        self.embed_on_fetch = embed_on_fetch
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, CachedArticle]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self._searches: Dict[str, Dict] = {}
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "refreshed": 0,
+            "evictions": 0,
+            "search_hits": 0,
+            "search_misses": 0,
+        }
+
+        os.makedirs(self.pages_dir, exist_ok=True)
+        self._scan()
+
+    @classmethod
+    def from_env(cls, chunker: Callable[[str], List[Span]], embedder: EmbeddingService,
+                 fetcher: WikipediaClient) -> "WikiCache":
+        return cls(
+            cache_dir=os.getenv("WIKI_CACHE_DIR", "cache/wikipedia"),
+            chunker=chunker,
+            embedder=embedder,
+            fetcher=fetcher,
+            ttl_seconds=float(os.getenv("WIKI_CACHE_TTL", 24 * 3600)),
+            max_bytes=int(float(os.getenv("WIKI_CACHE_MAX_MB", 1024)) * 2**20),
+            max_memory_entries=int(os.getenv("WIKI_CACHE_MEMORY_ENTRIES", 64)),
+            embed_on_fetch=not RetrievalSpec.from_env("wikipedia").lexical,
+        )
+
+    def _scan(self):
+        for key in os.listdir(self.pages_dir):
+            entry_dir = os.path.join(self.pages_dir, key)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if not os.path.exists(meta_path):
+                # Interrupted write; nothing in there can be trusted.
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            self._sizes[key] = _dir_size(entry_dir)
+            self._last_used[key] = os.path.getmtime(meta_path)
+        if os.path.exists(self.searches_path):
+            try:
+                with open(self.searches_path, "r", encoding="utf-8") as f:
+                    self._searches = json.load(f)
+            except (OSError, ValueError):
+                self._searches = {}
+
+    # --- Search results ---
+
+    def search(self, subject: str, top_k: int) -> List[str]:
+        """
+        Returns the top-k Wikipedia titles for a subject, served from cache within the TTL.
+        """
+        key = f"{subject.strip().lower()}|{top_k}"
+        with self._lock:
+            cached = self._searches.get(key)
+            if cached and time.time() - cached["fetched_at"] < self.ttl_seconds:
+                self.counters["search_hits"] += 1
+                return list(cached["titles"])
+            self.counters["search_misses"] += 1
+
+        try:
+            titles = self.fetcher.search(subject, top_k)
+        except WikipediaError:
+            if not cached:
+                raise
+            print(f"Serving stale search results for {subject}")
+            return list(cached["titles"])
+
+        with self._lock:
+            self._searches[key] = {"titles": titles, "fetched_at": time.time()}
+            snapshot = dict(self._searches)
+        _write_atomic(self.searches_path, lambda f: f.write(_json_bytes(snapshot)))
+        return titles
+
+    # --- Articles ---
+
+    def _key(self, title: str) -> str:
+        # Intro-only extracts are a different text, so they never share an entry with the full article
+        return _title_key(f"{title}#intro" if self.fetcher.intro_only else title)
+
+    def get_article(self, title: str) -> CachedArticle:
+        """
+        Returns the cached article for a title, fetching and chunking it (and embedding
+        it, with embed_on_fetch) on a miss.
+        Raises WikipediaError when the page cannot be fetched and nothing is cached.
+        """
+        article = self.get_articles([title])[title]
+        if isinstance(article, Exception):
+            raise article
+        return article
+
+    def get_articles(self, titles: List[str]) -> Dict[str, Union[CachedArticle, Exception]]:
+        """
+        Same as get_article() for several titles at once. Stale entries are revalidated
+        with one revision-id request, missing or changed pages are fetched concurrently
+        and, with embed_on_fetch, all new chunks are embedded in one encode call. Titles
+        that can't be fetched map to their exception.
+        """
+        results: Dict[str, Union[CachedArticle, Exception]] = {}
+        stale: Dict[str, Optional[CachedArticle]] = {}
+        for title in dict.fromkeys(titles):
+            key = self._key(title)
+            with self._lock:
+                article = self._memory.get(key)
+                if article is not None and self._is_fresh(article):
+                    self._memory.move_to_end(key)
+                    self._touch(key)
+                    self.counters["memory_hits"] += 1
+                    results[title] = article
+                    continue
+
+            stored = self._load(key)
+            if stored is not None and self._is_fresh(stored):
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    self._remember(key, stored)
+                    self._touch(key)
+                results[title] = stored
+            else:
+                stale[title] = stored
+
+        if not stale:
+            return results
+
+        # Checking the revision id is much cheaper than downloading the text again
+        current = {}
+        to_check = [title for title, stored in stale.items() if stored is not None and stored.revision_id is not None]
+        if to_check:
+            try:
+                current = self.fetcher.revision_ids(to_check)
+            except WikipediaError as e:
+                print(f"Could not revalidate cached articles: {e}")
+
+        to_fetch = []
+        for title, stored in stale.items():
+            if stored is not None and current.get(title) is not None and current[title] == stored.revision_id:
+                self._revalidate(self._key(title), stored)
+                results[title] = stored
+            else:
+                to_fetch.append(title)
+
+        pages = self.fetcher.fetch_pages(to_fetch) if to_fetch else {}
+        fetched: List[WikiPage] = []
+        for title in to_fetch:
+            page, stored = pages[title], stale[title]
+            if isinstance(page, Exception):
+                if stored is None:
+                    results[title] = page
+                else:
+                    # Wikipedia unreachable; a stale article beats no article.
+                    print(f"Serving stale cache entry for {title}")
+                    results[title] = stored
+            elif stored is not None and page.revision_id is not None and stored.revision_id == page.revision_id:
+                self._revalidate(self._key(title), stored)
+                results[title] = stored
+            else:
+                fetched.append(page)
+
+        for article in self._build_articles(fetched):
+            key = self._key(article.title)
+            self._store(key, article)
+            with self._lock:
+                self.counters["refreshed" if stale[article.title] is not None else "misses"] += 1
+                self._remember(key, article)
+            results[article.title] = article
+        return results
+
+    def _revalidate(self, key: str, stored: CachedArticle):
+        # Same revision as on disk; only the freshness timestamp needs updating.
+        stored.fetched_at = time.time()
+        self._write_meta(key, stored)
+        with self._lock:
+            self.counters["revalidated"] += 1
+            self._remember(key, stored)
+
+    def _build_articles(self, pages: List[WikiPage]) -> List[CachedArticle]:
+        chunks_per_page = [TextSpans(page.text, self.chunker(page.text)) for page in pages]
+        embeddings = None
+        if self.embed_on_fetch:
+            all_chunks = [chunk for chunks in chunks_per_page for chunk in chunks]
+            if all_chunks:
+                embeddings = self.embedder.encode(all_chunks)
+            else:
+                embeddings = np.zeros((0, self.embedder.dimension), dtype=np.float32)
+
+        articles = []
+        row = 0
+        for page, chunks in zip(pages, chunks_per_page):
+            vectors = embeddings[row:row + len(chunks)] if embeddings is not None else None
+            articles.append(CachedArticle(
+                title=page.title,
+                revision_id=page.revision_id,
+                text=page.text,
+                chunks=chunks,
+                embeddings=LazyEmbeddings(chunks, self.embedder, vectors),
+                fetched_at=time.time(),
+            ))
+            row += len(chunks)
+        return articles
+
+    def _is_fresh(self, article: CachedArticle) -> bool:
+        return time.time() - article.fetched_at < self.ttl_seconds
+
+    def _remember(self, key: str, article: CachedArticle):
+        self._memory[key] = article
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key: str):
+        self._last_used[key] = time.time()
+        try:
+            os.utime(os.path.join(self.pages_dir, key, "meta.json"))
+        except OSError:
+            pass
+
+    def _load(self, key: str) -> Optional[CachedArticle]:
+        entry_dir = os.path.join(self.pages_dir, key)
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(entry_dir, "text.txt"), "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(os.path.join(entry_dir, "chunks.json"), "r", encoding="utf-8") as f:
+                spans = json.load(f)
+            # Entries from before span chunking hold chunk strings; those get re-fetched
+            if spans and not isinstance(spans[0], list):
+                return None
+            # As do entries embedded by another model or backend (older entries are fp32)
+            if meta.get("model", self.embedder.model_name) != self.embedder.model_id:
+                return None
+            chunks = TextSpans(text, [tuple(span) for span in spans])
+            embeddings = LazyEmbeddings.load(entry_dir, chunks, self.embedder)
+        except (OSError, ValueError):
+            return None
+        return CachedArticle(
+            title=meta["title"],
+            revision_id=meta.get("revision_id"),
+            text=text,
+            chunks=chunks,
+            embeddings=embeddings,
+            fetched_at=meta["fetched_at"],
+        )
+
+    def revision_of(self, title: str) -> Optional[int]:
+        """
+        Returns the revision id the cache currently holds for title, without any
+        network access, or None if the article isn't cached.
+        """
+        key = self._key(title)
+        with self._lock:
+            article = self._memory.get(key)
+        if article is not None:
+            return article.revision_id
+        try:
+            with open(os.path.join(self.pages_dir, key, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f).get("revision_id")
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key: str, article: CachedArticle):
+        meta = {
+            "title": article.title,
+            "revision_id": article.revision_id,
+            "fetched_at": article.fetched_at,
+            "num_chunks": len(article.chunks),
+            "model": self.embedder.model_id,
+        }
+        meta_path = os.path.join(self.pages_dir, key, "meta.json")
+        _write_atomic(meta_path, lambda f: f.write(_json_bytes(meta)))
+
+    def _store(self, key: str, article: CachedArticle):
+        entry_dir = os.path.join(self.pages_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        _write_atomic(os.path.join(entry_dir, "text.txt"),
+                      lambda f: f.write(article.text.encode("utf-8")))
+        _write_atomic(os.path.join(entry_dir, "chunks.json"),
+                      lambda f: f.write(_json_bytes(article.chunks.spans)))
+        # Rows embedded later (lexical retrieval) are written back into the same directory
+        article.embeddings.save(entry_dir)
+        self._write_meta(key, article)
+        with self._lock:
+            self._sizes[key] = _dir_size(entry_dir)
+            self._last_used[key] = time.time()
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        for key in sorted(self._last_used, key=self._last_used.get):
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.pop(key, 0)
+            self._last_used.pop(key, None)
+            self._memory.pop(key, None)
+            shutil.rmtree(os.path.join(self.pages_dir, key), ignore_errors=True)
+            self.counters["evictions"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["revalidated"]
+            lookups = hits + self.counters["misses"] + self.counters["refreshed"]
+            return {
+                **self.counters,
+                "hit_ratio": round(hits / lookups, 3) if lookups else None,
+                "entries": len(self._sizes),
+                "memory_entries": len(self._memory),
+                "disk_mib": round(sum(self._sizes.values()) / 2**20, 1),
+                "http": self.fetcher.stats(),
+            }
+
+
+_wiki_cache = None
+_wiki_cache_lock = threading.Lock()
+
+
+def get_wiki_cache() -> WikiCache:
+    """
+    Returns the process-wide WikiCache, configured from the environment on first use.
+    """
+    global _wiki_cache
+    if _wiki_cache is None:
+        with _wiki_cache_lock:
+            if _wiki_cache is None:
+                _wiki_cache = WikiCache.from_env(
+                    chunker=lambda text: list(iter_chunk_spans(text, max_words=300, overlap_words=50)),
+                    embedder=get_embedder(),
+                    fetcher=get_wikipedia_client(),
+                )
+    return _wiki_cache
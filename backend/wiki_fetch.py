@@ -0,0 +1,205 @@
+"""
+Wikipedia fetch layer: one pooled, keep-alive httpx.AsyncClient talking to the
+MediaWiki action API, shared by every thread in the process.
+
+The client runs on its own event loop in a daemon thread, so the synchronous
+callers (WikiCache, which runs inside asyncio.to_thread workers) can fan out the
+top-k page fetches concurrently and block on the result. All requests go through
+one semaphore, which bounds the load this process puts on Wikipedia.
+
+Only plain-text extracts and revision ids are requested, never rendered HTML, and a
+revision check for a stale cache entry does not download the page text at all.
+
+WIKIPEDIA_API_URL can point at stub_wiki.py for offline runs.
+"""
+
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import httpx
+from dotenv import load_dotenv
+
+# --- Configuration ---
+load_dotenv()
+
+DEFAULT_API_URL = "https://en.wikipedia.org/w/api.php"
+USER_AGENT = "FactChecker/1.0 (arnavdantuluri@gmail.com)"
+# MediaWiki caps titles per query at 50 for normal clients
+MAX_TITLES_PER_QUERY = 50
+
+
+class WikipediaError(Exception):
+    pass
+
+
+@dataclass
+class WikiPage:
+    title: str
+    revision_id: Optional[int]
+    text: str
+
+
+class WikipediaClient:
+    def __init__(self, api_url: str = DEFAULT_API_URL, timeout: float = 10.0, max_concurrency: int = 8,
+                 max_connections: int = 16, intro_only: bool = False):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.intro_only = intro_only
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.counters = {"requests": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "WikipediaClient":
+        return cls(
+            api_url=os.getenv("WIKIPEDIA_API_URL", DEFAULT_API_URL),
+            timeout=float(os.getenv("WIKIPEDIA_TIMEOUT", 10)),
+            max_concurrency=int(os.getenv("WIKIPEDIA_MAX_CONCURRENCY", 8)),
+            max_connections=int(os.getenv("WIKIPEDIA_MAX_CONNECTIONS", 16)),
+            intro_only=os.getenv("WIKIPEDIA_INTRO_ONLY", "0") == "1",
+        )
+
+    # --- Event loop plumbing ---
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+
+    def _run(self, coro):
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="wikipedia-fetch", daemon=True).start()
+                    asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                    self._loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    async def _query(self, params: Dict) -> Dict:
+        async with self._semaphore:
+            self.counters["requests"] += 1
+            try:
+                response = await self._client.get(
+                    self.api_url, params={"action": "query", "format": "json", "formatversion": 2, **params}
+                )
+                response.raise_for_status()
+                data = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                self.counters["errors"] += 1
+                raise WikipediaError(f"Wikipedia request failed: {e}") from e
+        if "error" in data:
+            self.counters["errors"] += 1
+            raise WikipediaError(data["error"].get("info", "Wikipedia API error"))
+        return data
+
+    # --- Requests ---
+
+    async def _search(self, query: str, limit: int) -> List[str]:
+        data = await self._query({"list": "search", "srsearch": query, "srlimit": limit, "srprop": ""})
+        return [hit["title"] for hit in data.get("query", {}).get("search", [])]
+
+    async def _fetch_page(self, title: str) -> WikiPage:
+        params = {
+            "prop": "extracts|revisions",
+            "titles": title,
+            "redirects": 1,
+            "explaintext": 1,
+            "rvprop": "ids",
+        }
+        if self.intro_only:
+            params["exintro"] = 1
+        data = await self._query(params)
+        pages = data.get("query", {}).get("pages", [])
+        if not pages or pages[0].get("missing") or pages[0].get("invalid"):
+            raise WikipediaError(f"Page {title!r} does not exist")
+        page = pages[0]
+        revisions = page.get("revisions") or [{}]
+        return WikiPage(title=title, revision_id=revisions[0].get("revid"), text=page.get("extract", ""))
+
+    async def _fetch_pages(self, titles: List[str]) -> Dict[str, Union[WikiPage, Exception]]:
+        results = await asyncio.gather(*(self._fetch_page(title) for title in titles), return_exceptions=True)
+        return dict(zip(titles, results))
+
+    async def _revision_ids(self, titles: List[str]) -> Dict[str, Optional[int]]:
+        revision_ids = {}
+        for start in range(0, len(titles), MAX_TITLES_PER_QUERY):
+            batch = titles[start:start + MAX_TITLES_PER_QUERY]
+            data = await self._query({"prop": "revisions", "titles": "|".join(batch), "redirects": 1, "rvprop": "ids"})
+            query = data.get("query", {})
+            # Map the titles the API answered with back to the ones that were asked for
+            renamed = {}
+            for step in query.get("normalized", []) + query.get("redirects", []):
+                renamed[step["from"]] = step["to"]
+            by_title = {
+                page["title"]: (page.get("revisions") or [{}])[0].get("revid") for page in query.get("pages", [])
+            }
+            for title in batch:
+                resolved = title
+                while resolved in renamed:
+                    resolved = renamed[resolved]
+                revision_ids[title] = by_title.get(resolved)
+        return revision_ids
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """
+        Returns up to limit article titles for a full-text search.
+        """
+        return self._run(self._search(query, limit))
+
+    def fetch_page(self, title: str) -> WikiPage:
+        """
+        Returns the plain-text extract and current revision id of one article.
+        Raises WikipediaError if the request fails or the page doesn't exist.
+        """
+        return self._run(self._fetch_page(title))
+
+    def fetch_pages(self, titles: List[str]) -> Dict[str, Union[WikiPage, Exception]]:
+        """
+        Fetches several articles concurrently. Failed titles map to their exception
+        instead of failing the whole batch.
+        """
+        return self._run(self._fetch_pages(titles))
+
+    def revision_ids(self, titles: List[str]) -> Dict[str, Optional[int]]:
+        """
+        Returns the current revision id of each title (None if missing), without
+        downloading any page text.
+        """
+        return self._run(self._revision_ids(titles))
+
+    def stats(self) -> Dict:
+        return dict(self.counters)
+
+
+_wikipedia_client = None
+_wikipedia_client_lock = threading.Lock()
+
+
+def get_wikipedia_client() -> WikipediaClient:
+    """
+    Returns the process-wide WikipediaClient, configured from the environment on first use.
+    """
+    global _wikipedia_client
+    if _wikipedia_client is None:
+        with _wikipedia_client_lock:
+            if _wikipedia_client is None:
+                _wikipedia_client = WikipediaClient.from_env()
+    return _wikipedia_client
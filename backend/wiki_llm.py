@@ -1,169 +1,282 @@
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
-import os 
+"""
+FaissIndex: the chunks of Wikipedia articles or an uploaded document, with a FAISS
+index (or a BM25 prefilter) over their embeddings. faiss is imported when the first
+index is built, so importing this module stays cheap.
+"""
 
+import json
+import os
 
-from sentence_transformers import SentenceTransformer
-import faiss
-import wikipedia
-import textwrap
-import numpy as np
-import requests
-
-# --- Step 1: Setup
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
-dimension = 384  # embedding size for MiniLM
-index = faiss.IndexFlatIP(dimension)
-documents = []  # metadata store
-
-
-def wikidata_search(entity_name):
-    url = "https://www.wikidata.org/w/api.php"
-    params = {
-        "action": "wbsearchentities",
-        "search": entity_name,
-        "language": "en",
-        "format": "json"
-    }
-
-    headers = {
-        "User-Agent": "FactChecker/1.0 (arnavdantuluri@gmail.com)"
-    }
-
-    r = requests.get(url, params=params, headers=headers)
-
-    if r.status_code == 200:
-        try:
-            data = r.json()
-            if "search" in data and data["search"]:
-                return data["search"][0]["id"]
-        except ValueError:
-            print("Error decoding JSON")
-    return None
-
-
-
-def fetch_wikipedia_pages(subject, top_k=3):
-    """
-    Fetch top-k pages related to a subject using Wikipedia API search.
-    """
-    search_results = wikipedia.search(subject, results=top_k)
-    pages = []
-    for res in search_results:
-        try:
-            page = wikipedia.page(res, auto_suggest=False)
-            pages.append((res, page.content))
-        except Exception as e:
-            print(f"Skipping {res}: {e}")
-    return pages
-    return pages
-
-
-def chunk_text(text, chunk_size=500, overlap=50):
-    """
-    Split long text into overlapping chunks.
-    """
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i+chunk_size])
-        chunks.append(chunk)
-    return chunks
-
-
-def build_faiss_index(subject, top_k=3):
-    """
-    Pull Wikipedia docs for a subject, chunk them, and store in FAISS.
-    """
-    global documents, index
-    documents.clear()
-    index.reset()
-
-    pages = fetch_wikipedia_pages(subject, top_k=top_k)
-    all_chunks = []
-
-    for title, text in pages:
-        chunks = chunk_text(text, chunk_size=300, overlap=50)
-        for c in chunks:
-            documents.append({"title": title, "text": c})
-            all_chunks.append(c)
-
-    if all_chunks:
-        embeddings = embedder.encode(all_chunks, convert_to_numpy=True, normalize_embeddings=True)
-        index.add(embeddings)
-
-
-def query_index(claim, k=3):
-    """
-    Search the FAISS index with a claim and return top-k chunks.
-    """
-    q_emb = embedder.encode([claim], convert_to_numpy=True, normalize_embeddings=True)
-    D, I = index.search(q_emb, k)
-    return [documents[i] for i in I[0] if i < len(documents)]
-
-if __name__ == "__main__":
-    # --- Example Usage
-    from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
-import wikipedia
-import requests
 
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i+chunk_size])
-        chunks.append(chunk)
-    return chunks
+from chunking import Chunks, StreamingChunker, TextSpans, iter_chunk_spans
+from embedder import EmbeddingService, get_embedder
+from index_factory import IndexSpec, describe, make_index, read_index
+from metrics import span
+from retrieval import BM25, LazyEmbeddings, RetrievalSpec
+from wiki_cache import WikiCache, get_wiki_cache
+
 
 class FaissIndex:
-    def __init__(self):
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
-        self.dimension = 384  # embedding size for MiniLM
+    def __init__(self, embedder: EmbeddingService = None, wiki_cache: WikiCache = None, index_spec: IndexSpec = None,
+                 retrieval: RetrievalSpec = None):
+        # Shared across requests; loading MiniLM per index costs hundreds of ms.
+        self.embedder = embedder or get_embedder()
+        self.wiki_cache = wiki_cache
+        # Exact search unless told otherwise; per-request indexes are only a few dozen chunks
+        self.index_spec = index_spec or IndexSpec()
+        # Dense search over every chunk unless a lexical prefilter is configured for the source
+        self.retrieval = retrieval or RetrievalSpec()
+        self.dimension = self.embedder.dimension
+        self.reset()
+
+    def reset(self):
+        # Chunk metadata: spans into the article / document texts
+        import faiss
+
+        self.documents = Chunks()
         self.index = faiss.IndexFlatIP(self.dimension)
-        self.documents = []  # metadata store
+        self._trained = False
+        # Lexical mode only: BM25 over the chunks, and where each chunk's embedding lives
+        self._bm25 = None
+        self._chunk_rows = []  # (LazyEmbeddings, row) per document
+        self._embeddings = None  # set for indexes built from one text, which can be saved
+
+    def train(self, vectors):
+        """
+        Replaces the index with an empty one of the configured type, trained on vectors.
+        """
+        self.index = make_index(self.index_spec, self.dimension, vectors)
+        self._trained = True
+
+    def add(self, vectors):
+        """
+        Adds embeddings. The first add trains the index on its vectors, so callers
+        should add a whole corpus at once rather than batch by batch.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if not self._trained:
+            self.train(vectors)
+        self.index.add(vectors)
+
+    def build_index_from_text(self, text, title="", progress=None, batch_size=256):
+        """
+        Chunks and embeds text. If given, progress(stage, done, total) is called after
+        every batch of batch_size chunks is embedded.
+        """
+        self.reset()
+
+        chunks = TextSpans(text, list(iter_chunk_spans(text, max_words=300, overlap_words=50)))
+        self.documents.add(title, chunks)
+
+        if self.retrieval.lexical:
+            # Nothing is embedded up front; queries embed the chunks BM25 proposes
+            self._embeddings = LazyEmbeddings(chunks, self.embedder)
+            self._chunk_rows = [(self._embeddings, row) for row in range(len(chunks))]
+            self._bm25 = BM25(chunks)
+            return
+
+        batches = []
+        for start in range(0, len(chunks), batch_size):
+            end = min(start + batch_size, len(chunks))
+            with span("embed_chunks"):
+                batches.append(self.embedder.encode([chunks[row] for row in range(start, end)]))
+            if progress:
+                progress("chunks", end, len(chunks))
+        if batches:
+            self.add(np.vstack(batches))
+
+    def build_index_from_pages(self, pages, title="", progress=None, batch_size=256):
+        """
+        Same as build_index_from_text() for text that arrives in pieces (PDF pages), so
+        the first chunks are embedded while later pages are still being extracted.
+        Returns the whole text. progress("chunks", done, total) counts the chunks found
+        so far, since the total isn't known until the last page.
+        """
+        self.reset()
+
+        chunker = StreamingChunker(max_words=300, overlap_words=50)
+        spans = []
+        batches = []
+        embedded = 0
 
-    def build_index_from_text(self, text, title=""):
-        self.documents.clear()
-        self.index.reset()
+        def embed(final):
+            nonlocal embedded
+            while len(spans) - embedded >= batch_size or (final and embedded < len(spans)):
+                end = min(embedded + batch_size, len(spans))
+                with span("embed_chunks"):
+                    batches.append(self.embedder.encode([chunker.slice(*spans[row]) for row in range(embedded, end)]))
+                embedded = end
+                if progress:
+                    progress("chunks", embedded, len(spans))
 
-        chunks = chunk_text(text, chunk_size=300, overlap=50)
-        all_chunks = []
-        for c in chunks:
-            self.documents.append({"title": title, "text": c})
-            all_chunks.append(c)
+        for page in pages:
+            spans.extend(chunker.feed(page))
+            if not self.retrieval.lexical:
+                embed(final=False)
+        spans.extend(chunker.close())
 
-        if all_chunks:
-            embeddings = self.embedder.encode(all_chunks, convert_to_numpy=True, normalize_embeddings=True)
-            self.index.add(embeddings)
+        text = chunker.text()
+        chunks = TextSpans(text, spans)
+        self.documents.add(title, chunks)
+
+        if self.retrieval.lexical:
+            # Nothing is embedded up front; queries embed the chunks BM25 proposes
+            self._embeddings = LazyEmbeddings(chunks, self.embedder)
+            self._chunk_rows = [(self._embeddings, row) for row in range(len(chunks))]
+            self._bm25 = BM25(chunks)
+            return text
+
+        embed(final=True)
+        # Added once at the end, so index types that need training see every vector
+        if batches:
+            self.add(np.vstack(batches))
+        return text
 
     def build_index_from_wikipedia(self, subject, top_k=3):
-        self.documents.clear()
-        self.index.reset()
-
-        search_results = wikipedia.search(subject, results=top_k)
-        pages = []
-        for res in search_results:
-            try:
-                page = wikipedia.page(res, auto_suggest=False)
-                pages.append((res, page.content))
-            except Exception as e:
-                print(f"Skipping {res}: {e}")
-        
-        all_chunks = []
-        for title, text in pages:
-            chunks = chunk_text(text, chunk_size=300, overlap=50)
-            for c in chunks:
-                self.documents.append({"title": title, "text": c})
-                all_chunks.append(c)
-
-        if all_chunks:
-            embeddings = self.embedder.encode(all_chunks, convert_to_numpy=True, normalize_embeddings=True)
-            self.index.add(embeddings)
+        self.reset()
+
+        # Pages, chunks and embeddings come from the on-disk cache when the article was seen before
+        cache = self.wiki_cache or get_wiki_cache()
+        # All top-k pages are fetched concurrently; only misses and changed revisions hit the network
+        embeddings = []
+        with span("wikipedia_search"):
+            titles = cache.search(subject, top_k)
+        with span("wikipedia_articles"):
+            articles = cache.get_articles(titles)
+        for title, article in articles.items():
+            if isinstance(article, Exception):
+                print(f"Skipping {title}: {article}")
+                continue
+            if not article.chunks:
+                continue
+            # Shares the cached article's text rather than copying each chunk
+            self.documents.add(title, article.chunks)
+            self._chunk_rows.extend((article.embeddings, row) for row in range(len(article.chunks)))
+            if not self.retrieval.lexical:
+                # Fills in rows a lexical-mode process left unembedded
+                embeddings.append(article.embeddings.all())
+        if self.retrieval.lexical:
+            self._bm25 = BM25(self.documents.chunk_texts())
+        elif embeddings:
+            self.add(np.vstack(embeddings))
 
     def query(self, claim, k=3):
-        q_emb = self.embedder.encode([claim], convert_to_numpy=True, normalize_embeddings=True)
-        D, I = self.index.search(q_emb, k)
-        return [self.documents[i] for i in I[0] if i < len(self.documents)]
\ No newline at end of file
+        with span("embed_query"):
+            q_emb = self.embedder.encode_queries([claim])
+        return self.query_embedding(q_emb[0], k=k, claim=claim)
+
+    def query_embedding(self, q_emb, k=3, claim=None):
+        """
+        Same as query() for a claim that was already embedded, e.g. as part of a batch.
+        Lexical mode also needs the claim text.
+        """
+        q_emb = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        if self._bm25 is not None:
+            return self._query_lexical(claim, q_emb, k)
+        with span("faiss_search"):
+            D, I = self.index.search(q_emb.reshape(1, -1), k)
+        # FAISS pads missing neighbours with -1
+        return [self.documents[i] for i in I[0] if 0 <= i < len(self.documents)]
+
+    def _query_lexical(self, claim, q_emb, k):
+        if claim is None:
+            raise ValueError("lexical retrieval needs the claim text")
+        with span("bm25"):
+            rows = self._bm25.top_n(claim, self.retrieval.candidates)
+        if not rows:
+            # No words in common with the claim; the leading chunks (article intros) are the best guess
+            rows = list(range(min(self.retrieval.candidates, len(self.documents))))
+        if not rows:
+            return []
+
+        # One embed call per article for the candidates it hasn't embedded yet
+        vectors = np.empty((len(rows), self.dimension), dtype=np.float32)
+        groups = {}
+        for position, row in enumerate(rows):
+            embeddings, source_row = self._chunk_rows[row]
+            group = groups.setdefault(id(embeddings), (embeddings, [], []))
+            group[1].append(position)
+            group[2].append(source_row)
+        with span("embed_candidates"):
+            for embeddings, positions, source_rows in groups.values():
+                vectors[positions] = embeddings.rows(source_rows)
+
+        order = np.argsort(-(vectors @ q_emb))[:k]
+        return [self.documents[rows[i]] for i in order]
+
+    def describe(self):
+        if self._bm25 is not None:
+            sources = {id(embeddings): embeddings for embeddings, _ in self._chunk_rows}
+            embedded = sum(embeddings.num_embedded for embeddings in sources.values())
+            return {"type": "lexical", "candidates": self.retrieval.candidates,
+                    "ntotal": len(self.documents), "embedded": embedded}
+        return describe(self.index)
+
+    def reembed(self, batch_size=256):
+        """
+        Replaces the vectors of an index built from one text (a stored document) with
+        ones from self.embedder, for when they were computed by another model or
+        backend. A lexical index just forgets them and embeds candidates again on demand.
+        """
+        chunks = self.documents.chunk_texts()
+        if self._bm25 is not None:
+            self._embeddings = LazyEmbeddings(chunks, self.embedder)
+            self._chunk_rows = [(self._embeddings, row) for row in range(len(chunks))]
+            return
+        batches = []
+        for start in range(0, len(chunks), batch_size):
+            with span("embed_chunks"):
+                batches.append(self.embedder.encode([chunks[row] for row in range(start, min(start + batch_size, len(chunks)))]))
+        self._trained = False
+        if batches:
+            self.add(np.vstack(batches))
+
+    def save(self, path):
+        """
+        Writes the FAISS index and chunk metadata into the directory at path.
+        """
+        os.makedirs(path, exist_ok=True)
+        if self._bm25 is not None:
+            if self._embeddings is None:
+                raise ValueError("only lexical indexes built from text can be saved")
+            # Chunks embedded by later queries are written back here
+            self._embeddings.save(path)
+        else:
+            import faiss
+            faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        with open(os.path.join(path, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump(self.documents.to_json(), f)
+
+    def relocate(self, path):
+        """
+        Call after moving a directory written by save(), so chunks embedded later are
+        written back to the new place.
+        """
+        if self._embeddings is not None:
+            self._embeddings.directory = path
+
+    @classmethod
+    def load(cls, path, embedder: EmbeddingService = None, index_spec: IndexSpec = None,
+             retrieval: RetrievalSpec = None):
+        """
+        Reads an index written by save(); only queries need the embedder after this.
+        The index type (and whether it is lexical) comes from the files; index_spec only
+        sets nprobe/efSearch (and whether to mmap it) and retrieval only the number of
+        lexical candidates.
+        """
+        faiss_index = cls(embedder=embedder, index_spec=index_spec, retrieval=retrieval)
+        with open(os.path.join(path, "documents.json"), "r", encoding="utf-8") as f:
+            faiss_index.documents = Chunks.from_json(json.load(f))
+        if not os.path.exists(os.path.join(path, "index.faiss")):
+            chunks = faiss_index.documents.chunk_texts()
+            faiss_index.retrieval = RetrievalSpec("lexical", faiss_index.retrieval.candidates)
+            faiss_index._embeddings = LazyEmbeddings.load(path, chunks, faiss_index.embedder)
+            faiss_index._chunk_rows = [(faiss_index._embeddings, row) for row in range(len(chunks))]
+            faiss_index._bm25 = BM25(chunks)
+            return faiss_index
+        faiss_index.index = read_index(os.path.join(path, "index.faiss"), faiss_index.index_spec)
+        faiss_index._trained = True
+        return faiss_index
\ No newline at end of file
@@ -60,11 +60,11 @@ async function sendToBackend(text, source) {
           // Display a more detailed result
           const answer = data.answer ? data.answer.toString().toUpperCase() : "NO ANSWER";
           const snippet = data.snippet || "No specific snippet found.";
-          let resultMessage = `${answer}: ${snippet}`;
+          let resultMessage = `${escapeHtml(answer)}: ${escapeHtml(snippet)}`;
 
           if (data.sources && data.sources.length > 0) {
               const source = data.sources[0];
-              resultMessage += ` <a class="hud-link" href="${source.link}" target="_blank">(${source.name})</a>`;
+              resultMessage += ` <a class="hud-link" href="${escapeHtml(source.link)}" target="_blank">(${escapeHtml(source.name)})</a>`;
           }
 
           showHUD(resultMessage, 10000); // Show for 10 seconds
@@ -81,9 +81,125 @@ async function sendToBackend(text, source) {
   }
 }
 
-async function handleTextbookCheck(sentence) {
-  const backendUrl = "http://localhost:8000/check_fact_with_pdf";
+const BACKEND_URL = "http://localhost:8000";
+
+// The HUD renders HTML, so page text and verdicts must be escaped before they go into it;
+// a Notion page or PDF can contain markup such as <img onerror=...>.
+function escapeHtml(text) {
+  const element = document.createElement('span');
+  element.textContent = String(text);
+  return element.innerHTML.replace(/"/g, '&quot;');
+}
+
+// Reads a newline-delimited JSON response body, calling onEvent for each line as it arrives.
+async function readNdjson(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split('\n');
+      buffered = lines.pop();
+      lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+  }
+  if (buffered.trim()) onEvent(JSON.parse(buffered));
+}
+
+// Sends the page's highlights to its server-side session, which only re-checks the
+// sentences that were added or edited since the last check; the verdicts of the others
+// are carried over from the previous run.
+async function sendToSession(sessionId, sentences) {
+  const request = {
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ sentences, k: 5 })
+  };
+  if (sessionId) {
+      const response = await fetch(`${BACKEND_URL}/sessions/${sessionId}`, { ...request, method: 'PUT' });
+      // 404: the session expired on the server, so start a new one
+      if (response.status !== 404) return response;
+  }
+  return fetch(`${BACKEND_URL}/sessions`, { ...request, method: 'POST' });
+}
+
+async function checkPageHighlights() {
+  const { notionHighlights = {}, factCheckSessions = {} } = await chrome.storage.local.get(['notionHighlights', 'factCheckSessions']);
+  const pageUrl = window.location.href.split('#')[0];
+  const sentences = (notionHighlights[pageUrl] || []).map(h => h.text);
+  if (sentences.length === 0) {
+      showHUD('No highlights on this page.');
+      return;
+  }
+
+  showHUD(sentences.map(sentence => `<b>CHECKING...</b>: ${escapeHtml(sentence)}`).join('<br>'), 15000);
+  try {
+      const session = factCheckSessions[pageUrl] || {};
+      const response = await sendToSession(session.sessionId, sentences);
+      if (!response.ok) throw new Error(`Server error: ${response.status}`);
+      const delta = await response.json();
+
+      // A new session has no unchanged pairs, so stale answers are never carried over
+      const answers = new Array(sentences.length).fill("NO ANSWER");
+      const previous = delta.session_id === session.sessionId ? (session.answers || []) : [];
+      delta.unchanged.forEach(([from, to]) => { answers[to] = previous[from] || answers[to]; });
+      delta.results.forEach(({ index, result }) => {
+          answers[index] = result.answer ? result.answer.toString().toUpperCase() : "NO ANSWER";
+      });
+      factCheckSessions[pageUrl] = { sessionId: delta.session_id, answers };
+      await chrome.storage.local.set({ factCheckSessions });
+
+      showHUD(sentences.map((sentence, i) => `<b>${escapeHtml(answers[i])}</b>: ${escapeHtml(sentence)}`).join('<br>'), 15000);
+  } catch (error) {
+      console.error('Error contacting session backend:', error);
+      showHUD('Error: Could not connect to the service.');
+  }
+}
 
+// Uploads a PDF once and remembers its document id, so later checks against the
+// same textbook only send the sentence.
+async function getDocumentId(file, { forceUpload = false } = {}) {
+  const fileKey = `${file.name}:${file.size}:${file.lastModified}`;
+  const { uploadedDocuments = {} } = await chrome.storage.local.get('uploadedDocuments');
+  if (uploadedDocuments[fileKey] && !forceUpload) {
+      return uploadedDocuments[fileKey];
+  }
+
+  showHUD("Uploading PDF...");
+  const formData = new FormData();
+  formData.append("file", file);
+  const response = await fetch(`${BACKEND_URL}/documents/stream`, {
+      method: "POST",
+      body: formData,
+  });
+  if (!response.ok) throw new Error(`Server error: ${response.status}`);
+
+  let data = null;
+  await readNdjson(response, (event) => {
+      if (event.event === 'progress') {
+          const label = event.stage === 'pages' ? 'Reading pages' : 'Indexing chunks';
+          showHUD(`${label}: ${event.done}/${event.total}`);
+      } else if (event.event === 'document') {
+          data = event;
+      } else if (event.event === 'error') {
+          throw new Error(event.detail);
+      }
+  });
+  if (!data) throw new Error('Upload ended without a document id');
+  uploadedDocuments[fileKey] = data.document_id;
+  await chrome.storage.local.set({ uploadedDocuments });
+  return data.document_id;
+}
+
+async function checkAgainstDocument(sentence, documentId) {
+  return fetch(`${BACKEND_URL}/check_fact_with_document`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ sentence, document_id: documentId }),
+  });
+}
+
+async function handleTextbookCheck(sentence) {
   // Ask user to pick a PDF
   const input = document.createElement("input");
   input.type = "file";
@@ -100,17 +216,16 @@ async function handleTextbookCheck(sentence) {
               return;
           }
 
-          const formData = new FormData();
-          formData.append("sentence", sentence);
-          formData.append("file", file);
-
-          showHUD("Checking against PDF...");
-
           try {
-              const response = await fetch(backendUrl, {
-                  method: "POST",
-                  body: formData,
-              });
+              let documentId = await getDocumentId(file);
+              showHUD("Checking against PDF...");
+              let response = await checkAgainstDocument(sentence, documentId);
+
+              // The server no longer has this document (e.g. its store was cleared); upload again
+              if (response.status === 404) {
+                  documentId = await getDocumentId(file, { forceUpload: true });
+                  response = await checkAgainstDocument(sentence, documentId);
+              }
 
               if (!response.ok) throw new Error(`Server error: ${response.status}`);
 
@@ -119,7 +234,7 @@ async function handleTextbookCheck(sentence) {
 
               const answer = data.answer ? data.answer.toString().toUpperCase() : "NO ANSWER";
               const snippet = data.snippet || "No snippet found.";
-              const resultMessage = `${answer}: ${snippet}`;
+              const resultMessage = `${escapeHtml(answer)}: ${escapeHtml(snippet)}`;
 
               showHUD(resultMessage, 6000);
               resolve(data);
@@ -359,6 +474,8 @@ async function handleTextbookCheck(sentence) {
           highlightSelection();
       } else if (request.type === 'clear-highlights') {
           clearHighlights();
+      } else if (request.type === 'check-highlights') {
+          checkPageHighlights();
       }
   }
 
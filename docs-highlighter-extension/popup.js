@@ -1,6 +1,7 @@
 // popup.js - Handles the extension popup UI (REVISED)
 
 document.addEventListener('DOMContentLoaded', () => {
+  const checkPageBtn = document.getElementById('checkPage');
   const clearPageBtn = document.getElementById('clearPage');
   const clearAllBtn = document.getElementById('clearAll');
   const searchBtn = document.getElementById('searchBtn');
@@ -25,6 +26,11 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
 
+  // Handle Check Page button click
+  checkPageBtn.addEventListener('click', () => {
+    sendMessageToActiveTab({ type: 'check-highlights' });
+  });
+
   // Handle Clear Page button click
   clearPageBtn.addEventListener('click', () => {
     sendMessageToActiveTab({ type: 'clear-highlights' });